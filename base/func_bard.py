@@ -29,6 +29,11 @@ class BardAssistant:
         response = self._bard.generate_content([{'role': 'user', 'parts': [msg]}])
         return response.text
 
+    async def get_answer_async(self, msg: str, sender: str = None) -> str:
+        """asyncio 模式下使用的 get_answer，不占用线程"""
+        response = await self._bard.generate_content_async([{'role': 'user', 'parts': [msg]}])
+        return response.text
+
 
 if __name__ == "__main__":
     from configuration import Config
@@ -5,7 +5,7 @@ from functools import wraps
 BOT_FUNC = {
     1: "菜单：#菜单",
     2: "成语答疑：？开头",
-    3: "积分排行榜：%查询",
+    3: "积分排行榜：#排行榜",
     4: "成语重置：#重置",
     5: "隔夜新闻：#新闻",
 }
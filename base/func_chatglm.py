@@ -1,23 +1,31 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import copy
 import json
 import os
 import random
 from datetime import datetime
-from typing import Optional
+from typing import Any, Callable, Optional
 import httpx
 from openai import OpenAI
 from base.chatglm.code_kernel import CodeKernel, execute
 from base.chatglm.tool_registry import dispatch_tool, extract_code, get_tools
 from wcferry import Wcf
 
+from core.conversation_store import CONVERSATIONS
+
 functions = get_tools()
 
 
 class ChatGLM:
 
-    def __init__(self, config={}, wcf: Optional[Wcf] = None, max_retry=5) -> None:
+    def __init__(self, config={}, wcf: Optional[Wcf] = None, max_retry=5,
+                 sender: Optional[Callable[[str, str], Any]] = None) -> None:
+        """
+        :param wcf: 用于发送生成的图片
+        :param sender: 发送中间结果（代码、执行结果）的函数 sender(消息, 接收人)，默认直接用 wcf 发送
+        """
         key = config.get("key", 'empty')
         api = config.get("api")
         proxy = config.get("proxy")
@@ -25,10 +33,11 @@ class ChatGLM:
             self.client = OpenAI(api_key=key, base_url=api, http_client=httpx.Client(proxy=proxy))
         else:
             self.client = OpenAI(api_key=key, base_url=api)
-        self.conversation_list = {}
+        self.conversation_list = CONVERSATIONS.namespace("ChatGLM")  # {wxid: {模式: 消息列表}}
         self.chat_type = {}
         self.max_retry = max_retry
         self.wcf = wcf
+        self.sender = sender or (wcf.send_text if wcf else None)
         self.filePath = config["file_path"]
         self.kernel = CodeKernel()
         self.system_content_msg = {"chat": [{"role": "system", "content": config["prompt"]}],
@@ -63,10 +72,10 @@ class ChatGLM:
             return '已切换#代码模式 \n代码模式可以用于写python代码，例如：\n用python画一个爱心'
         elif '#清除模式会话' == question or '#4' == question:
             self.conversation_list[wxid][self.chat_type[wxid]
-            ] = self.system_content_msg[self.chat_type[wxid]]
+            ] = copy.deepcopy(self.system_content_msg[self.chat_type[wxid]])
             return '已清除'
         elif '#清除全部会话' == question or '#5' == question:
-            self.conversation_list[wxid] = self.system_content_msg
+            self.conversation_list[wxid] = copy.deepcopy(self.system_content_msg)
             return '已清除'
 
         self.updateMessage(wxid, question, "user")
@@ -114,8 +123,8 @@ class ChatGLM:
                 elif response.choices[0].message.content.find('interpreter') != -1:
                     output_text = response.choices[0].message.content
                     code = extract_code(output_text)
-                    self.wcf and self.wcf.send_text('代码如下：\n' + code, wxid)
-                    self.wcf and self.wcf.send_text('执行代码...', wxid)
+                    self.sender and self.sender('代码如下：\n' + code, wxid)
+                    self.sender and self.sender('执行代码...', wxid)
                     try:
                         res_type, res = execute(code, self.kernel)
                     except Exception as e:
@@ -128,7 +137,7 @@ class ChatGLM:
                         res.save(filePath)
                         self.wcf and self.wcf.send_image(filePath, wxid)
                     else:
-                        self.wcf and self.wcf.send_text("执行结果:\n" + res, wxid)
+                        self.sender and self.sender("执行结果:\n" + res, wxid)
                     tool_response = '[Image]' if res_type == 'image' else res
                     print("Received:", res_type, res)
                     params["messages"].append(response.choices[0].message)
@@ -155,8 +164,9 @@ class ChatGLM:
         now_time = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
         # 初始化聊天记录,组装系统信息
-        if wxid not in self.conversation_list.keys():
-            self.conversation_list[wxid] = self.system_content_msg
+        if wxid not in self.conversation_list:
+            # 每个会话一份，不能和其他会话共用同一个列表
+            self.conversation_list[wxid] = copy.deepcopy(self.system_content_msg)
         if wxid not in self.chat_type.keys():
             self.chat_type[wxid] = 'chat'
 
@@ -165,13 +175,6 @@ class ChatGLM:
         self.conversation_list[wxid][self.chat_type[wxid]].append(
             content_question_)
 
-        # 只存储10条记录，超过滚动清除
-        i = len(self.conversation_list[wxid][self.chat_type[wxid]])
-        if i > 10:
-            print("滚动清除微信记录：" + wxid)
-            # 删除多余的记录，倒着删，且跳过第一个的系统消息
-            del self.conversation_list[wxid][self.chat_type[wxid]][1]
-
 
 if __name__ == "__main__":
     from configuration import Config
@@ -3,9 +3,51 @@
 
 import logging
 from datetime import datetime
+from typing import AsyncIterator, Iterable, Iterator
 
 import httpx
-from openai import APIConnectionError, APIError, AuthenticationError, OpenAI
+from openai import APIConnectionError, APIError, AsyncOpenAI, AuthenticationError, OpenAI
+
+from core.conversation_store import CONVERSATIONS
+
+
+class StreamCleaner(object):
+    """
+    流式输出做和 ChatGPT._take_answer 一样的清理：去掉开头的两个换行，两个换行换成一个
+    末尾的换行先留着，等知道这一串换行有多长再输出，拼接结果与整段清理完全相同
+    """
+
+    def __init__(self) -> None:
+        self._pending = ""
+        self._started = False
+
+    def _clean(self, text: str) -> str:
+        if not self._started:
+            self._started = True
+            text = text[2:] if text.startswith("\n\n") else text
+        return text.replace("\n\n", "\n")
+
+    def feed(self, delta: str) -> str:
+        text = self._pending + delta
+        body = text.rstrip("\n")
+        self._pending = text[len(body):]
+        return self._clean(body) if body else ""
+
+    def flush(self) -> str:
+        rest, self._pending = self._pending, ""
+        return self._clean(rest) if rest else ""
+
+
+def clean_stream(deltas: Iterable[str]) -> Iterator[str]:
+    """用 StreamCleaner 清理文本片段流"""
+    cleaner = StreamCleaner()
+    for delta in deltas:
+        text = cleaner.feed(delta)
+        if text:
+            yield text
+    rest = cleaner.flush()
+    if rest:
+        yield rest
 
 
 class ChatGPT():
@@ -20,7 +62,9 @@ class ChatGPT():
             self.client = OpenAI(api_key=key, base_url=api, http_client=httpx.Client(proxy=proxy))
         else:
             self.client = OpenAI(api_key=key, base_url=api)
-        self.conversation_list = {}
+        self._key, self._api, self._proxy = key, api, proxy
+        self._aclient = None  # asyncio 模式下首次使用时创建
+        self.conversation_list = CONVERSATIONS.namespace("ChatGPT")  # 轮数、token 数和内存占用由共用的对话记录控制
         self.system_content_msg = {"role": "system", "content": prompt}
 
     def __repr__(self):
@@ -41,10 +85,61 @@ class ChatGPT():
             ret = self.client.chat.completions.create(model=self.model,
                                                       messages=self.conversation_list[wxid],
                                                       temperature=0.2)
-            rsp = ret.choices[0].message.content
-            rsp = rsp[2:] if rsp.startswith("\n\n") else rsp
-            rsp = rsp.replace("\n\n", "\n")
-            self.updateMessage(wxid, rsp, "assistant")
+            rsp = self._take_answer(wxid, ret)
+        except AuthenticationError:
+            self.LOG.error("OpenAI API 认证失败，请检查 API 密钥是否正确")
+        except APIConnectionError:
+            self.LOG.error("无法连接到 OpenAI API，请检查网络连接")
+        except APIError as e1:
+            self.LOG.error(f"OpenAI API 返回了错误：{str(e1)}")
+        except Exception as e0:
+            self.LOG.error(f"发生未知错误：{str(e0)}")
+
+        return rsp
+
+    def _async_client(self) -> AsyncOpenAI:
+        """asyncio 模式下首次使用时创建，需在事件循环中调用"""
+        if self._aclient is None:
+            if self._proxy:
+                self._aclient = AsyncOpenAI(api_key=self._key, base_url=self._api,
+                                            http_client=httpx.AsyncClient(proxy=self._proxy))
+            else:
+                self._aclient = AsyncOpenAI(api_key=self._key, base_url=self._api)
+        return self._aclient
+
+    async def get_answer_async(self, question: str, wxid: str) -> str:
+        """asyncio 模式下使用的 get_answer，不占用线程"""
+        self.updateMessage(wxid, question, "user")
+        rsp = ""
+        try:
+            ret = await self._async_client().chat.completions.create(model=self.model,
+                                                              messages=self.conversation_list[wxid],
+                                                              temperature=0.2)
+            rsp = self._take_answer(wxid, ret)
+        except AuthenticationError:
+            self.LOG.error("OpenAI API 认证失败，请检查 API 密钥是否正确")
+        except APIConnectionError:
+            self.LOG.error("无法连接到 OpenAI API，请检查网络连接")
+        except APIError as e1:
+            self.LOG.error(f"OpenAI API 返回了错误：{str(e1)}")
+        except Exception as e0:
+            self.LOG.error(f"发生未知错误：{str(e0)}")
+
+        return rsp
+
+    def stream_answer(self, question: str, wxid: str) -> Iterator[str]:
+        """流式版本的 get_answer，边生成边返回文本片段，结束后把完整回答记入对话"""
+        self.updateMessage(wxid, question, "user")
+        parts = []
+        try:
+            ret = self.client.chat.completions.create(model=self.model,
+                                                      messages=self.conversation_list[wxid],
+                                                      temperature=0.2,
+                                                      stream=True)
+            deltas = (chunk.choices[0].delta.content for chunk in ret if chunk.choices)
+            for delta in clean_stream(d for d in deltas if d):
+                parts.append(delta)
+                yield delta
         except AuthenticationError:
             self.LOG.error("OpenAI API 认证失败，请检查 API 密钥是否正确")
         except APIConnectionError:
@@ -54,6 +149,50 @@ class ChatGPT():
         except Exception as e0:
             self.LOG.error(f"发生未知错误：{str(e0)}")
 
+        if parts:
+            self.updateMessage(wxid, "".join(parts), "assistant")
+
+    async def stream_answer_async(self, question: str, wxid: str) -> AsyncIterator[str]:
+        """asyncio 模式下使用的 stream_answer，不占用线程"""
+        self.updateMessage(wxid, question, "user")
+        parts = []
+        cleaner = StreamCleaner()
+        try:
+            ret = await self._async_client().chat.completions.create(model=self.model,
+                                                                     messages=self.conversation_list[wxid],
+                                                                     temperature=0.2,
+                                                                     stream=True)
+            async for chunk in ret:
+                delta = cleaner.feed(chunk.choices[0].delta.content or "") if chunk.choices else ""
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            delta = cleaner.flush()
+            if delta:
+                parts.append(delta)
+                yield delta
+        except AuthenticationError:
+            self.LOG.error("OpenAI API 认证失败，请检查 API 密钥是否正确")
+        except APIConnectionError:
+            self.LOG.error("无法连接到 OpenAI API，请检查网络连接")
+        except APIError as e1:
+            self.LOG.error(f"OpenAI API 返回了错误：{str(e1)}")
+        except Exception as e0:
+            self.LOG.error(f"发生未知错误：{str(e0)}")
+
+        if parts:
+            self.updateMessage(wxid, "".join(parts), "assistant")
+
+    def remember(self, question: str, answer: str, wxid: str) -> None:
+        """把没有调用接口得到的回答（例如命中回答缓存）记入对话，之后的追问能接上"""
+        self.updateMessage(wxid, question, "user")
+        self.updateMessage(wxid, answer, "assistant")
+
+    def _take_answer(self, wxid: str, ret) -> str:
+        rsp = ret.choices[0].message.content
+        rsp = rsp[2:] if rsp.startswith("\n\n") else rsp
+        rsp = rsp.replace("\n\n", "\n")
+        self.updateMessage(wxid, rsp, "assistant")
         return rsp
 
     def updateMessage(self, wxid: str, question: str, role: str) -> None:
@@ -61,9 +200,9 @@ class ChatGPT():
 
         time_mk = "当需要回答时间时请直接参考回复:"
         # 初始化聊天记录,组装系统信息
-        if wxid not in self.conversation_list.keys():
+        if wxid not in self.conversation_list:
             question_ = [
-                self.system_content_msg,
+                dict(self.system_content_msg),
                 {"role": "system", "content": "" + time_mk + now_time}
             ]
             self.conversation_list[wxid] = question_
@@ -78,13 +217,6 @@ class ChatGPT():
             if cont["content"].startswith(time_mk):
                 cont["content"] = time_mk + now_time
 
-        # 只存储10条记录，超过滚动清除
-        i = len(self.conversation_list[wxid])
-        if i > 10:
-            print("滚动清除微信记录：" + wxid)
-            # 删除多余的记录，倒着删，且跳过第一个的系统消息
-            del self.conversation_list[wxid][1]
-
 
 if __name__ == "__main__":
     from configuration import Config
@@ -1,23 +1,78 @@
+import csv
 import os
 import random
 import json
-import pandas as pd
+import threading
+from typing import Optional, Sequence
+
+from core.shared_table import SortedTable, TableDict, TableGroups
+from core.startup import LazyObject
 
 # 定义文件路径
 CONTEXT_FILE = "chengyu_context.json"
 ERROR_FILE = "chengyu_errors.json"  # 记录用户错误次数
 FAILURE_COUNT_FILE = "failure_count.json"  # 记录用户失败次数
+# 多账号模式下由 supervisor 设置，指向内存映射的成语索引目录，各进程共享同一份数据
+SHARED_DIR_ENV = "WCFROBOT_SHARED_DIR"
+CSV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chengyu.csv")
+INDEX_FILES = ("chengyu.cy.tbl", "chengyu.zi.tbl", "chengyu.yin.tbl", "chengyu.yi.tbl")
+# 成语答疑用到的列：拼音、解释、出处、例子
+MEANING_FIELDS = ("pingyin", "jieshi", "chuchu", "lizi")
+
+
+def build_chengyu_index(out_dir: str, csv_file: str = CSV_FILE) -> bool:
+    """
+    把成语 CSV 转成内存映射用的有序表，CSV 没有更新时跳过
+    :return: 是否重新生成
+    """
+    paths = [os.path.join(out_dir, f) for f in INDEX_FILES]
+    if all(os.path.exists(p) and os.path.getmtime(p) >= os.path.getmtime(csv_file) for p in paths):
+        return False
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(csv_file, encoding="utf-8") as fp:
+        records = list(csv.DictReader(fp, delimiter="\t"))
+    rows = [(r["chengyu"], r["pingyin"].split(" ")) for r in records]
+    SortedTable.build(paths[0], ((c, p[0], p[-1]) for c, p in rows))  # 成语, 首音, 末音
+    SortedTable.build(paths[1], ((c[0], c) for c, _ in rows))  # 首字, 成语
+    SortedTable.build(paths[2], ((p[0], c) for c, p in rows))  # 首音, 成语
+    # 成语, 拼音, 解释, 出处, 例子
+    SortedTable.build(paths[3], ((r["chengyu"], *((r.get(f) or "").replace("\t", " ") for f in MEANING_FIELDS))
+                                 for r in records))
+    return True
+
+
+def format_meaning(cy: str, fields: Sequence[Optional[str]]) -> str:
+    """成语答疑的回复：成语、拼音、解释，出处和例子有内容时附上"""
+    pinyin, jieshi, chuchu, lizi = (f if isinstance(f, str) else "" for f in fields)  # pandas 的空值是 NaN
+    lines = [cy, pinyin, jieshi]
+    if chuchu and chuchu != "无":
+        lines.append(f"出处：{chuchu}")
+    if lizi and lizi != "无":
+        lines.append(f"例子：{lizi}")
+    return "\n".join(line for line in lines if line)
 
 
 class Chengyu:
     def __init__(self) -> None:
-        # 获取当前脚本路径，读取数据文件
-        root = os.path.dirname(os.path.abspath(__file__))
-        self.df = pd.read_csv(f"{root}/chengyu.csv", delimiter="\t")
-        self.cys, self.zis, self.yins, self.eys = self._build_data()
+        shared_dir = os.environ.get(SHARED_DIR_ENV)
+        if shared_dir:
+            build_chengyu_index(shared_dir, CSV_FILE)  # 通常 supervisor 已生成，这里只检查是否过期
+            self.cys, self.zis, self.yins, self.eys = self._map_data(shared_dir)
+            self._meanings = SortedTable(os.path.join(shared_dir, INDEX_FILES[3]))
+            self._keys = None
+        else:
+            # 获取当前脚本路径，读取数据文件
+            import pandas as pd
+            self.df = pd.read_csv(CSV_FILE, delimiter="\t")
+            self.cys, self.zis, self.yins, self.eys = self._build_data()
+            self._meanings = None
+            self._keys = list(self.cys.keys())
         self.context = self.load_json(CONTEXT_FILE)
         self.errors = self.load_json(ERROR_FILE)  # 加载错误次数
         self.failure_count = self.load_json(FAILURE_COUNT_FILE)  # 加载失败次数
+        # 接龙状态和 JSON 文件的读改写都在锁内，处理消息的线程数不止一个（管理员通道、可配置的接龙通道）
+        self._lock = threading.Lock()
 
     def _build_data(self):
         # 处理成语数据
@@ -35,6 +90,18 @@ class Chengyu:
 
         return cys, zis, yins, eys
 
+    @staticmethod
+    def _map_data(shared_dir: str):
+        # 映射 supervisor 生成的索引，接口与 _build_data 的字典一致
+        cy_tbl, zi_tbl, yin_tbl = (SortedTable(os.path.join(shared_dir, f)) for f in INDEX_FILES[:3])
+        return TableDict(cy_tbl, 2), TableGroups(zi_tbl), TableGroups(yin_tbl), TableDict(cy_tbl, 1)
+
+    def randomChengyu(self) -> str:
+        """随机选一个成语"""
+        if self._keys is None:
+            return self.cys.table.random_row()[0]
+        return random.choice(self._keys)
+
     def load_json(self, filename):
         # 加载JSON文件
         if os.path.exists(filename):
@@ -47,6 +114,17 @@ class Chengyu:
         with open(filename, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=4)
 
+    def getMeaning(self, cy: str) -> Optional[str]:
+        """成语的拼音、解释、出处和例子，不是成语时返回 None"""
+        if self._meanings is not None:
+            row = self._meanings.get(cy)
+            return format_meaning(cy, row[1:]) if row else None
+        rows = self.df[self.df["chengyu"] == cy]
+        if rows.empty:
+            return None
+        row = rows.iloc[0]
+        return format_meaning(cy, [row.get(f) for f in MEANING_FIELDS])
+
     def isChengyu(self, cy: str) -> bool:
         """检查给定的成语是否在字典中"""
         return cy in self.cys
@@ -60,42 +138,30 @@ class Chengyu:
         :param cy: 用户输入的成语
         :param use_pinyin: 是否启用谐音接龙，默认为 True
         """
-        # 获取当前接龙的成语
-        current_chengyu = self.context.get(wxid, None)
-
-        # 如果当前没有接龙的成语，随机选一个成语
-        if not current_chengyu:
-            # 系统选择一个随机成语，作为初始状态
-            current_chengyu = random.choice(list(self.cys.keys()))
-            self.context[wxid] = current_chengyu  # 保存用户上下文
-            self.save_json(CONTEXT_FILE, self.context)  # 保存上下文到文件
-            return True, f"当前没有进行中的接龙，系统随机选择了一个成语：{current_chengyu}，请继续接龙。"
-
-        # 判断用户输入的成语是否存在于字典中
-        if not self.isChengyu(cy):  # 如果输入的成语不在字典中，返回 False
-            return False, "你输入的成语不在字典库中，请重新输入。"
-
-        # 当前成语的最后一个字
-        last_char_of_current = current_chengyu[-1]
-
-        # 用户输入的成语的第一个字
-        first_char_of_input = cy[0]
-
-        # 如果没有启用拼音接龙，继续按照字形接龙规则
-        if last_char_of_current == first_char_of_input:
-            next_chengyu = self.getNextWord(cy)
-            if next_chengyu:
-                self.context[wxid] = next_chengyu
-                self.save_json(CONTEXT_FILE, self.context)
-                return True, next_chengyu
-            else:
-                return False, "没有找到可以接龙的成语。"
-        elif use_pinyin:
-            last_pinyin_of_current = self.cys.get(current_chengyu)
-            first_pinyin_of_input = self.eys.get(cy)
-
-            # 判断拼音首音是否相同
-            if last_pinyin_of_current == first_pinyin_of_input:
+        with self._lock:
+            # 获取当前接龙的成语
+            current_chengyu = self.context.get(wxid, None)
+
+            # 如果当前没有接龙的成语，随机选一个成语
+            if not current_chengyu:
+                # 系统选择一个随机成语，作为初始状态
+                current_chengyu = self.randomChengyu()
+                self.context[wxid] = current_chengyu  # 保存用户上下文
+                self.save_json(CONTEXT_FILE, self.context)  # 保存上下文到文件
+                return True, f"当前没有进行中的接龙，系统随机选择了一个成语：{current_chengyu}，请继续接龙。"
+
+            # 判断用户输入的成语是否存在于字典中
+            if not self.isChengyu(cy):  # 如果输入的成语不在字典中，返回 False
+                return False, "你输入的成语不在字典库中，请重新输入。"
+
+            # 当前成语的最后一个字
+            last_char_of_current = current_chengyu[-1]
+
+            # 用户输入的成语的第一个字
+            first_char_of_input = cy[0]
+
+            # 如果没有启用拼音接龙，继续按照字形接龙规则
+            if last_char_of_current == first_char_of_input:
                 next_chengyu = self.getNextWord(cy)
                 if next_chengyu:
                     self.context[wxid] = next_chengyu
@@ -103,8 +169,21 @@ class Chengyu:
                     return True, next_chengyu
                 else:
                     return False, "没有找到可以接龙的成语。"
-            else:
-                return False, f"当前成语为：{current_chengyu}，{cy}无法接龙，请尝试其他成语。"
+            elif use_pinyin:
+                last_pinyin_of_current = self.cys.get(current_chengyu)
+                first_pinyin_of_input = self.eys.get(cy)
+
+                # 判断拼音首音是否相同
+                if last_pinyin_of_current == first_pinyin_of_input:
+                    next_chengyu = self.getNextWord(cy)
+                    if next_chengyu:
+                        self.context[wxid] = next_chengyu
+                        self.save_json(CONTEXT_FILE, self.context)
+                        return True, next_chengyu
+                    else:
+                        return False, "没有找到可以接龙的成语。"
+                else:
+                    return False, f"当前成语为：{current_chengyu}，{cy}无法接龙，请尝试其他成语。"
 
     def getNextWord(self, cy: str) -> str:
         """获取下一个可以接龙的成语"""
@@ -128,20 +207,23 @@ class Chengyu:
         return cy1[-1] == cy2[0] if self.isChengyu(cy1) and self.isChengyu(cy2) else False
 
     def reset_current_chengyu(self, wxid):
-        random_chengyu = random.choice(list(self.cys.keys()))
-        self.context[wxid] = random_chengyu
-        self.errors[wxid] = 0  # 重置错误次数
-        self.failure_count[wxid] = 0  # 重置失败次数
-        self.save_json(CONTEXT_FILE, self.context)
-        self.save_json(ERROR_FILE, self.errors)
-        self.save_json(FAILURE_COUNT_FILE, self.failure_count)  # 保存失败次数
-        return f"当前接龙成语已重置为：{random_chengyu}，请继续接龙。"
+        with self._lock:
+            random_chengyu = self.randomChengyu()
+            self.context[wxid] = random_chengyu
+            self.errors[wxid] = 0  # 重置错误次数
+            self.failure_count[wxid] = 0  # 重置失败次数
+            self.save_json(CONTEXT_FILE, self.context)
+            self.save_json(ERROR_FILE, self.errors)
+            self.save_json(FAILURE_COUNT_FILE, self.failure_count)  # 保存失败次数
+            return f"当前接龙成语已重置为：{random_chengyu}，请继续接龙。"
 
     def query_current_chengyu(self, wxid):
-        return f"当前接龙成语是：{self.context.get(wxid, '暂无')}"
+        with self._lock:
+            return f"当前接龙成语是：{self.context.get(wxid, '暂无')}"
 
 
-cy = Chengyu()
+# 首次使用时才加载词典（需要解析 CSV 或映射索引）
+cy = LazyObject(Chengyu, "成语词典")
 # 测试代码
 if __name__ == "__main__":
     game = Chengyu()
@@ -4,9 +4,12 @@
 import logging
 from datetime import datetime
 import re
+from typing import AsyncIterator, Iterator
 
 import ollama
 
+from core.conversation_store import CONVERSATIONS
+
 
 class Ollama():
     def __init__(self, conf: dict) -> None:
@@ -15,7 +18,8 @@ class Ollama():
         self.prompt = conf.get("prompt")
 
         self.LOG = logging.getLogger("Ollama")
-        self.conversation_list = {}
+        self.conversation_list = CONVERSATIONS.namespace("Ollama")  # 保存的是 token 上下文
+        self._aclient = None  # asyncio 模式下首次使用时创建
 
 
     def __repr__(self):
@@ -51,6 +55,59 @@ class Ollama():
 
         return rsp
 
+    def _async_client(self) -> ollama.AsyncClient:
+        """asyncio 模式下首次使用时创建，需在事件循环中调用"""
+        if self._aclient is None:
+            self._aclient = ollama.AsyncClient()
+        return self._aclient
+
+    async def _ensure_context_async(self, wxid: str) -> None:
+        if wxid not in self.conversation_list:
+            res = await self._async_client().generate(model=self.model, prompt=self.prompt, keep_alive="30m")
+            self.updateMessage(wxid, res["context"], "assistant")
+
+    async def get_answer_async(self, question: str, wxid: str) -> str:
+        """asyncio 模式下使用的 get_answer，不占用线程"""
+        try:
+            await self._ensure_context_async(wxid)
+            res = await self._async_client().generate(model=self.model, prompt=question,
+                                                      context=self.conversation_list[wxid], keep_alive="30m")
+            self.updateMessage(wxid, res["context"], "user")
+            return res["response"]
+        except Exception as e0:
+            self.LOG.error(f"发生未知错误：{str(e0)}")
+
+        return ""
+
+    def stream_answer(self, question: str, wxid: str) -> Iterator[str]:
+        """流式版本的 get_answer，边生成边返回文本片段，最后一段带有新的对话上下文"""
+        try:
+            if wxid not in self.conversation_list:
+                res = ollama.generate(model=self.model, prompt=self.prompt, keep_alive="30m")
+                self.updateMessage(wxid, res["context"], "assistant")
+            for part in ollama.generate(model=self.model, prompt=question, context=self.conversation_list[wxid],
+                                        keep_alive="30m", stream=True):
+                if part.get("response"):
+                    yield part["response"]
+                if part.get("done") and part.get("context"):
+                    self.updateMessage(wxid, part["context"], "user")
+        except Exception as e0:
+            self.LOG.error(f"发生未知错误：{str(e0)}")
+
+    async def stream_answer_async(self, question: str, wxid: str) -> AsyncIterator[str]:
+        """asyncio 模式下使用的 stream_answer，不占用线程"""
+        try:
+            await self._ensure_context_async(wxid)
+            async for part in await self._async_client().generate(model=self.model, prompt=question,
+                                                                  context=self.conversation_list[wxid],
+                                                                  keep_alive="30m", stream=True):
+                if part.get("response"):
+                    yield part["response"]
+                if part.get("done") and part.get("context"):
+                    self.updateMessage(wxid, part["context"], "user")
+        except Exception as e0:
+            self.LOG.error(f"发生未知错误：{str(e0)}")
+
     def updateMessage(self, wxid: str, context: str, role: str) -> None:
         # 当前问题
         self.conversation_list[wxid] = context
@@ -3,6 +3,7 @@
 
 import logging
 
+import httpx
 import requests
 from random import randint
 
@@ -40,6 +41,24 @@ class TigerBot:
 
         return rsp
 
+    async def get_answer_async(self, msg: str, sender: str = None) -> str:
+        """asyncio 模式下使用的 get_answer，不占用线程"""
+        payload = {
+            "text": msg,
+            "modelVersion": self.tbmodel
+        }
+        rsp = ""
+        try:
+            async with httpx.AsyncClient() as client:
+                rsp = (await client.post(self.tburl, headers=self.tbheaders, json=payload)).json()
+            rsp = rsp["data"]["result"][0]
+        except Exception as e:
+            self.LOG.error(f"{e}: {payload}\n{rsp}")
+            idx = randint(0, len(self.fallback) - 1)
+            rsp = self.fallback[idx]
+
+        return rsp
+
 
 if __name__ == "__main__":
     from configuration import Config
@@ -1,12 +1,18 @@
+import logging
+from typing import Iterator
+
 from zhipuai import ZhipuAI
 
+from core.conversation_store import CONVERSATIONS
+
 
 class ZhiPu():
     def __init__(self, conf: dict) -> None:
         self.api_key = conf.get("api_key")
         self.model = conf.get("model", "glm-4")  # 默认使用 glm-4 模型
         self.client = ZhipuAI(api_key=self.api_key)
-        self.converstion_list = {}
+        self.LOG = logging.getLogger("ZhiPu")
+        self.conversation_list = CONVERSATIONS.namespace("ZhiPu")
 
     @staticmethod
     def value_check(conf: dict) -> bool:
@@ -19,20 +25,50 @@ class ZhiPu():
 
     def get_answer(self, msg: str, wxid: str, **args) -> str:
         self._update_message(wxid, str(msg), "user")
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=self.converstion_list[wxid]
-        )
-        resp_msg = response.choices[0].message
-        answer = resp_msg.content
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self.conversation_list[wxid]
+            )
+            resp_msg = response.choices[0].message
+            answer = resp_msg.content
+        except Exception as e0:
+            self.LOG.error(f"发生未知错误：{str(e0)}")
+            return "发生未知错误：" + str(e0)
         self._update_message(wxid, answer, "assistant")
         return answer
 
+    def stream_answer(self, msg: str, wxid: str) -> Iterator[str]:
+        """流式版本的 get_answer，边生成边返回文本片段；中途出错时接着返回错误信息，已生成的部分不记入对话"""
+        self._update_message(wxid, str(msg), "user")
+        parts = []
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self.conversation_list[wxid],
+                stream=True
+            )
+            for chunk in response:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e0:
+            self.LOG.error(f"发生未知错误：{str(e0)}")
+            yield ("\n" if parts else "") + "发生未知错误：" + str(e0)
+            return
+        self._update_message(wxid, "".join(parts), "assistant")
+
+    def remember(self, question: str, answer: str, wxid: str) -> None:
+        """把没有调用接口得到的回答（例如命中回答缓存）记入对话"""
+        self._update_message(wxid, question, "user")
+        self._update_message(wxid, answer, "assistant")
+
     def _update_message(self, wxid: str, msg: str, role: str) -> None:
-        if wxid not in self.converstion_list.keys():
-            self.converstion_list[wxid] = []
+        if wxid not in self.conversation_list:
+            self.conversation_list[wxid] = []
         content = {"role": role, "content": str(msg)}
-        self.converstion_list[wxid].append(content)
+        self.conversation_list[wxid].append(content)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import logging
+from typing import Any, List, NamedTuple, Optional, Set
+
+from constants import ChatType
+from core.startup import STARTUP
+
+
+class Provider(NamedTuple):
+    chat_type: ChatType
+    module: str  # 所在模块，选中时才导入
+    cls: str
+    conf: str  # Config 中的配置属性名
+    section: str  # config.yaml 中的配置项
+    wants_wcf: bool = False  # 是否需要 wcf 和发送函数（ChatGLM 要发图片、文件）
+    cacheable: bool = True  # 回答只取决于问题，可以缓存（ChatGLM 有切换模式、执行代码等副作用）
+
+
+# 未指定模型时按此顺序选第一个配置好的
+PROVIDERS = (
+    Provider(ChatType.TIGER_BOT, "base.func_tigerbot", "TigerBot", "TIGERBOT", "tigerbot"),
+    Provider(ChatType.CHATGPT, "base.func_chatgpt", "ChatGPT", "CHATGPT", "chatgpt"),
+    Provider(ChatType.OLLAMA, "base.func_ollama", "Ollama", "OLLAMA", "ollama"),
+    Provider(ChatType.XINGHUO_WEB, "base.func_xinghuo_web", "XinghuoWeb", "XINGHUO_WEB", "xinghuo_web"),
+    Provider(ChatType.CHATGLM, "base.func_chatglm", "ChatGLM", "CHATGLM", "chatglm", True, False),
+    Provider(ChatType.BardAssistant, "base.func_bard", "BardAssistant", "BardAssistant", "bard"),
+    Provider(ChatType.ZhiPu, "base.func_zhipu", "ZhiPu", "ZhiPu", "zhipu"),
+)
+
+
+def candidates(chat_type: int) -> List[Provider]:
+    """模型序号对应的模型，不在 ChatType 中时为全部模型（按顺序选第一个配置好的）"""
+    if ChatType.is_in_chat_types(chat_type):
+        return [p for p in PROVIDERS if p.chat_type == chat_type]
+    return list(PROVIDERS)
+
+
+def sections(chat_type: int) -> Set[str]:
+    """影响模型选择的配置项，配置热更新时据此判断是否需要重建模型"""
+    return {p.section for p in candidates(chat_type)}
+
+
+def provider_of(chat: Any) -> Optional[Provider]:
+    """模型对象对应的 Provider，不是内置模型时为 None"""
+    name = type(chat).__name__
+    return next((p for p in PROVIDERS if p.cls == name), None)
+
+
+def is_first_turn(chat: Any, key: str) -> bool:
+    """会话还没有历史（或模型不保存历史），此时的回答只取决于问题本身"""
+    history = getattr(chat, "conversation_list", None)
+    return history is None or key not in history
+
+
+def load_class(provider: Provider) -> Any:
+    with STARTUP.stage(f"导入 {provider.cls}"):
+        return getattr(importlib.import_module(provider.module), provider.cls)
+
+
+def create_chat(chat_type: int, config, wcf=None, sender=None) -> Optional[Any]:
+    """
+    按模型序号创建模型，配置由各模型类的 value_check 检查；配置项为空的模型不导入
+    :param chat_type: 模型序号，不在 ChatType 中时选第一个配置好的模型
+    :param wcf: ChatGLM 需要的 Wcf 客户端
+    :param sender: ChatGLM 需要的发送函数
+    :return: 模型对象，未配置时为 None
+    """
+    for provider in candidates(chat_type):
+        conf = getattr(config, provider.conf, None)
+        if not conf:
+            continue  # 没有配置的模型不导入
+        cls = load_class(provider)
+        if not cls.value_check(conf):
+            continue
+        with STARTUP.stage(f"初始化 {provider.cls}"):
+            if provider.wants_wcf:
+                return cls(conf, wcf=wcf, sender=sender)
+            return cls(conf)
+
+    logging.getLogger("Robot").warning("未配置模型")
+    return None
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""不依赖真实微信的压测工具：假的 Wcf、假的大模型和消息回放"""
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from queue import Empty, Queue
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+class FakeWxMsg(object):
+    """与 wcferry.WxMsg 接口一致的消息"""
+
+    def __init__(self, type: int = 1, id: int = 0, sender: str = "", roomid: str = "", content: str = "",
+                 xml: str = "", is_self: bool = False, is_group: bool = False, ts: Optional[int] = None) -> None:
+        self._is_self = is_self
+        self._is_group = is_group
+        self.type = type
+        self.id = id
+        self.ts = int(time.time()) if ts is None else ts
+        self.sign = ""
+        self.xml = xml
+        self.sender = sender
+        self.roomid = roomid
+        self.content = content
+        self.thumb = ""
+        self.extra = ""
+
+    def __str__(self) -> str:
+        return f"{self.sender}[{self.roomid}]|{self.id}|{self.type}\n{self.content}"
+
+    def from_self(self) -> bool:
+        return self._is_self
+
+    def from_group(self) -> bool:
+        return self._is_group
+
+    def is_at(self, wxid) -> bool:
+        if not self.from_group():
+            return False
+        if not re.findall(f"<atuserlist>[\\s|\\S]*({wxid})[\\s|\\S]*</atuserlist>", self.xml):
+            return False
+        if re.findall(r"@(?:所有人|all|All)", self.content):
+            return False
+        return True
+
+    def is_text(self) -> bool:
+        return self.type == 1
+
+
+class FakeWcf(object):
+    """假的 Wcf 客户端
+
+    inject() 投递的消息通过 get_msg() 交给机器人，所有 send_text 调用都会被记录，
+    并按会话把回复与等待回复的入站消息配对，得到端到端延迟。
+    """
+
+    def __init__(self, self_wxid: str = "wxid_bot", rpc_latency: float = 0.0) -> None:
+        """
+        :param self_wxid: 机器人自己的 wxid
+        :param rpc_latency: 模拟每次 RPC 调用（发送、查库、查群昵称）的耗时，秒
+        """
+        self.self_wxid = self_wxid
+        self.rpc_latency = rpc_latency
+        self.msgQ: Queue = Queue()
+        self.sent: List[Dict[str, Any]] = []
+        self.latencies: List[float] = []
+        self.rpc_calls: Dict[str, int] = defaultdict(int)
+        self._receiving = False
+        self._pending: Dict[str, Deque[float]] = defaultdict(deque)  # 会话: 等待回复的消息投递时间
+        self._lock = threading.Lock()
+        self._replied = threading.Condition(self._lock)
+        self._expected = 0
+
+    def _rpc(self, name: str) -> None:
+        with self._lock:
+            self.rpc_calls[name] += 1
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    # 投递与统计
+    def inject(self, msg: FakeWxMsg, expect_reply: bool = False) -> None:
+        if expect_reply:
+            key = msg.roomid if msg.from_group() else msg.sender
+            with self._lock:
+                self._pending[key].append(time.time())
+                self._expected += 1
+        self.msgQ.put(msg)
+
+    def wait_replies(self, timeout: float) -> bool:
+        """等待所有需要回复的消息都收到回复"""
+        deadline = time.time() + timeout
+        with self._replied:
+            while len(self.latencies) < self._expected:
+                left = deadline - time.time()
+                if left <= 0:
+                    return False
+                self._replied.wait(left)
+        return True
+
+    @property
+    def expected(self) -> int:
+        return self._expected
+
+    # wcferry 接口
+    def get_self_wxid(self) -> str:
+        return self.self_wxid
+
+    def enable_receiving_msg(self, pyq=False) -> bool:
+        self._receiving = True
+        return True
+
+    def enable_recv_msg(self, callback: Callable = None) -> bool:
+        def listening():
+            while self._receiving:
+                try:
+                    callback(self.msgQ.get(timeout=1))
+                except Empty:
+                    continue
+
+        self._receiving = True
+        threading.Thread(target=listening, name="FakeRecv", daemon=True).start()
+        return True
+
+    def is_receiving_msg(self) -> bool:
+        return self._receiving
+
+    def get_msg(self, block=True) -> FakeWxMsg:
+        return self.msgQ.get(block, timeout=1)
+
+    def send_text(self, msg: str, receiver: str, aters: Optional[str] = "") -> int:
+        self._rpc("send_text")
+        now = time.time()
+        with self._replied:
+            self.sent.append({"ts": now, "receiver": receiver, "aters": aters, "msg": msg})
+            pending = self._pending.get(receiver)
+            if pending:
+                self.latencies.append(now - pending.popleft())
+                self._replied.notify_all()
+        return 0
+
+    def send_image(self, path: str, receiver: str) -> int:
+        self._rpc("send_image")
+        return 0
+
+    def send_pat_msg(self, roomid: str, wxid: str) -> int:
+        self._rpc("send_pat_msg")
+        return 1
+
+    def accept_new_friend(self, v3: str, v4: str, scene: int = 30) -> int:
+        self._rpc("accept_new_friend")
+        return 1
+
+    def get_alias_in_chatroom(self, wxid: str, roomid: str) -> str:
+        self._rpc("get_alias_in_chatroom")
+        return f"nick_{wxid[-4:]}"
+
+    def query_sql(self, db: str, sql: str) -> List[Dict]:
+        self._rpc("query_sql")
+        if "COUNT(*)" in sql:
+            return [{"n": 0, "m": 0}]
+        return []
+
+    def get_msg_types(self) -> Dict:
+        return {1: "文字", 37: "好友确认", 10000: "系统信息"}
+
+    def get_contacts(self) -> List[Dict]:
+        return []
+
+    def cleanup(self) -> None:
+        self._receiving = False
+
+
+class StubChat(object):
+    """假的大模型，按配置的延迟返回固定格式的回答"""
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.0) -> None:
+        """
+        :param latency: 每次回答的耗时，秒
+        :param jitter: 在 latency 基础上随机增加的最大耗时，秒
+        """
+        self._random = random.Random(0)
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    def __repr__(self):
+        return "StubChat"
+
+    def _delay(self) -> float:
+        return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def get_answer(self, question: str, wxid: str) -> str:
+        self.calls += 1
+        time.sleep(self._delay())
+        return f"回答：{question[:20]}"
+
+    async def get_answer_async(self, question: str, wxid: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        return f"回答：{question[:20]}"
@@ -0,0 +1,307 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+消息回放压测：不需要微信客户端，用假的 Wcf 和假的大模型测量 Robot 的吞吐和回复延迟
+
+# 生成 2000 条合成消息，按每秒 50 条回放，大模型耗时 0.5 秒
+python -m bench.replay -n 2000 --rate 50 --latency 0.5
+
+# 保存合成的消息，之后可以用 --trace 重复回放同一份消息
+python -m bench.replay -n 2000 --save trace.jsonl
+python -m bench.replay --trace trace.jsonl --rate 100
+"""
+
+import inspect
+import json
+import math
+import random
+import threading
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+from functools import wraps
+from typing import Any, Dict, List
+
+from bench.fake_wcf import FakeWcf, FakeWxMsg, StubChat
+
+BOT_WXID = "wxid_bot"
+
+# 合成消息的类型与占比
+DEFAULT_MIX = {
+    "group_at": 0.45,  # 群里 @ 机器人闲聊
+    "group_noise": 0.2,  # 群里没有 @ 机器人的聊天
+    "private": 0.15,  # 私聊闲聊
+    "command": 0.1,  # #积分、#菜单
+    "chengyu": 0.07,  # 成语接龙
+    "friend": 0.03,  # 好友请求
+}
+
+# 回放时统计耗时的 Robot 方法
+HANDLERS = ("processMsg", "runCommand", "toAt", "toChitchat", "chengyuNext", "get_wx_points", "botMenu",
+            "autoAcceptFriendRequest", "_sendTextNow", "toChitchatAsync")
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, math.ceil(p / 100.0 * len(values)) - 1))
+    return values[idx]
+
+
+def synthesize(count: int, rooms: int = 40, users: int = 400, mix: Dict[str, float] = None,
+               seed: int = 0) -> List[Dict[str, Any]]:
+    """生成合成消息，每条为一个 dict，可保存为 jsonl"""
+    rnd = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds, weights = list(mix.keys()), list(mix.values())
+    try:
+        from base.func_chengyu import cy
+        idioms = list(cy.cys.keys())[:500]
+    except Exception:
+        idioms = ["一心一意", "意气风发", "发扬光大"]
+
+    trace = []
+    for i in range(count):
+        kind = rnd.choices(kinds, weights)[0]
+        room = f"{rnd.randrange(rooms)}@chatroom"
+        user = f"wxid_user{rnd.randrange(users):04d}"
+        item = {"kind": kind, "type": 1, "sender": user, "roomid": "", "content": "", "xml": "",
+                "is_group": False, "expect_reply": False}
+        if kind == "group_at":
+            item.update(roomid=room, is_group=True, expect_reply=True, content=f"@机器人 问题{i}",
+                        xml=f"<msgsource><atuserlist>{BOT_WXID}</atuserlist></msgsource>")
+        elif kind == "group_noise":
+            item.update(roomid=room, is_group=True, content=f"随便聊聊{i}")
+        elif kind == "private":
+            item.update(content=f"私聊问题{i}", expect_reply=True)
+        elif kind == "command":
+            item.update(roomid=room, is_group=True, content=rnd.choice(["#积分", "#菜单"]), expect_reply=True)
+        elif kind == "chengyu":
+            item.update(roomid=room, is_group=True, content="#" + rnd.choice(idioms), expect_reply=True)
+        elif kind == "friend":
+            item.update(type=37, content=f'<msg fromusername="{user}" encryptusername="v3_{i}" '
+                                         f'ticket="v4_{i}" scene="30" />')
+        trace.append(item)
+    return trace
+
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_trace(trace: List[Dict[str, Any]], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for item in trace:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+class HandlerTimer(object):
+    """包装 Robot 实例上的方法，记录每个方法的调用耗时"""
+
+    def __init__(self) -> None:
+        self.times: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def wrap(self, obj: object, name: str) -> None:
+        func = getattr(obj, name, None)
+        if func is None:
+            return
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self._record(name, time.perf_counter() - start)
+
+            setattr(obj, name, timed_async)
+            return
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._record(name, time.perf_counter() - start)
+
+        setattr(obj, name, timed)
+
+    def _record(self, name: str, elapsed: float) -> None:
+        with self._lock:
+            self.times[name].append(elapsed)
+
+
+class MemoryPoints(object):
+    """替换 db 模块的积分函数，压测时不访问数据库"""
+
+    def __init__(self, initial: int = 1000) -> None:
+        self.initial = initial
+        self.points: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def install(self, db_module) -> None:
+        db_module.get_points = self.get_points
+        db_module.update_user_points = self.update_user_points
+        db_module.get_or_create_user_by_wechat_id = self.get_or_create_user_by_wechat_id
+        db_module.ledger = self
+
+    def get_or_create_user_by_wechat_id(self, wechat_id, *args, **kwargs):
+        with self._lock:
+            self.points.setdefault(wechat_id, self.initial)
+
+    def get_points(self, wechat_id):
+        with self._lock:
+            return self.points.setdefault(wechat_id, self.initial)
+
+    def update_user_points(self, wechat_id, change_points):
+        with self._lock:
+            self.points[wechat_id] = self.points.get(wechat_id, self.initial) + change_points
+
+    # 以下实现 db.ledger 的接口
+    def add(self, wechat_id, delta):
+        self.update_user_points(wechat_id, delta)
+
+    def pending(self, wechat_id):
+        return 0
+
+    def reserve(self, wechat_id, amount):
+        from db.point_ledger import Reservation
+
+        with self._lock:
+            points = self.points.setdefault(wechat_id, self.initial)
+            if points < amount:
+                return None
+            self.points[wechat_id] = points - amount
+        return Reservation(self, wechat_id, amount)
+
+
+def build_robot(wcf: FakeWcf, trace: List[Dict[str, Any]], args) -> Any:
+    """按压测参数构造 Robot，关闭发送延迟和限流（除非指定 --humanize）"""
+    from configuration import Config
+    from robot import Robot
+
+    config = Config()
+    config.GROUPS = sorted({item["roomid"] for item in trace if item["roomid"]})
+    config.ROOTIDS = []
+    config.CONFIG_WATCH = {"enable": False}  # 不让 config.yaml 的修改覆盖下面的压测参数
+    if not args.humanize:
+        config.SEND_RATE_LIMIT = 0
+        config.RATE_LIMIT = {}
+        config.SEND_QUEUE = {**config.SEND_QUEUE, "delay_min": 0, "delay_max": 0}
+        # 合并后一条发送/处理对应多条期望回复，无法逐条配对延迟
+        config.REPLY_COALESCE = {**config.REPLY_COALESCE, "window": 0}
+        config.DEBOUNCE = {**config.DEBOUNCE, "quiet": 0}
+
+    if args.use_async:
+        from robot_async import AsyncRobot
+        robot = AsyncRobot(config, wcf, 0)
+    else:
+        robot = Robot(config, wcf, 0)
+    robot.chat = StubChat(args.latency, args.jitter)
+    return robot
+
+
+def run(args) -> Dict[str, Any]:
+    trace = load_trace(args.trace) if args.trace else synthesize(args.count, args.rooms, args.users, seed=args.seed)
+    if args.save:
+        save_trace(trace, args.save)
+
+    if not args.real_db:
+        import db
+        MemoryPoints().install(db)
+
+    wcf = FakeWcf(BOT_WXID, rpc_latency=args.rpc_latency)
+    robot = build_robot(wcf, trace, args)
+    timer = HandlerTimer()
+    for name in HANDLERS:
+        timer.wrap(robot, name)
+    # 指令路由和发送队列在构造时绑定了原方法，重新绑定到计时后的方法
+    from core.command_router import CommandRouter
+    robot.router = CommandRouter.from_object(robot)
+    robot.sendQueue.sender = robot._sendTextNow
+
+    if args.use_async:
+        threading.Thread(target=robot.runForever, name="AsyncRobot", daemon=True).start()
+    else:
+        robot.enableReceivingMsg()
+
+    interval = 1.0 / args.rate if args.rate > 0 else 0
+    start = time.time()
+    for i, item in enumerate(trace):
+        msg = FakeWxMsg(type=item["type"], id=i + 1, sender=item["sender"], roomid=item["roomid"],
+                        content=item["content"], xml=item["xml"], is_group=item["is_group"])
+        wcf.inject(msg, item["expect_reply"])
+        if interval:
+            time.sleep(max(0.0, start + (i + 1) * interval - time.time()))
+    injected = time.time() - start
+
+    finished = wcf.wait_replies(args.timeout)
+    elapsed = time.time() - start
+    lat = wcf.latencies
+    report = {
+        "messages": len(trace),
+        "inject_seconds": round(injected, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_per_sec": round(len(trace) / elapsed, 2) if elapsed else 0,
+        "replies_expected": wcf.expected,
+        "replies_received": len(lat),
+        "all_replied": finished,
+        "sends": len(wcf.sent),
+        "sends_saved": robot.coalescer.stats()["saved"],
+        "latency_p50": round(percentile(lat, 50), 4),
+        "latency_p95": round(percentile(lat, 95), 4),
+        "latency_p99": round(percentile(lat, 99), 4),
+        "latency_max": round(max(lat), 4) if lat else 0,
+        "llm_calls": robot.chat.calls,
+        "rpc_calls": dict(wcf.rpc_calls),
+        "handlers": {
+            name: {"calls": len(v), "avg_ms": round(sum(v) / len(v) * 1000, 3),
+                   "p95_ms": round(percentile(v, 95) * 1000, 3), "total_s": round(sum(v), 3)}
+            for name, v in sorted(timer.times.items())
+        },
+    }
+    wcf.cleanup()
+    return report
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Robot 消息回放压测")
+    parser.add_argument("-n", "--count", type=int, default=1000, help="合成消息条数")
+    parser.add_argument("--trace", help="回放的消息文件（jsonl），不指定则合成")
+    parser.add_argument("--save", help="把合成的消息保存到文件")
+    parser.add_argument("--rate", type=float, default=50, help="每秒投递消息数，0 表示尽快投递")
+    parser.add_argument("--rooms", type=int, default=40, help="合成消息的群数")
+    parser.add_argument("--users", type=int, default=400, help="合成消息的用户数")
+    parser.add_argument("--seed", type=int, default=0, help="合成消息的随机种子")
+    parser.add_argument("--latency", type=float, default=0.5, help="假大模型每次回答的耗时，秒")
+    parser.add_argument("--jitter", type=float, default=0.0, help="假大模型随机增加的最大耗时，秒")
+    parser.add_argument("--rpc-latency", type=float, default=0.0, help="假 Wcf 每次 RPC 的耗时，秒")
+    parser.add_argument("--humanize", action="store_true", help="保留发送随机延迟和限流配置")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="以 asyncio 模式运行机器人")
+    parser.add_argument("--real-db", action="store_true", help="使用配置的数据库，默认用内存积分")
+    parser.add_argument("--timeout", type=float, default=60, help="投递完成后等待回复的最长秒数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出报告")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"消息数: {report['messages']}  耗时: {report['elapsed_seconds']}s  吞吐: {report['messages_per_sec']} msg/s")
+    print(f"回复: {report['replies_received']}/{report['replies_expected']}  发送: {report['sends']}  "
+          f"合并节省: {report['sends_saved']}  大模型调用: {report['llm_calls']}")
+    print(f"端到端延迟 p50={report['latency_p50']}s p95={report['latency_p95']}s "
+          f"p99={report['latency_p99']}s max={report['latency_max']}s")
+    print("各处理函数耗时:")
+    for name, h in report["handlers"].items():
+        print(f"  {name:<24} calls={h['calls']:<6} avg={h['avg_ms']}ms p95={h['p95_ms']}ms total={h['total_s']}s")
+
+
+if __name__ == "__main__":
+    main()
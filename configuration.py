@@ -1,48 +1,105 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import copy
 import logging.config
 import os
 import shutil
+import threading
+from typing import Any, Dict, Set, Tuple
 
 import yaml
 
 
 class Config(object):
     def __init__(self) -> None:
+        pwd = os.path.dirname(os.path.abspath(__file__))
+        self.PATH = f"{pwd}/config.yaml"
+        self._raw: dict = {}
+        # 配置文件监视线程和“更新”命令可能同时调用 apply，比较和替换必须一起完成
+        self._applyLock = threading.Lock()
         self.reload()
 
     def _load_config(self) -> dict:
-        pwd = os.path.dirname(os.path.abspath(__file__))
         try:
-            with open(f"{pwd}/config.yaml", "rb") as fp:
+            with open(self.PATH, "rb") as fp:
                 yconfig = yaml.safe_load(fp)
         except FileNotFoundError:
-            shutil.copyfile(f"{pwd}/config.yaml.template", f"{pwd}/config.yaml")
-            with open(f"{pwd}/config.yaml", "rb") as fp:
+            shutil.copyfile(f"{self.PATH}.template", self.PATH)
+            with open(self.PATH, "rb") as fp:
                 yconfig = yaml.safe_load(fp)
 
         return yconfig
 
-    def reload(self) -> None:
-        yconfig = self._load_config()
-        logging.config.dictConfig(yconfig["logging"])
-        self.CITY_CODE = yconfig["weather"]["city_code"]
-        self.WEATHER = yconfig["weather"]["receivers"]
-        self.GROUPS = yconfig["groups"]["enable"]
-        self.NEWS = yconfig["news"]["receivers"]
-        self.REPORT_REMINDERS = yconfig["report_reminder"]["receivers"]
-
-        self.CHATGPT = yconfig.get("chatgpt", {})
-        self.OLLAMA = yconfig.get("ollama", {})
-        self.TIGERBOT = yconfig.get("tigerbot", {})
-        self.XINGHUO_WEB = yconfig.get("xinghuo_web", {})
-        self.CHATGLM = yconfig.get("chatglm", {})
-        self.BardAssistant = yconfig.get("bard", {})
-        self.ZhiPu = yconfig.get("zhipu", {})
-
-        self.SEND_RATE_LIMIT = yconfig.get("send_rate_limit", 0)
-        self.ROOTIDS = yconfig["roots"]["wxids"]
-        self.BOT_TEXT_FORWARD = yconfig["forward"]["receivers"]
-        # mysql
-        self.URL = yconfig['mysql']['url']
+    @staticmethod
+    def _parse(yconfig: dict) -> Dict[str, Tuple[str, Any]]:
+        """把配置解析成 {属性名: (所在的顶层配置项, 值)}"""
+        database = yconfig.get("mysql", {}) or {}
+        return {
+            "CITY_CODE": ("weather", yconfig["weather"]["city_code"]),
+            "WEATHER": ("weather", yconfig["weather"]["receivers"]),
+            # 只用来判断 in，预先转成 frozenset，处理消息时无需加锁
+            "GROUPS": ("groups", frozenset(yconfig["groups"]["enable"] or ())),
+            "NEWS": ("news", yconfig["news"]["receivers"]),
+            "REPORT_REMINDERS": ("report_reminder", yconfig["report_reminder"]["receivers"]),
+
+            "CHATGPT": ("chatgpt", yconfig.get("chatgpt", {})),
+            "OLLAMA": ("ollama", yconfig.get("ollama", {})),
+            "TIGERBOT": ("tigerbot", yconfig.get("tigerbot", {})),
+            "XINGHUO_WEB": ("xinghuo_web", yconfig.get("xinghuo_web", {})),
+            "CHATGLM": ("chatglm", yconfig.get("chatglm", {})),
+            "BardAssistant": ("bard", yconfig.get("bard", {})),
+            "ZhiPu": ("zhipu", yconfig.get("zhipu", {})),
+
+            "SEND_RATE_LIMIT": ("send_rate_limit", yconfig.get("send_rate_limit", 0)),
+            "CONTACTS": ("contacts", yconfig.get("contacts", {}) or {}),
+            "CHATROOM_CACHE": ("chatroom_cache", yconfig.get("chatroom_cache", {}) or {}),
+            "RATE_LIMIT": ("rate_limit", yconfig.get("rate_limit", {}) or {}),
+            "SEND_QUEUE": ("send_queue", yconfig.get("send_queue", {}) or {}),
+            "REPLY_COALESCE": ("reply_coalesce", yconfig.get("reply_coalesce", {}) or {}),
+            "DEDUP": ("dedup", yconfig.get("dedup", {}) or {}),
+            "DEBOUNCE": ("debounce", yconfig.get("debounce", {}) or {}),
+            "ASYNC_MODE": ("async_mode", yconfig.get("async_mode", {}) or {}),
+            "WORKER_POOL": ("worker_pool", yconfig.get("worker_pool", {}) or {}),
+            "METRICS": ("metrics", yconfig.get("metrics", {}) or {}),
+            "PROFILER": ("profiler", yconfig.get("profiler", {}) or {}),
+            "ACCOUNTS": ("accounts", yconfig.get("accounts", []) or []),
+            "SUPERVISOR": ("supervisor", yconfig.get("supervisor", {}) or {}),
+            "CONFIG_WATCH": ("config_watch", yconfig.get("config_watch", {}) or {}),
+            "ROOTIDS": ("roots", frozenset(yconfig["roots"]["wxids"] or ())),
+            "BOT_TEXT_FORWARD": ("forward", yconfig["forward"]["receivers"]),
+            # 数据库，未配置时使用项目目录下的 SQLite 文件
+            "URL": ("mysql", database.get("url") or "sqlite:///wcfrobot.db"),
+            "SQLITE": ("mysql", database.get("sqlite", {}) or {}),
+            "LEDGER": ("ledger", yconfig.get("ledger", {}) or {}),
+            "USER_CACHE": ("user_cache", yconfig.get("user_cache", {}) or {}),
+            "LEADERBOARD": ("leaderboard", yconfig.get("leaderboard", {}) or {}),
+            "HISTORY": ("history", yconfig.get("history", {}) or {}),
+            "STREAM": ("stream", yconfig.get("stream", {}) or {}),
+            "RESPONSE_CACHE": ("response_cache", yconfig.get("response_cache", {}) or {}),
+            "CONVERSATION": ("conversation", yconfig.get("conversation", {}) or {}),
+        }
+
+    def apply(self, yconfig: dict) -> Set[str]:
+        """
+        应用新的配置，只替换有变化的顶层配置项对应的属性
+        先解析完全部配置再一次性替换，解析出错时保持原配置；其他线程读到的要么全是旧值，要么全是新值
+        :return: 有变化的顶层配置项
+        """
+        with self._applyLock:
+            changed = {k for k in set(yconfig) | set(self._raw) if yconfig.get(k) != self._raw.get(k)}
+            if not changed and self._raw:
+                return changed
+            # 首次加载时文件中没有的配置项也要设置默认值
+            values = {attr: value for attr, (section, value) in self._parse(yconfig).items()
+                      if section in changed or attr not in self.__dict__}
+            # 日志配置没变时不重新 dictConfig，避免关闭再打开所有日志文件
+            if "logging" in changed:
+                logging.config.dictConfig(yconfig["logging"])
+            self.__dict__.update(values)
+            self._raw = copy.deepcopy(yconfig)
+            return changed
+
+    def reload(self) -> Set[str]:
+        """重新读取 config.yaml，返回有变化的顶层配置项"""
+        return self.apply(self._load_config())
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""机器人运行时的基础组件：消息分发、发送队列、限流等"""
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from wcferry import Wcf
+from wcferry.wcf_pb2 import RoomData
+
+
+class ChatroomMemberCache(object):
+    """群成员群昵称缓存
+
+    以群为单位批量加载：一次查询 ChatRoom.RoomData 拿到整个群的成员和群名片，
+    没有群名片的成员再一次性查询 Contact 昵称。之后 (roomid, wxid) 的查找都在内存中完成。
+    """
+
+    def __init__(self, wcf: Wcf, ttl: float = 600) -> None:
+        """
+        :param wcf: Wcf 客户端
+        :param ttl: 每个群缓存的有效期，秒
+        """
+        self.LOG = logging.getLogger("ChatroomMemberCache")
+        self.wcf = wcf
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # roomid: (加载时间, {wxid: 群昵称}, 查过但查不到的 wxid)
+        self._rooms: Dict[str, Tuple[float, Dict[str, str], Set[str]]] = {}
+        self._hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def _quote(s: str) -> str:
+        return "'" + s.replace("'", "''") + "'"
+
+    def _load_room(self, roomid: str) -> Dict[str, str]:
+        """一次性加载整个群的成员群昵称"""
+        members: Dict[str, str] = {}
+        crs = self.wcf.query_sql("MicroMsg.db",
+                                 f"SELECT RoomData FROM ChatRoom WHERE ChatRoomName = {self._quote(roomid)};")
+        bs = crs[0].get("RoomData") if crs else None
+        if not bs:
+            return members
+
+        crd = RoomData()
+        crd.ParseFromString(bs)
+        nameless = []
+        for member in crd.members:
+            members[member.wxid] = member.name
+            if not member.name:
+                nameless.append(member.wxid)
+
+        # 没有设置群名片的成员用微信昵称
+        if nameless:
+            ids = ",".join(self._quote(wxid) for wxid in nameless)
+            contacts = self.wcf.query_sql("MicroMsg.db",
+                                          f"SELECT UserName, NickName FROM Contact WHERE UserName IN ({ids});")
+            for contact in contacts:
+                members[contact["UserName"]] = contact["NickName"]
+
+        return members
+
+    def refresh(self, roomid: str) -> Dict[str, str]:
+        """重新加载一个群的成员，加载失败时不缓存，下次查询再试"""
+        try:
+            members = self._load_room(roomid)
+        except Exception as e:
+            self.LOG.error(f"加载群 {roomid} 成员失败：{e}")
+            return {}
+        with self._lock:
+            self._rooms[roomid] = (time.time(), members, set())
+            self._refreshes += 1
+        return members
+
+    def members(self, roomid: str) -> Dict[str, str]:
+        """
+        群成员 {wxid: 群昵称}，有效期内返回同一个对象，调用方不要修改
+        """
+        with self._lock:
+            room = self._rooms.get(roomid)
+            if room and time.time() - room[0] < self.ttl:
+                self._hits += 1
+                return room[1]
+            self._misses += 1
+        return self.refresh(roomid)
+
+    def get_alias(self, wxid: str, roomid: str) -> str:
+        """
+        获取群名片，参数顺序与 wcf.get_alias_in_chatroom 一致
+        :param wxid: 群成员 wxid
+        :param roomid: 群 id
+        :return: 群名片，没有则为微信昵称，查不到返回空字符串
+        """
+        now = time.time()
+        with self._lock:
+            room = self._rooms.get(roomid)
+            if room and now - room[0] < self.ttl:
+                if wxid in room[1]:
+                    self._hits += 1
+                    return room[1][wxid]
+                if wxid in room[2]:  # 本次加载后已经查过，查不到
+                    self._hits += 1
+                    return ""
+            self._misses += 1
+
+        fresh = room is not None and now - room[0] < self.ttl
+        if not fresh:
+            members = self.refresh(roomid)
+            if wxid in members:
+                return members[wxid]
+
+        # 刚进群还没同步到 RoomData 的成员，单独查一次
+        alias = self.wcf.get_alias_in_chatroom(wxid, roomid)
+        with self._lock:
+            room = self._rooms.get(roomid)
+            if room:
+                if alias:
+                    # 写时复制：换成新的名单，已经拿到旧名单的调用方（例如排行榜）不受影响，并能据此发现名单变了
+                    self._rooms[roomid] = (room[0], {**room[1], wxid: alias}, room[2])
+                else:  # 查不到的也记下，下次加载前不再查询
+                    room[2].add(wxid)
+        return alias
+
+    def invalidate(self, roomid: Optional[str] = None) -> None:
+        """使某个群（不传则全部）的缓存失效，下次查询时重新加载"""
+        with self._lock:
+            if roomid is None:
+                self._rooms.clear()
+            else:
+                self._rooms.pop(roomid, None)
+            self._invalidations += 1
+
+    def expire(self) -> None:
+        """清理过期的群，供定时任务调用"""
+        now = time.time()
+        with self._lock:
+            for roomid in [k for k, v in self._rooms.items() if now - v[0] >= self.ttl]:
+                del self._rooms[roomid]
+                self._invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rooms": len(self._rooms),
+                "members": sum(len(v[1]) for v in self._rooms.values()),
+                "hits": self._hits,
+                "misses": self._misses,
+                "refreshes": self._refreshes,
+                "invalidations": self._invalidations,
+            }
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from typing import Iterable, Iterator, List
+
+# 句子结束的标点；英文句号要后面跟空白才算，避免切开小数和网址
+SENTENCE_ENDS = frozenset("。！？!?；;…\n")
+# 紧跟在句末标点后面、应当留在同一句的字符
+CLOSERS = frozenset("”’」』）)】》\"'")
+
+
+class SentenceChunker(object):
+    """把流式输出的文本切成完整的句子或段落
+
+    累计长度达到 min_chars 后在下一个句子或段落结尾处切开；一直没有句末标点时在 max_chars 处强制切开。
+    切出的片段保留原文（包括换行），依次拼接就是完整的回答。
+    """
+
+    def __init__(self, min_chars: int = 50, max_chars: int = 1000) -> None:
+        """
+        :param min_chars: 片段的最小长度，太短的句子和后面的合在一起
+        :param max_chars: 片段的最大长度
+        """
+        self.min_chars = max(1, min_chars)
+        self.max_chars = max(self.min_chars, max_chars)
+        self._buf = ""
+        self._scanned = 0  # _buf 中已经确认没有切点的长度，避免每个 token 都从头扫描
+
+    def _cut(self) -> int:
+        """返回切点（片段结尾的下标），没有切点时返回 0"""
+        buf = self._buf
+        i = max(self._scanned, self.min_chars - 1)
+        while i < len(buf) and i < self.max_chars:
+            c = buf[i]
+            if c in SENTENCE_ENDS or (c == "." and i + 1 < len(buf) and buf[i + 1].isspace()):
+                j = i + 1
+                # 收尾的引号、标点留在本句，但片段不超过 max_chars
+                while j < min(len(buf), self.max_chars) and (buf[j] in CLOSERS or buf[j] in SENTENCE_ENDS):
+                    j += 1
+                if j == len(buf) and j < self.max_chars:  # 后面可能还有收尾的引号或标点，等下一个 token
+                    break
+                return j
+            i += 1
+        if len(buf) >= self.max_chars:
+            return self.max_chars
+        self._scanned = i
+        return 0
+
+    def feed(self, text: str) -> List[str]:
+        """
+        追加一段输出
+        :return: 已经完整的片段，可能为空
+        """
+        self._buf += text
+        chunks = []
+        cut = self._cut()
+        while cut:
+            chunks.append(self._buf[:cut])
+            self._buf = self._buf[cut:]
+            self._scanned = 0
+            cut = self._cut()
+        return chunks
+
+    def flush(self) -> str:
+        """输出结束，返回剩下的部分"""
+        rest, self._buf, self._scanned = self._buf, "", 0
+        return rest
+
+
+def chunk_stream(tokens: Iterable[str], min_chars: int = 50, max_chars: int = 1000) -> Iterator[str]:
+    """把 token 流切成句子或段落，见 SentenceChunker"""
+    chunker = SentenceChunker(min_chars, max_chars)
+    for token in tokens:
+        if token:
+            yield from chunker.feed(token)
+    rest = chunker.flush()
+    if rest:
+        yield rest
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from core.send_queue import SendQueue, SendTicket
+
+
+class _Pending(object):
+    __slots__ = ("at_list", "tickets", "length", "first", "deadline")
+
+    def __init__(self, at_list: str, now: float) -> None:
+        self.at_list = at_list
+        self.tickets: List[SendTicket] = []
+        self.length = 0
+        self.first = now
+        self.deadline = now
+
+
+class ReplyCoalescer(object):
+    """出站消息合并
+
+    同一接收人在 window 秒内连续发出的文本合并成一条再交给发送队列，
+    每条只付一次发送延迟和一个限流令牌。只合并 @ 名单相同的消息，@ 名单变化时先发出已缓存的部分，
+    保证被 @ 的人和消息内容的对应关系不变。
+    """
+
+    def __init__(self, queue: SendQueue, window: float = 0.5, max_wait: float = 2.0,
+                 max_length: int = 2000, separator: str = "\n\n") -> None:
+        """
+        :param queue: 合并后交给的发送队列
+        :param window: 距上一条多少秒内的消息会被合并，0 表示不合并
+        :param max_wait: 从缓存第一条开始最多等待的秒数
+        :param max_length: 合并后消息的最大长度（微信单条文本长度有限制）
+        :param separator: 合并时消息之间的分隔
+        """
+        self.LOG = logging.getLogger("ReplyCoalescer")
+        self.queue = queue
+        self.window = window
+        self.max_wait = max(window, max_wait)
+        self.max_length = max_length
+        self.separator = separator
+        self._pending: Dict[str, _Pending] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._received = 0
+        self._sent = 0
+
+    def start(self) -> None:
+        if self._running or self.window <= 0:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ReplyCoalescer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """发出所有缓存的消息后停止"""
+        if not self._running:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def put(self, msg: str, receiver: str, at_list: str = "") -> SendTicket:
+        """
+        消息入缓存，立即返回
+        :return: 发送句柄，合并后的消息发出时完成
+        """
+        if not self._running:
+            with self._cond:
+                self._received += 1
+                self._sent += 1
+            return self.queue.put(msg, receiver, at_list)
+
+        ticket = SendTicket(msg, receiver, at_list)
+        with self._cond:
+            self._received += 1
+            now = time.time()
+            p = self._pending.get(receiver)
+            if p is not None and (p.at_list != at_list or
+                                  p.length + len(self.separator) + len(msg) > self.max_length):
+                self._flush(receiver)
+                p = None
+            if p is None:
+                p = self._pending[receiver] = _Pending(at_list, now)
+                self._cond.notify()
+            elif p.tickets:
+                p.length += len(self.separator)
+            p.tickets.append(ticket)
+            p.length += len(msg)
+            p.deadline = min(now + self.window, p.first + self.max_wait)
+        return ticket
+
+    def flush(self, receiver: Optional[str] = None) -> None:
+        """立即发出缓存的消息，receiver 为空时发出全部"""
+        with self._cond:
+            for r in [receiver] if receiver else list(self._pending):
+                self._flush(r)
+
+    def _flush(self, receiver: str) -> None:
+        """调用方持有 self._cond"""
+        p = self._pending.pop(receiver, None)
+        if p is None or not p.tickets:
+            return
+        tickets = p.tickets
+        if len(tickets) == 1:
+            merged = self.queue.put(tickets[0].msg, receiver, p.at_list)
+        else:
+            merged = self.queue.put(self.separator.join(t.msg for t in tickets), receiver, p.at_list)
+        self._sent += 1
+        merged.add_done_callback(lambda m: [t.done(bool(m.ok)) for t in tickets])
+
+    def _run(self) -> None:
+        with self._cond:
+            while self._running or self._pending:
+                if not self._running:
+                    self.flush()
+                    break
+                now = time.time()
+                for receiver in [r for r, p in self._pending.items() if p.deadline <= now]:
+                    self._flush(receiver)
+                timeout = min((p.deadline for p in self._pending.values()), default=now + 1) - now
+                self._cond.wait(max(0.0, timeout))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "window": self.window,
+                "received": self._received,
+                "sent": self._sent,
+                "saved": self._received - self._sent,
+                "pending": sum(len(p.tickets) for p in self._pending.values()),
+            }
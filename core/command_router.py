@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import inspect
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 指令的前缀符号，消息首字符不在其中的直接走普通聊天
+COMMAND_FLAGS = ("#", "?", "？")
+
+
+class Command(object):
+    """一条机器人指令及其元数据，菜单和权限检查都来自这里"""
+
+    __slots__ = ("flag", "name", "handler", "desc", "cost", "admin_only", "prefix", "fallback", "hidden",
+                 "lane", "accept")
+
+    def __init__(self, flag: str, name: str, handler: Callable, desc: str = "", cost: int = 0,
+                 admin_only: bool = False, prefix: bool = False, fallback: bool = False,
+                 hidden: bool = False, lane: Optional[str] = None,
+                 accept: Optional[Callable[[str], bool]] = None) -> None:
+        self.flag = flag
+        self.name = name
+        self.handler = handler
+        self.desc = desc
+        self.cost = cost
+        self.admin_only = admin_only
+        self.prefix = prefix
+        self.fallback = fallback
+        self.hidden = hidden
+        self.lane = lane
+        self.accept = accept
+
+    @property
+    def trigger(self) -> str:
+        return f"{self.flag}{self.name}"
+
+    def __repr__(self):
+        return f"Command({self.trigger})"
+
+
+def command(trigger: str, desc: str = "", cost: int = 0, admin_only: bool = False,
+            prefix: bool = False, hidden: bool = False, lane: Optional[str] = None):
+    """
+    把方法注册为机器人指令
+    :param trigger: 完整指令，例如 "#菜单"；首字符为前缀符号
+    :param desc: 菜单中显示的说明
+    :param cost: 执行一次消耗的积分
+    :param admin_only: 是否只允许 ROOTIDS 使用
+    :param prefix: 是否按前缀匹配，例如 "#转发xxx"
+    :param hidden: 是否在菜单中隐藏
+    :param lane: 处理该指令的消息通道，None 表示默认的指令通道
+    """
+    flag, name = trigger[0], trigger[1:]
+    if flag not in COMMAND_FLAGS or not name:
+        raise ValueError(f"非法指令：{trigger}")
+
+    def decorator(func):
+        func.__dict__.setdefault("_commands", []).append(
+            dict(flag=flag, name=name, desc=desc, cost=cost, admin_only=admin_only, prefix=prefix, hidden=hidden,
+                 lane=lane))
+        return func
+
+    return decorator
+
+
+def command_fallback(*flags: str, desc: str = "", cost: int = 0, admin_only: bool = False,
+                     lane: Optional[str] = None, accept: Optional[Callable[[str], bool]] = None):
+    """
+    注册某个前缀符号的兜底处理，没有命中具体指令时调用
+    处理函数返回 False 表示不处理，消息继续按普通消息处理
+    :param flags: 前缀符号，例如 "?", "？"
+    :param desc: 菜单中显示的说明
+    :param lane: 处理该指令的消息通道
+    :param accept: 路由时判断参数是否由该兜底处理，返回 False 则视为普通消息
+    """
+    for flag in flags:
+        if flag not in COMMAND_FLAGS:
+            raise ValueError(f"非法指令前缀：{flag}")
+
+    def decorator(func):
+        func.__dict__.setdefault("_commands", []).extend(
+            dict(flag=flag, name="", desc=desc, cost=cost, admin_only=admin_only, fallback=True, lane=lane,
+                 accept=accept) for flag in flags)
+        return func
+
+    return decorator
+
+
+def on_msg_type(*msg_types: int):
+    """把方法注册为某些消息类型（msg.type）的处理函数"""
+
+    def decorator(func):
+        func.__dict__.setdefault("_msg_types", []).extend(msg_types)
+        return func
+
+    return decorator
+
+
+class CommandRouter(object):
+    """启动时构建一次的指令路由表
+
+    先用首字符判断是否可能是指令，不是则直接返回；是则按 指令全名 -> 前缀 -> 兜底 的顺序查表。
+    """
+
+    def __init__(self) -> None:
+        self._exact: Dict[str, Dict[str, Command]] = {flag: {} for flag in COMMAND_FLAGS}
+        self._prefix: Dict[str, Dict[str, Command]] = {flag: {} for flag in COMMAND_FLAGS}
+        self._prefix_lens: Dict[str, List[int]] = {flag: [] for flag in COMMAND_FLAGS}
+        self._fallback: Dict[str, Command] = {}
+        self._types: Dict[int, Callable] = {}
+        self._commands: List[Command] = []
+
+    @classmethod
+    def from_object(cls, obj: object) -> "CommandRouter":
+        """扫描对象上用 @command / @command_fallback / @on_msg_type 标记的方法，构建路由表"""
+        router = cls()
+        funcs = [f for _, f in inspect.getmembers(type(obj), inspect.isfunction)]
+        # 按定义顺序注册，菜单顺序与代码一致
+        for func in sorted(funcs, key=lambda f: f.__code__.co_firstlineno):
+            handler = getattr(obj, func.__name__)
+            for meta in func.__dict__.get("_commands", []):
+                router.add(Command(handler=handler, **meta))
+            for msg_type in func.__dict__.get("_msg_types", []):
+                router.add_type(msg_type, handler)
+        return router
+
+    def add(self, cmd: Command) -> None:
+        if cmd.fallback:
+            self._fallback[cmd.flag] = cmd
+        elif cmd.prefix:
+            self._prefix[cmd.flag][cmd.name] = cmd
+            self._prefix_lens[cmd.flag] = sorted({len(n) for n in self._prefix[cmd.flag]}, reverse=True)
+        else:
+            self._exact[cmd.flag][cmd.name] = cmd
+        self._commands.append(cmd)
+
+    def add_type(self, msg_type: int, handler: Callable) -> None:
+        self._types[msg_type] = handler
+
+    def match(self, content: str) -> Optional[Tuple[Command, str]]:
+        """
+        查找消息对应的指令
+        :param content: 消息内容
+        :return: (指令, 指令后面的参数)，没有命中返回 None
+        """
+        if not content or content[0] not in self._exact:
+            return None
+
+        flag, text = content[0], content[1:]
+        cmd = self._exact[flag].get(text)
+        if cmd:
+            return cmd, ""
+
+        prefixes = self._prefix[flag]
+        for n in self._prefix_lens[flag]:
+            cmd = prefixes.get(text[:n])
+            if cmd:
+                return cmd, text[n:]
+
+        cmd = self._fallback.get(flag)
+        if cmd and (cmd.accept is None or cmd.accept(text)):
+            return cmd, text
+        return None
+
+    def type_handler(self, msg_type: int) -> Optional[Callable]:
+        return self._types.get(msg_type)
+
+    def commands(self, include_admin: bool = False) -> List[Command]:
+        """菜单里展示的指令，按注册顺序"""
+        return [c for c in self._commands if not c.hidden and (include_admin or not c.admin_only)]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import threading
+from typing import Callable, Optional, Set, Tuple
+
+import yaml
+
+from configuration import Config
+
+
+class ConfigWatcher(object):
+    """监视 config.yaml，文件变化后在后台线程中解析、比较并应用有变化的配置
+
+    只比较文件的修改时间和大小，不依赖额外的库；解析失败（例如保存了一半）时保留原配置，下次变化再试。
+    """
+
+    def __init__(self, config: Config, on_change: Callable[[Set[str]], None], interval: float = 2.0) -> None:
+        """
+        :param config: 要更新的配置
+        :param on_change: 配置应用后的回调 on_change(有变化的顶层配置项)，在监视线程中调用
+        :param interval: 检查文件的间隔，秒
+        """
+        self.LOG = logging.getLogger("ConfigWatcher")
+        self.config = config
+        self.on_change = on_change
+        self.interval = interval
+        self._stat = self._read_stat()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.reloads = 0
+        self.errors = 0
+
+    def _read_stat(self) -> Optional[Tuple[float, int]]:
+        try:
+            st = os.stat(self.config.PATH)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ConfigWatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def check(self) -> Set[str]:
+        """文件有变化时重新加载，返回有变化的顶层配置项"""
+        stat = self._read_stat()
+        if stat is None or stat == self._stat:
+            return set()
+        self._stat = stat
+        try:
+            with open(self.config.PATH, "rb") as fp:
+                yconfig = yaml.safe_load(fp)
+            changed = self.config.apply(yconfig)
+        except Exception as e:
+            self.errors += 1
+            self.LOG.error(f"配置文件有误，继续使用原配置：{e}")
+            return set()
+        if changed:
+            self.reloads += 1
+            self.LOG.info(f"配置已更新：{', '.join(sorted(changed))}")
+            self.on_change(changed)
+        return changed
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.LOG.error(f"应用新配置出错：{e}")
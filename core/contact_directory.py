@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from wcferry import Wcf
+
+
+def _pack(items: List[bytes]) -> Tuple[bytes, array]:
+    """拼接成一个 bytes，返回 (数据, 每一项的起点，最后多一个总长度)"""
+    offsets = array("I", [0])
+    total = 0
+    for item in items:
+        total += len(item)
+        offsets.append(total)
+    return b"".join(items), offsets
+
+
+class _Snapshot(object):
+    """只读的联系人快照
+
+    wxid 和昵称按 wxid 排序，各自以 UTF-8 拼接成一个 bytes，用 array('I') 记录每一项的起点；
+    昵称前缀查找用按小写昵称排序的下标数组，比较时现算小写。每个联系人只占字节数加十几个字节的下标，
+    不像 {wxid: 昵称} 字典那样每个 wxid、昵称都是单独的 str 对象。构建后不再修改，读线程不需要加锁。
+    """
+
+    __slots__ = ("_ids", "_id_off", "_names", "_name_off", "_by_name")
+
+    def __init__(self, contacts: Dict[str, str]) -> None:
+        pairs = sorted(contacts.items())  # UTF-8 字节序与字符串的码点序一致，可以直接比较 bytes
+        self._ids, self._id_off = _pack([w.encode("utf-8") for w, _ in pairs])
+        self._names, self._name_off = _pack([n.encode("utf-8") for _, n in pairs])
+        self._by_name = array("I", sorted(range(len(pairs)), key=lambda i: pairs[i][1].lower()))
+
+    def __len__(self) -> int:
+        return len(self._id_off) - 1
+
+    def _id(self, i: int) -> bytes:
+        return self._ids[self._id_off[i]:self._id_off[i + 1]]
+
+    def _name(self, i: int) -> str:
+        return self._names[self._name_off[i]:self._name_off[i + 1]].decode("utf-8")
+
+    def _find(self, wxid: str) -> int:
+        """wxid 的下标，不存在时返回 -1"""
+        key = wxid.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self._id(lo) == key else -1
+
+    def __contains__(self, wxid: str) -> bool:
+        return self._find(wxid) >= 0
+
+    def get(self, wxid: str) -> Optional[str]:
+        i = self._find(wxid)
+        return self._name(i) if i >= 0 else None
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[str, str]]:
+        prefix = prefix.lower()
+        lo, hi = 0, len(self._by_name)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(self._by_name[mid]).lower() < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        res = []
+        while lo < len(self._by_name) and len(res) < limit:
+            pos = self._by_name[lo]
+            name = self._name(pos)
+            if not name.lower().startswith(prefix):
+                break
+            res.append((self._id(pos).decode("utf-8"), name))
+            lo += 1
+        return res
+
+    def to_dict(self) -> Dict[str, str]:
+        return {self._id(i).decode("utf-8"): self._name(i) for i in range(len(self))}
+
+
+class ContactDirectory(object):
+    """联系人目录
+
+    启动时在后台分页加载 MicroMsg.db 的 Contact 表，之后定时按 rowid 增量拉取新增联系人，
+    每隔若干次做一次全量比对以发现昵称修改和删除。查询走只读快照，不阻塞消息处理。
+    """
+
+    def __init__(self, wcf: Wcf, page_size: int = 5000, full_every: int = 12) -> None:
+        """
+        :param wcf: Wcf 客户端
+        :param page_size: 分页查询每页条数
+        :param full_every: 每多少次增量刷新做一次全量比对
+        """
+        self.LOG = logging.getLogger("ContactDirectory")
+        self.wcf = wcf
+        self.page_size = page_size
+        self.full_every = max(1, full_every)
+        self.ready = threading.Event()
+        self._snapshot = _Snapshot({})
+        self._recent: Dict[str, str] = {}  # 快照之后新增/修改的联系人，下次重建快照时合并
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()
+        self._max_rowid = 0
+        self._count = 0
+        self._refreshes = 0
+        self._full_loads = 0
+        self._load_seconds = 0.0
+
+    def start(self) -> None:
+        """后台加载，立即返回"""
+        self.refresh_async(full=True)
+
+    def _query(self, sql: str) -> List[Dict[str, Any]]:
+        return self.wcf.query_sql("MicroMsg.db", sql) or []
+
+    def _fetch_since(self, rowid: int) -> Tuple[Dict[str, str], int]:
+        """分页拉取 rowid 之后的联系人"""
+        contacts = {}
+        while True:
+            rows = self._query(f"SELECT rowid, UserName, NickName FROM Contact WHERE rowid > {rowid} "
+                               f"ORDER BY rowid LIMIT {self.page_size};")
+            for row in rows:
+                contacts[row["UserName"]] = row["NickName"] or ""
+            if len(rows) < self.page_size:
+                break
+            rowid = rows[-1]["rowid"]
+        if rows:
+            rowid = max(rowid, rows[-1]["rowid"])
+        return contacts, rowid
+
+    def _stat(self) -> Tuple[int, int]:
+        rows = self._query("SELECT COUNT(*) AS n, MAX(rowid) AS m FROM Contact;")
+        if not rows:
+            return 0, 0
+        return int(rows[0]["n"] or 0), int(rows[0]["m"] or 0)
+
+    def refresh(self, full: bool = False) -> None:
+        """
+        刷新联系人
+        :param full: 是否全量重新加载
+        """
+        if not self._loading.acquire(blocking=False):
+            return  # 已有刷新在进行
+        start = time.time()
+        try:
+            count, max_rowid = self._stat()
+            self._refreshes += 1
+            if count != self._count and max_rowid == self._max_rowid:
+                full = True  # 有删除
+            if full or self._refreshes % self.full_every == 0:
+                contacts, max_rowid = self._fetch_since(0)
+                with self._lock:
+                    self._snapshot = _Snapshot(contacts)
+                    self._recent.clear()
+                self._full_loads += 1
+            elif max_rowid > self._max_rowid:
+                contacts, max_rowid = self._fetch_since(self._max_rowid)
+                with self._lock:
+                    self._recent.update(contacts)
+                    if len(self._recent) > self.page_size:
+                        self._rebuild()
+            self._max_rowid, self._count = max_rowid, count
+            self.ready.set()
+        except Exception as e:
+            self.LOG.error(f"刷新联系人失败：{e}")
+        finally:
+            self._load_seconds = time.time() - start
+            self._loading.release()
+
+    def refresh_async(self, full: bool = False) -> None:
+        """在后台线程中刷新，供启动和定时任务调用"""
+        threading.Thread(target=self.refresh, name="ContactDirectory", args=(full,), daemon=True).start()
+
+    def _rebuild(self) -> None:
+        """合并增量到新快照，调用方持有 self._lock"""
+        contacts = self._snapshot.to_dict()
+        contacts.update(self._recent)
+        self._snapshot = _Snapshot(contacts)
+        self._recent.clear()
+
+    def add(self, wxid: str, nickname: str) -> None:
+        """新增或更新一个联系人，例如刚通过的好友"""
+        with self._lock:
+            self._recent[wxid] = nickname
+
+    def get(self, wxid: str, default: Optional[str] = None) -> Optional[str]:
+        """按 wxid 查昵称"""
+        name = self._recent.get(wxid)
+        if name is not None:
+            return name
+        name = self._snapshot.get(wxid)
+        return default if name is None else name
+
+    def search(self, prefix: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """
+        按昵称前缀查找（不区分大小写）
+        :return: [(wxid, 昵称), ...]
+        """
+        res = self._snapshot.search(prefix, limit)
+        lower = prefix.lower()
+        seen = {wxid for wxid, _ in res}
+        for wxid, name in list(self._recent.items()):
+            if len(res) >= limit:
+                break
+            if wxid not in seen and name.lower().startswith(lower):
+                res.append((wxid, name))
+        return res
+
+    def to_dict(self) -> Dict[str, str]:
+        """导出为 {wxid: 昵称}，会复制全部联系人，不要在热路径上调用"""
+        with self._lock:
+            contacts = self._snapshot.to_dict()
+            contacts.update(self._recent)
+        return contacts
+
+    def __contains__(self, wxid: str) -> bool:
+        return self.get(wxid) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            snapshot = self._snapshot
+            return len(snapshot) + sum(1 for wxid in self._recent if wxid not in snapshot)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready.is_set(),
+            "contacts": len(self._snapshot),
+            "recent": len(self._recent),
+            "max_rowid": self._max_rowid,
+            "refreshes": self._refreshes,
+            "full_loads": self._full_loads,
+            "last_load_seconds": round(self._load_seconds, 3),
+        }
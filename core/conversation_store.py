@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中文等非 ASCII 字符按一个 token，ASCII 按四个字符一个 token"""
+    ascii_chars = sum(1 for c in text if c < "\x80")
+    return len(text) - ascii_chars + (ascii_chars + 3) // 4
+
+
+def _field(message: Any, name: str) -> Any:
+    """消息可能是 dict，也可能是 SDK 返回的对象（ChatGLM 工具模式）"""
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+def _size(value: Any) -> Any:
+    """对话的长度，变化时才需要重新裁剪"""
+    if isinstance(value, dict):
+        return tuple(len(v) if isinstance(v, list) else 0 for v in value.values())
+    return len(value) if isinstance(value, list) else 0
+
+
+def _to_json(obj: Any) -> Any:
+    """SDK 返回的消息对象转成 dict 再保存"""
+    for name in ("model_dump", "to_dict_recursive", "to_dict"):
+        if hasattr(obj, name):
+            return getattr(obj, name)()
+    return str(obj)
+
+
+class ConversationStore(object):
+    """所有模型共用的对话记录
+
+    各模型通过 namespace(模型名) 得到一个像 dict 一样使用的视图，键为 wxid 或 roomid。
+    - 内存中最多保留 max_conversations 个对话，超出时把最久未使用的写到 spill_dir，下次用到时再读回；
+      闲置超过 idle_seconds 的对话由 expire 定时写出。没有配置 spill_dir 时直接丢弃。
+    - 每个对话最多保留 max_turns 轮、约 max_tokens 个 token，超出时从最早的一轮整轮删起，开头的系统消息保留；
+      一轮从用户消息开始，包括之后的回答和工具调用、工具结果，不会只删掉工具调用而留下它的结果。
+      Ollama 保存的是 token 上下文，超出时整个对话重新开始。
+    - 只在对话有变化（写入或追加了消息）后的下一次读写时裁剪，反复读取同一个对话不会重新扫描。
+    """
+
+    def __init__(self, max_conversations: int = 1000, max_turns: int = 20, max_tokens: int = 4000,
+                 idle_seconds: float = 1800, spill_dir: Optional[str] = None, spill_days: float = 7) -> None:
+        self.LOG = logging.getLogger("ConversationStore")
+        # (模型, 键): [对话, 最后使用时间, 上次裁剪后的长度]
+        self._items: "OrderedDict[Tuple[str, str], List[Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._spilled = 0
+        self._loaded = 0
+        self._dropped = 0
+        self._trimmed = 0
+        self._resets = 0
+        self.configure(max_conversations, max_turns, max_tokens, idle_seconds, spill_dir, spill_days)
+
+    def configure(self, max_conversations: int = 1000, max_turns: int = 20, max_tokens: int = 4000,
+                  idle_seconds: float = 1800, spill_dir: Optional[str] = None, spill_days: float = 7) -> None:
+        """
+        :param max_conversations: 内存中最多保留的对话数
+        :param max_turns: 每个对话最多保留的轮数（一问一答为一轮），0 表示不限制
+        :param max_tokens: 每个对话最多保留的 token 数（估计值），0 表示不限制
+        :param idle_seconds: 闲置超过该秒数的对话移出内存
+        :param spill_dir: 移出内存的对话写到这个目录，为空时直接丢弃
+        :param spill_days: 写出后超过该天数没有再用到的对话文件由 expire 删除
+        """
+        with self._lock:
+            self.max_conversations = max(1, max_conversations)
+            self.max_turns = max_turns
+            self.max_tokens = max_tokens
+            self.idle_seconds = idle_seconds
+            self.spill_dir = spill_dir or None
+            self.spill_days = spill_days
+            self._evict()
+
+    def namespace(self, name: str) -> "ConversationView":
+        return ConversationView(self, name)
+
+    def _path(self, ns: str, key: str) -> str:
+        return os.path.join(self.spill_dir, ns, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _trim(self, ns: str, key: str, value: Any) -> bool:
+        """按轮数和 token 数裁剪对话，返回 False 表示对话需要重新开始"""
+        if isinstance(value, list):
+            if value and isinstance(value[0], int):  # Ollama 的 token 上下文无法从中间截断
+                if self.max_tokens and len(value) > self.max_tokens:
+                    self._resets += 1
+                    self.LOG.info(f"{ns} 对话 {key} 超过 {self.max_tokens} token，重新开始")
+                    return False
+                return True
+            self._trim_messages(value)
+        elif isinstance(value, dict):  # ChatGLM：{模式: 消息列表}
+            for messages in value.values():
+                if isinstance(messages, list):
+                    self._trim_messages(messages)
+        return True
+
+    def _trim_messages(self, messages: List[Any]) -> None:
+        head = 0
+        while head < len(messages) and _field(messages[head], "role") == "system":
+            head += 1
+        # 按轮分组：每轮从用户消息开始，工具调用和结果跟着所在的轮一起删
+        starts = [i for i in range(head, len(messages)) if i == head or _field(messages[i], "role") == "user"]
+        drop = 0  # 要删掉的轮数
+        if self.max_turns:
+            drop = max(0, len(starts) - self.max_turns)
+        if self.max_tokens and drop < len(starts) - 1:
+            base = starts[drop]
+            sizes = [estimate_tokens(str(_field(m, "content") or "")) for m in messages[base:]]
+            total = sum(sizes)
+            ends = starts[1:] + [len(messages)]
+            while total > self.max_tokens and drop < len(starts) - 1:  # 至少保留最新的一轮
+                total -= sum(sizes[starts[drop] - base:ends[drop] - base])
+                drop += 1
+        if drop:
+            end = starts[drop] if drop < len(starts) else len(messages)
+            del messages[head:end]
+            self._trimmed += end - head
+
+    def _spill(self, ns: str, key: str, value: Any) -> None:
+        """调用方持有 self._lock"""
+        if not self.spill_dir:
+            self._dropped += 1
+            return
+        path = self._path(ns, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fp:
+                json.dump({"key": key, "value": value}, fp, ensure_ascii=False, default=_to_json)
+            os.replace(tmp, path)
+            self._spilled += 1
+        except Exception as e:
+            self._dropped += 1
+            self.LOG.error(f"保存 {ns} 对话 {key} 失败：{e}")
+
+    def _load(self, ns: str, key: str) -> Optional[Any]:
+        """从 spill_dir 读回对话，读回后删除文件"""
+        if not self.spill_dir:
+            return None
+        path = self._path(ns, key)
+        try:
+            with open(path, "r", encoding="utf-8") as fp:
+                value = json.load(fp)["value"]
+            os.remove(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.LOG.error(f"读取 {ns} 对话 {key} 失败：{e}")
+            return None
+        self._loaded += 1
+        return value
+
+    def _evict(self) -> None:
+        """调用方持有 self._lock"""
+        while len(self._items) > self.max_conversations:
+            (ns, key), (value, _, _) = self._items.popitem(last=False)
+            self._spill(ns, key, value)
+
+    def get(self, ns: str, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get((ns, key))
+            if item is None:
+                value = self._load(ns, key)
+                if value is None:
+                    return None
+                item = self._items[(ns, key)] = [value, 0.0, None]
+                self._evict()
+            if _size(item[0]) != item[2]:  # 上次读取后追加了消息
+                if not self._trim(ns, key, item[0]):
+                    del self._items[(ns, key)]
+                    return None
+                item[2] = _size(item[0])
+            item[1] = time.time()
+            self._items.move_to_end((ns, key))
+            return item[0]
+
+    def set(self, ns: str, key: str, value: Any) -> None:
+        with self._lock:
+            if not self._trim(ns, key, value):
+                self.delete(ns, key)
+                return
+            self._items[(ns, key)] = [value, time.time(), _size(value)]
+            self._items.move_to_end((ns, key))
+            self._evict()
+
+    def delete(self, ns: str, key: str) -> bool:
+        with self._lock:
+            found = self._items.pop((ns, key), None) is not None
+            if self.spill_dir:
+                try:
+                    os.remove(self._path(ns, key))
+                    found = True
+                except FileNotFoundError:
+                    pass
+            return found
+
+    def contains(self, ns: str, key: str) -> bool:
+        with self._lock:
+            if (ns, key) in self._items:
+                return True
+            return bool(self.spill_dir) and os.path.exists(self._path(ns, key))
+
+    def keys(self, ns: str) -> List[str]:
+        """内存中的对话，已写出的不包括在内"""
+        with self._lock:
+            return [k for n, k in self._items if n == ns]
+
+    def expire(self) -> int:
+        """把闲置的对话移出内存，删除过期的对话文件；返回移出的个数"""
+        now = time.time()
+        with self._lock:
+            idle = [k for k, (_, used, _) in self._items.items() if now - used >= self.idle_seconds]
+            for ns, key in idle:
+                self._spill(ns, key, self._items.pop((ns, key))[0])
+        if self.spill_dir and self.spill_days:
+            self._remove_old_files(now - self.spill_days * 86400)
+        return len(idle)
+
+    def _remove_old_files(self, before: float) -> None:
+        for root, _, files in os.walk(self.spill_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < before:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def spill_all(self) -> None:
+        """退出前把内存中的对话全部写出，重启后可以继续"""
+        if not self.spill_dir:
+            return
+        with self._lock:
+            while self._items:
+                (ns, key), (value, _, _) = self._items.popitem(last=False)
+                self._spill(ns, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "spilled": self._spilled,
+                "loaded": self._loaded,
+                "dropped": self._dropped,
+                "trimmed": self._trimmed,
+                "resets": self._resets,
+            }
+
+
+class ConversationView(MutableMapping):
+    """某个模型的对话记录，用法和原来的 conversation_list 字典一样"""
+
+    def __init__(self, store: ConversationStore, ns: str) -> None:
+        self.store = store
+        self.ns = ns
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.store.get(self.ns, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.store.set(self.ns, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        if not self.store.delete(self.ns, key):
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.store.contains(self.ns, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store.keys(self.ns))
+
+    def __len__(self) -> int:
+        return len(self.store.keys(self.ns))
+
+
+# 所有模型共用，Robot 启动时按配置调用 configure
+CONVERSATIONS = ConversationStore()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import time
+
+
+class Coordinator(object):
+    """多进程协调：同一时段的任务只让一个进程执行
+
+    用 O_CREAT | O_EXCL 在共享目录创建认领文件，创建成功的进程执行任务，其他进程跳过。
+    不依赖进程间通信，worker 重启后也不会重复执行已认领的任务。
+    """
+
+    def __init__(self, shared_dir: str, owner: str, keep_days: int = 2) -> None:
+        """
+        :param shared_dir: 所有进程共享的目录
+        :param owner: 当前进程标识，例如账号名，写入认领文件便于排查
+        :param keep_days: 认领文件保留天数
+        """
+        self.LOG = logging.getLogger("Coordinator")
+        self.dir = os.path.join(shared_dir, "claims")
+        self.owner = owner
+        self.keep_days = keep_days
+        os.makedirs(self.dir, exist_ok=True)
+
+    def claim(self, name: str, period: str = "%Y%m%d%H%M") -> bool:
+        """
+        认领任务
+        :param name: 任务名
+        :param period: 时段格式，同一时段内只有一个进程能认领成功，默认按分钟
+        :return: 是否由当前进程执行
+        """
+        path = os.path.join(self.dir, f"{name}-{time.strftime(period)}")
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            self.LOG.info(f"{name} 已由其他账号执行")
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            fp.write(self.owner)
+        self._cleanup()
+        return True
+
+    def _cleanup(self) -> None:
+        deadline = time.time() - self.keep_days * 86400
+        for f in os.listdir(self.dir):
+            path = os.path.join(self.dir, f)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+            except OSError:
+                pass
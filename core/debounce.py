@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class _Burst(object):
+    __slots__ = ("msgs", "first", "deadline")
+
+    def __init__(self, msg: Any, now: float) -> None:
+        self.msgs: List[Any] = [msg]
+        self.first = now
+        self.deadline = now
+
+
+class MsgDebouncer(object):
+    """入站消息防抖
+
+    用户常把一个问题拆成几条连发。同一个人在同一个群（或私聊）里的闲聊消息先缓存，
+    安静 quiet 秒后把这一串拼成一条，只调用一次大模型、只扣一次积分。
+    """
+
+    def __init__(self, on_flush: Callable[[Any], Any], quiet: float = 1.0, max_wait: float = 5.0,
+                 max_parts: int = 5, joiner: str = "\n") -> None:
+        """
+        :param on_flush: 合并后的消息回调 on_flush(msg)，在防抖线程中调用
+        :param quiet: 最后一条消息之后安静多少秒才处理，0 表示不防抖
+        :param max_wait: 从第一条开始最多等待的秒数
+        :param max_parts: 最多合并的条数，达到后立即处理
+        :param joiner: 拼接消息内容的分隔
+        """
+        self.LOG = logging.getLogger("MsgDebouncer")
+        self.on_flush = on_flush
+        self.quiet = quiet
+        self.max_wait = max(quiet, max_wait)
+        self.max_parts = max(1, max_parts)
+        self.joiner = joiner
+        self._bursts: Dict[str, _Burst] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._held = 0
+        self._flushed = 0  # 合并后交给 on_flush 的条数
+        self._merged = 0  # 被合并的原始消息条数
+
+    def start(self) -> None:
+        if self._running or self.quiet <= 0:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="MsgDebouncer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """处理完缓存的消息后停止"""
+        if not self._running:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @staticmethod
+    def key(msg: Any) -> str:
+        return f"{msg.roomid}|{msg.sender}" if msg.from_group() else msg.sender
+
+    def hold(self, msg: Any, start: bool) -> bool:
+        """
+        尝试缓存一条消息
+        :param start: 没有进行中的缓存时是否开始缓存，例如群里 @ 机器人的闲聊；
+                      为 False 时只追加到已有的缓存，例如同一个人紧接着发的、没有 @ 的后半句
+        :return: 是否已缓存，False 时调用方照常处理
+        """
+        if not self._running:
+            return False
+        key = self.key(msg)
+        now = time.time()
+        with self._cond:
+            burst = self._bursts.get(key)
+            if burst is None:
+                if not start:
+                    return False
+                burst = self._bursts[key] = _Burst(msg, now)
+                self._cond.notify()
+            else:
+                burst.msgs.append(msg)
+            self._held += 1
+            burst.deadline = min(now + self.quiet, burst.first + self.max_wait)
+            if len(burst.msgs) >= self.max_parts:
+                burst.deadline = now
+                self._cond.notify()
+        return True
+
+    def _merge(self, msgs: List[Any]) -> Any:
+        """沿用第一条消息（保留 @ 信息），内容按顺序拼接"""
+        first = msgs[0]
+        if len(msgs) > 1:
+            first.content = self.joiner.join(m.content for m in msgs)
+        return first
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                now = time.time()
+                due = [k for k, b in self._bursts.items() if b.deadline <= now or not self._running]
+                if not due:
+                    if not self._running:
+                        return
+                    timeout = min((b.deadline for b in self._bursts.values()), default=now + 1) - now
+                    self._cond.wait(max(0.0, timeout))
+                    continue
+                bursts = [self._bursts.pop(k) for k in due]
+                self._flushed += len(bursts)
+                self._merged += sum(len(b.msgs) for b in bursts)
+
+            for b in bursts:
+                try:
+                    self.on_flush(self._merge(b.msgs))
+                except Exception as e:
+                    self.LOG.error(f"处理合并后的消息出错：{e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "quiet": self.quiet,
+                "held": self._held,
+                "flushed": self._flushed,
+                "saved": self._merged - self._flushed,
+                "pending": len(self._bursts),
+            }
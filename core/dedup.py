@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class MsgDeduplicator(object):
+    """按消息 id 去重
+
+    环形缓冲区 + 哈希表：最多记住 capacity 个 id，超出时覆盖最早的记录，
+    内存占用固定，与消息量无关。window 秒之前见过的 id 视为新消息。
+    """
+
+    def __init__(self, capacity: int = 10000, window: float = 600) -> None:
+        """
+        :param capacity: 最多记住的消息 id 数
+        :param window: 去重时间窗口，秒，0 表示只受 capacity 限制
+        """
+        self.capacity = max(1, int(capacity))
+        self.window = window
+        self._ring: List[Optional[Hashable]] = [None] * self.capacity
+        self._seen: Dict[Hashable, float] = {}  # id: 首次见到的时间
+        self._pos = 0
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._duplicates = 0
+
+    def seen(self, msg_id: Hashable) -> bool:
+        """
+        检查并记录消息 id
+        :return: 是否为窗口内重复的消息
+        """
+        now = time.time()
+        with self._lock:
+            self._checked += 1
+            ts = self._seen.get(msg_id)
+            if ts is not None:
+                if not self.window or now - ts <= self.window:
+                    self._duplicates += 1
+                    return True
+                self._seen[msg_id] = now  # 超出窗口，视为新消息，沿用原来的槽位
+                return False
+
+            old = self._ring[self._pos]
+            if old is not None:
+                del self._seen[old]
+            self._ring[self._pos] = msg_id
+            self._seen[msg_id] = now
+            self._pos = (self._pos + 1) % self.capacity
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "window": self.window,
+                "size": len(self._seen),
+                "checked": self._checked,
+                "duplicates": self._duplicates,
+            }
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# 默认的耗时分桶，单位秒，覆盖从微秒级的查表到分钟级的大模型调用
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelValues = Tuple[str, ...]
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = ['%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " "))
+             for k, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter(object):
+    """只增不减的计数器"""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, v in items:
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {v}")
+        return lines
+
+
+class Histogram(object):
+    """固定分桶的直方图，每次记录只做一次二分查找和几次加法"""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # 标签值: [各桶计数..., +Inf 计数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                v = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            v[idx] += 1
+            v[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self) -> Dict[LabelValues, Tuple[List[float], float]]:
+        with self._lock:
+            return {k: (list(v[:-1]), v[-1]) for k, v in self._values.items()}
+
+    def quantile(self, q: float, counts: List[float]) -> float:
+        """按分桶估算分位数，返回所在桶的上界"""
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank, acc = q * total, 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self.snapshot().items():
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                le_label = 'le="%s"' % le
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, le_label)} {acc}")
+            acc += counts[-1]
+            inf_label = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, inf_label)} {acc}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {acc}")
+        return lines
+
+
+class Gauge(object):
+    """瞬时值，抓取时调用回调获取，回调返回 数值 或 {标签值元组: 数值}"""
+
+    def __init__(self, name: str, help: str, func: Callable[[], Any], labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.func = func
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.func()
+        except Exception as e:
+            logging.getLogger("Metrics").error(f"采集 {self.name} 出错：{e}")
+            return []
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, v in items:
+            labels = labels if isinstance(labels, tuple) else (labels,)
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {v}")
+        return lines
+
+
+class MetricsRegistry(object):
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_add(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = factory()
+            return m
+
+    def counter(self, name: str, help: str = "", labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._get_or_add(name, lambda: Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str = "", labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_add(name, lambda: Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, func: Callable[[], Any], labelnames: Tuple[str, ...] = ()) -> Gauge:
+        """注册回调型指标，同名的会被替换"""
+        g = Gauge(name, help, func, labelnames)
+        with self._lock:
+            self._metrics[name] = g
+        return g
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """一行摘要：每个直方图的次数、平均耗时和 p95"""
+        with self._lock:
+            hists = [m for m in self._metrics.values() if isinstance(m, Histogram)]
+        parts = []
+        for h in hists:
+            for labels, (counts, total) in sorted(h.snapshot().items()):
+                n = sum(counts)
+                if not n:
+                    continue
+                name = h.name + (f"[{','.join(labels)}]" if labels else "")
+                parts.append(f"{name} n={int(n)} avg={total / n * 1000:.1f}ms p95<={h.quantile(0.95, counts)}s")
+        return "; ".join(parts)
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("wcfrobot_stage_seconds", "各处理阶段耗时", ("stage",))
+LLM_SECONDS = REGISTRY.histogram("wcfrobot_llm_seconds", "大模型 get_answer 耗时", ("provider",))
+LLM_FIRST_SECONDS = REGISTRY.histogram("wcfrobot_llm_first_message_seconds", "流式回复时第一条消息入队前的耗时",
+                                       ("provider",))
+DB_SECONDS = REGISTRY.histogram("wcfrobot_db_seconds", "数据库操作耗时", ("op",))
+SEND_SECONDS = REGISTRY.histogram("wcfrobot_send_seconds", "发送各阶段耗时", ("phase",))
+MESSAGES = REGISTRY.counter("wcfrobot_messages_total", "收到的消息数", ("lane",))
+ERRORS = REGISTRY.counter("wcfrobot_errors_total", "处理出错次数", ("where",))
+
+
+def timed(hist: Histogram, *labels: str):
+    """装饰器：记录函数耗时到直方图"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start, *labels)
+
+        return wrapper
+
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 不打印每次抓取的访问日志
+
+
+def start_http_server(port: int = 9108, host: str = "127.0.0.1",
+                      registry: MetricsRegistry = REGISTRY) -> Optional[ThreadingHTTPServer]:
+    """在后台线程启动 /metrics 接口，默认只监听本机"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logging.getLogger("Metrics").error(f"启动指标接口失败 {host}:{port}：{e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="MetricsHTTP", daemon=True).start()
+    logging.getLogger("Metrics").info(f"指标接口：http://{host}:{port}/metrics")
+    return server
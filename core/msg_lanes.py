@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from core.metrics import MESSAGES
+from core.worker_pool import MsgWorkerPool
+
+# 消息通道，按优先级从高到低
+LANE_ADMIN = "admin"  # ROOTIDS 发来的消息
+LANE_COMMAND = "command"  # 普通指令、好友请求、系统消息等处理很快的消息
+LANE_CHENGYU = "chengyu"  # 成语接龙
+LANE_CHAT = "chat"  # 需要调用大模型的闲聊
+LANES = (LANE_ADMIN, LANE_COMMAND, LANE_CHENGYU, LANE_CHAT)
+
+# 各通道默认配置，可在 config.yaml 的 worker_pool.lanes 中覆盖
+DEFAULT_LANES = {
+    LANE_ADMIN: {"workers": 1, "queue_size": 50, "policy": "block", "put_timeout": 1, "max_age": 0},
+    LANE_COMMAND: {"workers": 2, "queue_size": 100, "policy": "drop_oldest", "max_age": 30},
+    # 成语接龙的上下文按文件保存，默认单线程处理
+    LANE_CHENGYU: {"workers": 1, "queue_size": 100, "policy": "reject", "max_age": 60},
+    LANE_CHAT: {"workers": 8, "queue_size": 50, "policy": "reject", "max_age": 120},
+}
+
+
+class MsgLanes(object):
+    """按通道分流的入站消息队列
+
+    每个通道是一个独立的按会话分片的线程池，队列有界并有各自的丢弃策略，
+    大模型闲聊排满时不会拖慢 #积分、#菜单 等指令，管理员的消息也有专用线程。
+    同一通道内同一会话的消息保持顺序；不同通道之间不保证顺序。
+    """
+
+    def __init__(self, handler: Callable[[Any], Any], classify: Callable[[Any], Optional[str]],
+                 key: Callable[[Any], str], conf: Optional[Dict[str, Dict]] = None,
+                 on_shed: Optional[Callable[[Any, str, str], Any]] = None) -> None:
+        """
+        :param handler: 消息处理函数
+        :param classify: 返回消息所属通道，返回 None 表示消息无需处理
+        :param key: 返回消息的会话 key
+        :param conf: 各通道配置 {通道: {workers, queue_size, policy, put_timeout, max_age}}
+        :param on_shed: 消息被丢弃时的回调 on_shed(消息, 通道, 原因)
+        """
+        self.LOG = logging.getLogger("MsgLanes")
+        self.classify = classify
+        self.key = key
+        self.on_shed = on_shed
+        self._ignored = 0
+        conf = conf or {}
+        self.pools: Dict[str, MsgWorkerPool] = {}
+        for lane in LANES:
+            c = {**DEFAULT_LANES[lane], **(conf.get(lane) or {})}
+            self.pools[lane] = MsgWorkerPool(handler,
+                                             workers=c.get("workers", 1),
+                                             queue_size=c.get("queue_size", 100),
+                                             put_timeout=c.get("put_timeout", 1),
+                                             policy=c.get("policy", "block"),
+                                             max_age=c.get("max_age", 0),
+                                             on_shed=self._shed_callback(lane),
+                                             name=f"Lane-{lane}")
+
+    def _shed_callback(self, lane: str) -> Optional[Callable[[Any, str], Any]]:
+        if not self.on_shed:
+            return None
+        return lambda item, reason: self.on_shed(item, lane, reason)
+
+    def start(self, lanes=LANES) -> None:
+        """
+        启动通道线程池
+        :param lanes: 要启动的通道，asyncio 模式下闲聊通道不使用线程池
+        """
+        for lane in lanes:
+            self.pools[lane].start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        for pool in self.pools.values():
+            pool.stop(timeout)
+
+    def submit(self, msg: Any, lane: Optional[str] = None) -> bool:
+        """
+        按通道提交消息
+        :param lane: 已知的通道，不传则调用 classify 分类
+        :return: 是否入队，无需处理或被丢弃时为 False
+        """
+        lane = lane or self.classify(msg)
+        if lane is None:
+            self.ignore()
+            return False
+        MESSAGES.inc(1, lane)
+        return self.pools[lane].submit(self.key(msg), msg)
+
+    def ignore(self) -> None:
+        """记录一条调用方已判定无需处理的消息"""
+        MESSAGES.inc(1, "ignored")
+        self._ignored += 1
+
+    def stats(self) -> Dict[str, Any]:
+        res: Dict[str, Any] = {lane: pool.stats() for lane, pool in self.pools.items()}
+        res["ignored"] = self._ignored
+        return res
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# 线程阻塞等待时停留的栈顶函数，汇总时不算作热点（折叠栈文件中仍然保留）
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("queue.py", "put"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+    ("base_events.py", "_run_once"),
+    # time.sleep 没有 Python 栈帧，停在调用方
+    ("robot.py", "keepRunningAndBlockProcess"),
+    ("send_queue.py", "_delay"),
+}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler(object):
+    """采样分析器
+
+    在独立线程中每隔 interval 秒用 sys._current_frames() 抓取所有线程的调用栈，
+    不需要预先插桩，也不需要挂调试器。结果写成折叠栈文件，可以直接交给
+    flamegraph.pl 或 speedscope 生成火焰图。
+    """
+
+    def __init__(self, interval: float = 0.005, out_dir: str = "profile") -> None:
+        """
+        :param interval: 采样间隔，秒
+        :param out_dir: 结果文件目录
+        """
+        self.interval = max(0.001, interval)
+        self.out_dir = out_dir
+        self._running = threading.Lock()
+
+    def busy(self) -> bool:
+        return self._running.locked()
+
+    @staticmethod
+    def _sample(stacks: Counter, own: int) -> None:
+        """抓取一次所有线程的调用栈，跳过分析器自身"""
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(frame.f_code)
+                frame = frame.f_back
+            labels.reverse()
+            stacks[(names.get(ident, str(ident)), tuple(labels))] += 1
+
+    def run(self, seconds: float, trace_memory: bool = False, top: int = 10) -> Dict[str, Any]:
+        """
+        阻塞运行 seconds 秒，应在后台线程中调用
+        :param seconds: 采样时长，秒
+        :param trace_memory: 是否同时用 tracemalloc 统计内存分配
+        :param top: 汇总中列出的热点函数个数
+        :return: 汇总结果，包括结果文件路径
+        """
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("已有性能分析在进行")
+        try:
+            stacks: Counter = Counter()
+            own = threading.get_ident()
+            started_tracing = False
+            if trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start(5)
+                started_tracing = True
+
+            start = time.perf_counter()
+            end = start + seconds
+            samples = 0
+            while time.perf_counter() < end:
+                self._sample(stacks, own)
+                samples += 1
+                time.sleep(self.interval)
+            duration = time.perf_counter() - start
+
+            snapshot = tracemalloc.take_snapshot() if trace_memory else None
+            if started_tracing:
+                tracemalloc.stop()
+
+            os.makedirs(self.out_dir, exist_ok=True)
+            prefix = os.path.join(self.out_dir, time.strftime("profile-%Y%m%d-%H%M%S"))
+            res = {
+                "samples": samples,
+                "duration": round(duration, 2),
+                "hot": self._hot(stacks, top),
+                "folded": self._write_folded(stacks, f"{prefix}.folded"),
+            }
+            if snapshot is not None:
+                res["memory"], res["memory_file"] = self._write_memory(snapshot, f"{prefix}.mem.txt", top)
+            return res
+        finally:
+            self._running.release()
+
+    @staticmethod
+    def _write_folded(stacks: Counter, path: str) -> str:
+        with open(path, "w", encoding="utf-8") as fp:
+            for (thread, codes), n in stacks.most_common():
+                frames = ";".join([thread] + [_frame_label(c) for c in codes])
+                fp.write(f"{frames} {n}\n")
+        return path
+
+    @staticmethod
+    def _hot(stacks: Counter, top: int) -> List[Tuple[str, float, float]]:
+        """
+        统计热点函数，跳过阻塞等待的样本
+        :return: [(函数, 自身占比, 包含子调用的占比), ...]，按自身占比排序
+        """
+        own: Counter = Counter()
+        total: Counter = Counter()
+        busy = 0
+        for (_, codes), n in stacks.items():
+            if not codes:
+                continue
+            leaf = codes[-1]
+            if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                continue
+            busy += n
+            own[leaf] += n
+            for code in set(codes):
+                total[code] += n
+        if not busy:
+            return []
+        return [(_frame_label(c), round(n * 100 / busy, 1), round(total[c] * 100 / busy, 1))
+                for c, n in own.most_common(top)]
+
+    @staticmethod
+    def _write_memory(snapshot: tracemalloc.Snapshot, path: str, top: int) -> Tuple[List[str], str]:
+        # 去掉分析器自身采样产生的分配
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, __file__),
+                                           tracemalloc.Filter(False, tracemalloc.__file__)])
+        stats = snapshot.statistics("lineno")
+        with open(path, "w", encoding="utf-8") as fp:
+            for stat in stats[:100]:
+                fp.write(f"{stat}\n")
+        lines = []
+        for stat in stats[:top]:
+            frame = stat.traceback[0]
+            lines.append(f"{os.path.basename(frame.filename)}:{frame.lineno} {stat.size / 1024:.1f} KiB x{stat.count}")
+        return lines, path
+
+
+def format_summary(res: Dict[str, Any]) -> str:
+    """把 run() 的结果整理成适合发到微信的文字"""
+    lines = [f"采样 {res['duration']} 秒，共 {res['samples']} 次"]
+    if res["hot"]:
+        lines.append("热点函数（自身/累计）：")
+        lines.extend(f"{i}. {name} {own}%/{total}%" for i, (name, own, total) in enumerate(res["hot"], 1))
+    else:
+        lines.append("各线程均处于空闲等待")
+    if res.get("memory"):
+        lines.append("内存分配：")
+        lines.extend(res["memory"])
+    lines.append(f"折叠栈：{res['folded']}")
+    if res.get("memory_file"):
+        lines.append(f"内存快照：{res['memory_file']}")
+    return "\n".join(lines)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class TokenBucket(object):
+    """令牌桶，按需惰性补充令牌，每次操作 O(1)"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None, now: Optional[float] = None) -> None:
+        """
+        :param per_minute: 每分钟补充的令牌数
+        :param capacity: 桶容量，即允许的突发条数，默认等于每分钟条数
+        :param now: 创建时间，默认为当前时间
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity if capacity else per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.time() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """距离下一个令牌可用还需要等待的秒数，0 表示现在就有"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        """桶已经补满，说明最近没有使用，可以回收"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class RateLimiter(object):
+    """全局 + 按接收人的发送限流
+
+    两个桶都有令牌时才允许发送；否则返回需要等待的秒数，由调用方推迟发送而不是丢弃。
+    """
+
+    # 接收人桶数量超过该值时回收空闲的桶
+    PRUNE_THRESHOLD = 10000
+
+    def __init__(self, global_limit: int = 0, receiver_limit: int = 0,
+                 receiver_limits: Optional[Dict[str, int]] = None, burst: int = 0,
+                 clock: Callable[[], float] = time.time) -> None:
+        """
+        :param global_limit: 全局每分钟最多发送条数，0 表示不限制
+        :param receiver_limit: 默认每个接收人每分钟最多发送条数，0 表示不限制
+        :param receiver_limits: 单独配置的接收人（群）每分钟上限，{roomid: 条数}
+        :param burst: 桶容量（允许的突发条数），0 表示等于每分钟条数
+        :param clock: 时钟，测试时可以替换
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.configure(global_limit, receiver_limit, receiver_limits, burst)
+
+    def configure(self, global_limit: int = 0, receiver_limit: int = 0,
+                  receiver_limits: Optional[Dict[str, int]] = None, burst: int = 0) -> None:
+        """更新限流参数，已有的接收人桶会按新参数重建"""
+        with self._lock:
+            self.global_limit = int(global_limit or 0)
+            self.receiver_limit = int(receiver_limit or 0)
+            self.receiver_limits = {k: int(v or 0) for k, v in (receiver_limits or {}).items()}
+            self.burst = int(burst or 0)
+            self._global = TokenBucket(self.global_limit, self.burst, self._clock()) if self.global_limit > 0 else None
+            self._buckets.clear()
+
+    def _limit_of(self, receiver: str) -> int:
+        return self.receiver_limits.get(receiver, self.receiver_limit)
+
+    def _bucket(self, receiver: str) -> Optional[TokenBucket]:
+        bucket = self._buckets.get(receiver)
+        if bucket is None:
+            limit = self._limit_of(receiver)
+            if limit <= 0:
+                return None
+            if len(self._buckets) >= self.PRUNE_THRESHOLD:
+                self._prune()
+            bucket = TokenBucket(limit, self.burst, self._clock())
+            self._buckets[receiver] = bucket
+        return bucket
+
+    def _prune(self) -> None:
+        now = self._clock()
+        for k in [k for k, b in self._buckets.items() if b.is_idle(now)]:
+            del self._buckets[k]
+
+    def acquire(self, receiver: str) -> float:
+        """
+        尝试为一次发送获取令牌
+        :param receiver: 接收人wxid或者群id
+        :return: 0 表示已获取令牌可以发送；否则为建议等待的秒数，此时不消耗令牌
+        """
+        now = self._clock()
+        with self._lock:
+            bucket = self._bucket(receiver)
+            wait = 0.0
+            if self._global:
+                wait = self._global.wait_time(now)
+            if bucket:
+                wait = max(wait, bucket.wait_time(now))
+            if wait > 0:
+                return wait
+
+            if self._global:
+                self._global.consume()
+            if bucket:
+                bucket.consume()
+            return 0.0
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# 问题末尾可以忽略的语气词和标点，“你是谁？”“你是谁呀”“你是谁”视为同一个问题
+_TRAILING = re.compile(r"[\s。．.!！?？~～…,，、;；:：呀啊呢吧嘛哈]+$")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """归一化问题：全角转半角、统一大小写、去掉多余空白和末尾的语气词、标点"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = _SPACES.sub(" ", text).strip()
+    return _TRAILING.sub("", text) or text
+
+
+class ResponseCache(object):
+    """大模型回答缓存
+
+    以（模型、模型名、系统提示词、日期、归一化后的问题）为键缓存回答，
+    LRU + TTL：最多缓存 max_size 条，超出时淘汰最久未命中的；超过 ttl 秒的回答不再使用。
+    键中带日期，“今天几号”之类和日期有关的回答不会跨天复用。
+    可选持久化到 JSON 文件，重启后继续使用未过期的回答。
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600, path: Optional[str] = None) -> None:
+        """
+        :param max_size: 最多缓存的回答数，0 表示不缓存
+        :param ttl: 缓存有效期，秒
+        :param path: 持久化文件，为空时只缓存在内存中
+        """
+        self.LOG = logging.getLogger("ResponseCache")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        # 键: (缓存时间, 回答, 当时调用大模型的耗时)
+        self._items: "OrderedDict[str, Tuple[float, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+        self._saved_seconds = 0.0
+        if path:
+            self.load()
+
+    @staticmethod
+    def make_key(provider: str, model: Any, prompt: Any, question: str) -> str:
+        raw = "\x1f".join((provider, str(model or ""), str(prompt or ""), time.strftime("%Y-%m-%d"),
+                           normalize_question(question)))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._misses += 1
+                return None
+            if now - item[0] >= self.ttl:
+                del self._items[key]
+                self._expired += 1
+                self._misses += 1
+                self._dirty = True
+                return None
+            self._items.move_to_end(key)
+            self._hits += 1
+            self._saved_seconds += item[2]
+            return item[1]
+
+    def put(self, key: str, answer: str, seconds: float = 0.0) -> None:
+        """
+        :param seconds: 这次调用大模型的耗时，命中时累计为节省的时间
+        """
+        if self.max_size <= 0 or not answer:
+            return
+        with self._lock:
+            self._items[key] = (time.time(), answer, seconds)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self._evictions += 1
+            self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._dirty = True
+
+    def load(self) -> int:
+        """从持久化文件加载未过期的回答，返回加载的条数"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            self.LOG.error(f"读取回答缓存失败：{e}")
+            return 0
+
+        now = time.time()
+        with self._lock:
+            # 文件中按从旧到新的顺序保存，依次放入即可恢复 LRU 顺序
+            for key, (ts, answer, seconds) in data.items():
+                if now - ts < self.ttl:
+                    self._items[key] = (ts, answer, seconds)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            return len(self._items)
+
+    def save(self) -> None:
+        """有变化时写入持久化文件，先写临时文件再替换，中途退出不会损坏原文件"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            data = {k: v for k, v in self._items.items() if now - v[0] < self.ttl}
+            self._dirty = False
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fp:
+                json.dump(data, fp, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            self._dirty = True
+            self.LOG.error(f"保存回答缓存失败：{e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._items),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expired": self._expired,
+                "saved_seconds": round(self._saved_seconds, 3),
+            }
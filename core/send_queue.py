@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from queue import Empty, Full, Queue
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from core.metrics import SEND_SECONDS
+from core.rate_limiter import RateLimiter
+
+# 保护 SendTicket 完成状态与回调列表，临界区很短，所有 ticket 共用一把锁
+_TICKET_LOCK = threading.Lock()
+
+
+class SendTicket(object):
+    """一次发送请求的句柄，需要确认送达的调用方可以 wait()"""
+
+    __slots__ = ("msg", "receiver", "at_list", "enqueued_at", "sent_at", "ok", "_event", "_callbacks")
+
+    def __init__(self, msg: str, receiver: str, at_list: str = "", enqueued_at: Optional[float] = None) -> None:
+        self.msg = msg
+        self.receiver = receiver
+        self.at_list = at_list
+        self.enqueued_at = time.time() if enqueued_at is None else enqueued_at
+        self.sent_at: Optional[float] = None
+        self.ok: Optional[bool] = None  # None: 还未处理；True: 已发送；False: 发送失败或被丢弃
+        self._event = threading.Event()
+        self._callbacks: List[Callable[["SendTicket"], Any]] = []
+
+    def done(self, ok: bool) -> None:
+        with _TICKET_LOCK:
+            self.ok = ok
+            self.sent_at = time.time()
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for cb in callbacks:
+            cb(self)
+
+    def add_done_callback(self, cb: Callable[["SendTicket"], Any]) -> None:
+        """发送完成（成功、失败或被丢弃）后在发送线程中回调 cb(ticket)，已完成则立即回调"""
+        with _TICKET_LOCK:
+            if not self._event.is_set():
+                self._callbacks.append(cb)
+                return
+        cb(self)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待消息发出
+        :param timeout: 最长等待秒数，None 表示一直等
+        :return: 是否发送成功，超时返回 False
+        """
+        if not self._event.wait(timeout):
+            return False
+        return bool(self.ok)
+
+
+class SendQueue(object):
+    """出站消息队列
+
+    调用方入队后立即返回，由单独的发送线程负责随机延迟、限流和真正调用 wcf 发送，
+    接收消息、定时任务等线程不再被发送延迟拖慢。
+    """
+
+    def __init__(self, sender: Callable[[str, str, str], bool], queue_size: int = 0,
+                 delay_min: float = 0.3, delay_max: float = 1.3, limiter: Optional[RateLimiter] = None,
+                 max_defer: float = 300, max_deferred: int = 1000, name: str = "MsgSender",
+                 clock: Callable[[], float] = time.time) -> None:
+        """
+        :param sender: 真正的发送函数 sender(msg, receiver, at_list)，返回是否发送成功
+        :param queue_size: 队列深度，0 表示不限制
+        :param delay_min: 每条消息发送前的最小随机延迟，秒
+        :param delay_max: 每条消息发送前的最大随机延迟，秒
+        :param limiter: 限流器，超限的消息推迟发送
+        :param max_defer: 消息入队后超过该秒数仍被限流则丢弃，0 表示不丢弃
+        :param max_deferred: 最多推迟的消息条数，超出后丢弃新被限流的消息
+        :param name: 发送线程名
+        :param clock: 排队、推迟用的时钟，应与 limiter 的一致，测试时可以替换
+        """
+        self.LOG = logging.getLogger("SendQueue")
+        self.sender = sender
+        self.delay_min = delay_min
+        self.delay_max = max(delay_min, delay_max)
+        self.limiter = limiter
+        self.max_defer = max_defer
+        self.max_deferred = max_deferred
+        self.name = name
+        self._clock = clock
+        # 被限流推迟的消息按接收人排队，保证同一接收人的消息顺序不变；只在发送线程中访问
+        self._deferred: Dict[str, Deque[SendTicket]] = {}
+        self._deferred_len = 0
+        # 有推迟消息的接收人按可发送时间排序：(可发送时间, 序号, 接收人)
+        self._schedule: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._queue: Queue = Queue(maxsize=max(0, int(queue_size)))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._sent = 0
+        self._failed = 0
+        self._rejected = 0
+        self._deferred_count = 0  # 被限流推迟的次数
+        self._dropped = 0  # 限流后仍超时或推迟队列已满而丢弃的条数
+        self._queued_total = 0.0  # 累计排队时间，秒
+        self._queued_max = 0.0
+        self._latency_total = 0.0  # 累计发送耗时（不含随机延迟），秒
+        self._latency_max = 0.0
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """处理完已入队的消息后停止发送线程"""
+        if not self._running:
+            return
+        self._running = False
+        try:
+            self._queue.put_nowait(None)  # 只用来唤醒发送线程
+        except Full:
+            pass  # 队列满时不等待，发送线程发完队列中的消息后在 get 超时时看到 _running 为 False 退出
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def put(self, msg: str, receiver: str, at_list: str = "") -> SendTicket:
+        """
+        消息入队，立即返回
+        :return: 发送句柄，可用于等待送达
+        """
+        ticket = SendTicket(msg, receiver, at_list, self._clock())
+        try:
+            self._queue.put_nowait(ticket)
+        except Full:
+            with self._lock:
+                self._rejected += 1
+            self.LOG.warning(f"发送队列已满，丢弃发给 {receiver} 的消息")
+            ticket.done(False)
+        return ticket
+
+    def _delay(self) -> None:
+        # 随机延迟，模拟人工发送
+        if self.delay_max > 0:
+            time.sleep(random.uniform(self.delay_min, self.delay_max))
+
+    def _next(self) -> Tuple[Optional[SendTicket], bool]:
+        """
+        取下一条待发送的消息：优先已到期的推迟消息，其次新入队的消息
+        :return: (消息, 是否来自推迟队列)
+        """
+        timeout = 1.0
+        if self._schedule:
+            wait = self._schedule[0][0] - self._clock()
+            if wait <= 0:
+                receiver = heapq.heappop(self._schedule)[2]
+                return self._deferred[receiver].popleft(), True
+            timeout = min(timeout, wait)
+        return self._queue.get(timeout=timeout), False
+
+    def _reschedule(self, receiver: str, at: float) -> None:
+        if self._deferred.get(receiver):
+            heapq.heappush(self._schedule, (at, next(self._seq), receiver))
+        else:
+            self._deferred.pop(receiver, None)
+
+    def _drop(self, ticket: SendTicket, reason: str) -> None:
+        with self._lock:
+            self._dropped += 1
+        self.LOG.warning(f"发送消息过快，{reason}，丢弃发给 {ticket.receiver} 的消息")
+        ticket.done(False)
+
+    def _defer(self, ticket: SendTicket, wait: float, retry: bool) -> None:
+        """
+        推迟发送被限流的消息
+        :param wait: 限流器建议等待的秒数，0 表示排在该接收人已推迟的消息之后
+        :param retry: 是否为推迟队列中重试仍被限流的消息（此时它是该接收人的队首）
+        """
+        now = self._clock()
+        receiver = ticket.receiver
+        if self.max_defer and now + wait - ticket.enqueued_at > self.max_defer:
+            self._drop(ticket, f"等待超过 {self.max_defer} 秒")
+            if retry:
+                self._deferred_len -= 1
+                self._reschedule(receiver, now + wait)
+            return
+
+        if retry:
+            self._deferred[receiver].appendleft(ticket)
+            self._reschedule(receiver, now + wait)
+            return
+
+        if self._deferred_len >= self.max_deferred:
+            self._drop(ticket, f"推迟队列已满 {self.max_deferred} 条")
+            return
+
+        pending = self._deferred.get(receiver)
+        if pending is None:
+            pending = self._deferred[receiver] = deque()
+            heapq.heappush(self._schedule, (now + wait, next(self._seq), receiver))
+        pending.append(ticket)
+        self._deferred_len += 1
+        with self._lock:
+            self._deferred_count += 1
+
+    def _run(self) -> None:
+        while True:
+            try:
+                ticket, retry = self._next()
+            except Empty:
+                if not self._running and not self._deferred_len:
+                    return
+                continue
+
+            if ticket is None:
+                # 停止信号：推迟的消息还没发完则继续，发完后由上面的超时分支退出
+                if self._deferred_len:
+                    continue
+                return
+
+            self._process(ticket, retry)
+
+    def _process(self, ticket: SendTicket, retry: bool) -> None:
+        """处理一条取出的消息：同一接收人有推迟的消息时排到后面，被限流时推迟，否则发送"""
+        if not retry and ticket.receiver in self._deferred:
+            # 该接收人已有推迟的消息，排到后面以保持顺序
+            self._defer(ticket, 0, False)
+            return
+
+        if self.limiter:
+            wait = self.limiter.acquire(ticket.receiver)
+            if wait > 0:
+                self._defer(ticket, wait, retry)
+                return
+
+        if retry:
+            self._deferred_len -= 1
+            self._reschedule(ticket.receiver, self._clock())
+
+        queued = self._clock() - ticket.enqueued_at
+        self._delay()
+        start = time.time()
+        try:
+            ok = bool(self.sender(ticket.msg, ticket.receiver, ticket.at_list))
+        except Exception as e:
+            self.LOG.error(f"发送消息给 {ticket.receiver} 出错：{e}")
+            ok = False
+        ticket.done(ok)
+
+        latency = ticket.sent_at - start
+        with self._lock:
+            if ok:
+                self._sent += 1
+            else:
+                self._failed += 1
+            self._queued_total += queued
+            self._queued_max = max(self._queued_max, queued)
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+        SEND_SECONDS.observe(queued, "queued")
+        SEND_SECONDS.observe(latency, "send")
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            handled = self._sent + self._failed
+            return {
+                "queue_length": self.qsize(),
+                "sent": self._sent,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "deferred_now": self._deferred_len,
+                "deferred": self._deferred_count,
+                "dropped": self._dropped,
+                "queued_avg": round(self._queued_total / handled, 3) if handled else 0.0,
+                "queued_max": round(self._queued_max, 3),
+                "latency_avg": round(self._latency_total / handled, 3) if handled else 0.0,
+                "latency_max": round(self._latency_max, 3),
+            }
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import random
+import struct
+from typing import Iterable, Iterator, Optional, Sequence, Set, Tuple
+
+MAGIC = b"WCRTBL1\0"
+_HEADER = struct.Struct("<8sI")
+_OFFSET = struct.Struct("<I")
+
+
+class SortedTable(object):
+    """内存映射的只读有序表
+
+    文件由若干行组成，每行是用 \\t 分隔的字段，按第一个字段（key）的 UTF-8 字节序排序，
+    文件头之后是每行的偏移量，查找时直接在映射内存上二分。多个进程映射同一个文件时
+    共用操作系统的页缓存，不会各自在堆上复制一份数据。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是有效的表文件：{path}")
+        self._data = _HEADER.size + _OFFSET.size * (self.count + 1)
+
+    @staticmethod
+    def build(path: str, rows: Iterable[Sequence[str]]) -> int:
+        """
+        生成表文件，先写临时文件再替换，正在读旧文件的进程不受影响
+        :param rows: 每行的字段，第一个字段为 key，允许重复
+        :return: 行数
+        """
+        lines = sorted({"\t".join(row).encode("utf-8") for row in rows})
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(_HEADER.pack(MAGIC, len(lines)))
+            offset = 0
+            for line in lines:
+                fp.write(_OFFSET.pack(offset))
+                offset += len(line)
+            fp.write(_OFFSET.pack(offset))
+            for line in lines:
+                fp.write(line)
+        os.replace(tmp, path)
+        return len(lines)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _span(self, i: int) -> Tuple[int, int]:
+        start, end = struct.unpack_from("<II", self._mm, _HEADER.size + _OFFSET.size * i)
+        return self._data + start, self._data + end
+
+    def _key(self, i: int) -> bytes:
+        start, end = self._span(i)
+        tab = self._mm.find(b"\t", start, end)
+        return self._mm[start:end if tab < 0 else tab]
+
+    def row(self, i: int) -> Tuple[str, ...]:
+        start, end = self._span(i)
+        return tuple(self._mm[start:end].decode("utf-8").split("\t"))
+
+    def _bound(self, key: bytes, upper: bool) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = self._key(mid)
+            if k < key or (upper and k == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, key: str) -> range:
+        """key 相同的所有行的下标"""
+        k = key.encode("utf-8")
+        lo = self._bound(k, False)
+        if lo >= self.count or self._key(lo) != k:
+            return range(0)
+        return range(lo, self._bound(k, True))
+
+    def get(self, key: str) -> Optional[Tuple[str, ...]]:
+        rows = self.find(key)
+        return self.row(rows[0]) if rows else None
+
+    def random_row(self) -> Tuple[str, ...]:
+        return self.row(random.randrange(self.count))
+
+
+class TableDict(object):
+    """把 SortedTable 当作只读字典用：key -> 第 field 个字段"""
+
+    def __init__(self, table: SortedTable, field: int) -> None:
+        self.table = table
+        self.field = field
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.table.get(key)
+        return row[self.field] if row else default
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self.table.find(key))
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def keys(self) -> Iterator[str]:
+        return (self.table.row(i)[0] for i in range(len(self.table)))
+
+
+class TableGroups(object):
+    """把 SortedTable 当作只读的分组字典用：key -> {第二个字段, ...}"""
+
+    def __init__(self, table: SortedTable) -> None:
+        self.table = table
+
+    def get(self, key: str, default: Optional[Set[str]] = None) -> Optional[Set[str]]:
+        rows = self.table.find(key)
+        if not rows:
+            return default
+        return {self.table.row(i)[1] for i in rows}
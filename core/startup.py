@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class StartupTimer(object):
+    """启动耗时：记录各组件导入和初始化花的时间，启动完成后汇总到日志
+
+    首次使用时才加载的组件（例如成语词典）在加载时补记，可以再调用 report 查看。
+    更细的模块导入耗时可以用 python -X importtime main.py 查看。
+    """
+
+    def __init__(self) -> None:
+        self.t0 = time.perf_counter()  # 以导入本模块的时间为起点，入口脚本应尽早导入
+        self._stages: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._stages.append((name, seconds))
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark(self, name: str, since: Optional[float] = None) -> None:
+        """记录从 since（默认为起点）到现在的耗时，例如入口脚本的模块导入"""
+        self.record(name, time.perf_counter() - (self.t0 if since is None else since))
+
+    def report(self) -> str:
+        with self._lock:
+            stages = list(self._stages)
+        lines = [f"启动耗时 {time.perf_counter() - self.t0:.3f}s："]
+        lines += [f"  {name:<24} {seconds * 1000:9.1f}ms" for name, seconds in stages]
+        return "\n".join(lines)
+
+
+STARTUP = StartupTimer()
+
+
+class LazyObject(object):
+    """首次访问属性时才创建的对象代理，创建耗时记入 STARTUP"""
+
+    def __init__(self, factory: Callable[[], Any], name: str) -> None:
+        self._factory = factory
+        self._name = name
+        self._obj = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._obj is not None
+
+    def _get(self) -> Any:
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    with STARTUP.stage(self._name):
+                        self._obj = self._factory()
+        return self._obj
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._get(), item)
+
+    def __repr__(self) -> str:
+        return repr(self._obj) if self._obj is not None else f"<{self._name}（未加载）>"
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+import zlib
+from queue import Empty, Full, Queue
+from typing import Any, Callable, Dict, List, Optional
+
+# 队列满时的处理策略
+POLICY_BLOCK = "block"  # 等待 put_timeout 秒，仍然满则丢弃新消息
+POLICY_REJECT = "reject"  # 立即丢弃新消息
+POLICY_DROP_OLDEST = "drop_oldest"  # 丢弃队列中最旧的消息，新消息入队
+POLICIES = (POLICY_BLOCK, POLICY_REJECT, POLICY_DROP_OLDEST)
+
+# 消息被丢弃的原因
+SHED_FULL = "full"  # 队列已满，新消息被丢弃
+SHED_EVICTED = "evicted"  # 队列已满，最旧的消息被挤掉
+SHED_STALE = "stale"  # 排队时间超过 max_age
+
+
+class MsgWorkerPool(object):
+    """按会话分片的消息处理线程池
+
+    同一个会话（群聊为 roomid，私聊为 sender）的消息总是落到同一个 worker 上，
+    保证会话内消息按顺序处理；不同会话之间并行处理，慢的 LLM 调用不会阻塞其他群。
+    """
+
+    def __init__(self, handler: Callable[[Any], Any], workers: int = 4, queue_size: int = 100,
+                 put_timeout: float = 1.0, policy: str = POLICY_BLOCK, max_age: float = 0,
+                 on_shed: Optional[Callable[[Any, str], Any]] = None, name: str = "MsgWorker") -> None:
+        """
+        :param handler: 消息处理函数，在 worker 线程中调用
+        :param workers: worker 线程数
+        :param queue_size: 每个 worker 的队列深度，0 表示不限制
+        :param put_timeout: 队列满时等待的秒数，超时后丢弃消息，仅 block 策略有效
+        :param policy: 队列满时的处理策略，见 POLICIES
+        :param max_age: 消息排队超过该秒数则不再处理，0 表示不限制
+        :param on_shed: 消息被丢弃时的回调 on_shed(消息, 原因)，例如回复“稍后再试”
+        :param name: 线程名前缀
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"未知的队列策略：{policy}")
+        self.LOG = logging.getLogger("MsgWorkerPool")
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue_size = max(0, int(queue_size))
+        self.put_timeout = put_timeout
+        self.policy = policy
+        self.max_age = max_age
+        self.on_shed = on_shed
+        self.name = name
+        # 队列元素为 (入队时间, 消息)
+        self._queues: List[Queue] = [Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._processed = [0] * self.workers
+        self._dropped = [0] * self.workers
+        self._shed: Dict[str, int] = {SHED_FULL: 0, SHED_EVICTED: 0, SHED_STALE: 0}
+        self._busy = [0.0] * self.workers  # 处理消息累计耗时，秒
+        self._running = False
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}-{i}", args=(i,), daemon=True)
+            t.start()
+            self._threads.append(t)
+        self.LOG.info(f"{self.name} 线程池已启动：{self.workers} 个线程，队列深度 {self.queue_size}，策略 {self.policy}")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """通知所有 worker 处理完队列中的消息后退出"""
+        if not self._running:
+            return
+        self._running = False
+        for q in self._queues:
+            # 队列满时 worker 取空队列后也会因 _running 为 False 退出，不必等待放入，否则 worker 卡在慢调用时会一直阻塞
+            try:
+                q.put_nowait(None)
+            except Full:
+                pass
+        for t in self._threads:
+            t.join(timeout)
+        self._threads.clear()
+
+    def shard(self, key: str) -> int:
+        """会话 key 到 worker 序号的映射，进程重启后保持稳定"""
+        return zlib.crc32(key.encode("utf-8")) % self.workers
+
+    def _shed_item(self, idx: int, item: Any, reason: str) -> None:
+        with self._lock:
+            self._dropped[idx] += 1
+            self._shed[reason] += 1
+        self.LOG.warning(f"{self.name}-{idx} 丢弃消息（{reason}）")
+        if self.on_shed:
+            try:
+                self.on_shed(item, reason)
+            except Exception as e:
+                self.LOG.error(f"{self.name} 丢弃消息回调出错：{e}")
+
+    def submit(self, key: str, item: Any) -> bool:
+        """
+        提交一条消息
+        :param key: 会话 key，群聊为 roomid，私聊为 sender
+        :param item: 消息
+        :return: 是否成功入队
+        """
+        idx = self.shard(key or "")
+        q = self._queues[idx]
+        entry = (time.time(), item)
+        try:
+            if self.policy == POLICY_BLOCK:
+                q.put(entry, timeout=self.put_timeout)
+            else:
+                q.put_nowait(entry)
+            return True
+        except Full:
+            pass
+
+        if self.policy != POLICY_DROP_OLDEST:
+            self._shed_item(idx, item, SHED_FULL)
+            return False
+
+        # 挤掉最旧的消息，再放入新消息
+        while True:
+            try:
+                oldest = q.get_nowait()
+            except Empty:
+                pass
+            else:
+                if oldest is None:  # 停止时放入的结束标记，线程池已在停止，不再入队
+                    self._shed_item(idx, item, SHED_FULL)
+                    return False
+                self._shed_item(idx, oldest[1], SHED_EVICTED)
+            try:
+                q.put_nowait(entry)
+                return True
+            except Full:
+                continue
+
+    def _run(self, idx: int) -> None:
+        q = self._queues[idx]
+        while True:
+            try:
+                entry = q.get(timeout=1)
+            except Empty:
+                if not self._running:
+                    return
+                continue
+
+            if entry is None:
+                return
+
+            enqueued_at, item = entry
+            start = time.time()
+            if self.max_age and start - enqueued_at > self.max_age:
+                self._shed_item(idx, item, SHED_STALE)
+                continue
+
+            try:
+                self.handler(item)
+            except Exception as e:
+                self.LOG.error(f"{self.name}-{idx} 处理消息出错：{e}")
+            finally:
+                with self._lock:
+                    self._processed[idx] += 1
+                    self._busy[idx] += time.time() - start
+
+    def backlog(self) -> List[int]:
+        """每个 worker 当前积压的消息数"""
+        return [q.qsize() for q in self._queues]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            processed = list(self._processed)
+            dropped = list(self._dropped)
+            shed = dict(self._shed)
+            busy = [round(b, 3) for b in self._busy]
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "policy": self.policy,
+            "backlog": self.backlog(),
+            "processed": processed,
+            "dropped": dropped,
+            "shed": shed,
+            "busy_seconds": busy,
+        }
@@ -1 +1,24 @@
-from .db_operations import *
+# 导入 db 不读取配置、不连接数据库：首次用到 db.get_points、db.ledger 等时才初始化，
+# 也可以先调用 db.init(config) 指定配置
+import importlib
+
+
+def _operations():
+    # 不用 from . import：该语句会先在包上查找属性，又回到 __getattr__
+    return importlib.import_module(".db_operations", __name__)
+
+
+def init(config=None):
+    _operations().init(config)
+
+
+def __getattr__(name):
+    if name.startswith("__") or name == "db_operations":
+        raise AttributeError(name)
+    operations = _operations()
+    operations.init()
+    try:
+        value = getattr(operations, name)
+    except AttributeError:
+        raise AttributeError(f"module 'db' has no attribute '{name}'") from None
+    return globals().setdefault(name, value)  # 缓存到包上，之后不再经过这里；已被替换（例如压测）的保持不变
@@ -0,0 +1,129 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class UserRow(NamedTuple):
+    """用户行的只读快照，属性与 User 模型一致，离开 session 后也能访问"""
+    wechat_id: str
+    points: int
+    is_blacklisted: bool
+    is_super_admin: bool
+
+    @classmethod
+    def of(cls, user) -> "UserRow":
+        return cls(user.wechat_id, user.points or 0, bool(user.is_blacklisted), bool(user.is_super_admin))
+
+
+class UserCache(object):
+    """用户行的进程内缓存
+
+    LRU + TTL：最多缓存 max_size 个用户，超出时淘汰最久未访问的；缓存超过 ttl 秒后重新查询数据库。
+    本进程内的积分变化通过 update_points 写穿缓存，其他进程（多账号模式）的修改最多延迟 ttl 秒可见。
+    扣积分始终以数据库的原子更新为准，缓存只用于读取。
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300) -> None:
+        """
+        :param max_size: 最多缓存的用户数，0 表示不缓存
+        :param ttl: 缓存有效期，秒
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._rows: "OrderedDict[str, Tuple[float, UserRow]]" = OrderedDict()  # wechat_id: (加载时间, 快照)
+        # 正在从数据库加载的用户：wechat_id: [加载中的线程数, 加载期间的变化次数]，见 load
+        self._loading: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+        self._invalidations = 0
+
+    def get(self, wechat_id: str) -> Optional[UserRow]:
+        now = time.time()
+        with self._lock:
+            item = self._rows.get(wechat_id)
+            if item is None:
+                self._misses += 1
+                return None
+            if now - item[0] >= self.ttl:
+                del self._rows[wechat_id]
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._rows.move_to_end(wechat_id)
+            self._hits += 1
+            return item[1]
+
+    def put(self, row: UserRow) -> UserRow:
+        if self.max_size <= 0:
+            return row
+        with self._lock:
+            self._rows[row.wechat_id] = (time.time(), row)
+            self._rows.move_to_end(row.wechat_id)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+                self._evictions += 1
+        return row
+
+    def load(self, wechat_id: str, loader: Callable[[], Optional[UserRow]]) -> Optional[UserRow]:
+        """
+        未命中时调用 loader 查询数据库并放入缓存
+        查询期间积分有变化（update_points、invalidate）时，读到的可能是旧值，只返回不缓存
+        """
+        with self._lock:
+            loading = self._loading.setdefault(wechat_id, [0, 0])
+            loading[0] += 1
+            changes = loading[1]
+        row = None
+        try:
+            row = loader()
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[wechat_id]
+                stale = loading[1] != changes
+        if row is not None and not stale:
+            self.put(row)
+        return row
+
+    def _changed(self, wechat_id: Optional[str]) -> None:
+        """调用方持有 self._lock"""
+        for key, loading in self._loading.items():
+            if wechat_id is None or key == wechat_id:
+                loading[1] += 1
+
+    def update_points(self, wechat_id: str, delta: int, created: bool = False) -> None:
+        """数据库中的积分已变化 delta，同步到缓存（未缓存时忽略，新用户在下次读取时加载）"""
+        if not delta:
+            return
+        with self._lock:
+            self._changed(wechat_id)
+            item = self._rows.get(wechat_id)
+            if item is not None:
+                self._rows[wechat_id] = (item[0], item[1]._replace(points=item[1].points + delta))
+
+    def invalidate(self, wechat_id: Optional[str] = None) -> None:
+        """使某个用户（不传则全部）的缓存失效，下次读取时查询数据库"""
+        with self._lock:
+            self._changed(wechat_id)
+            if wechat_id is None:
+                self._rows.clear()
+            else:
+                self._rows.pop(wechat_id, None)
+            self._invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._rows),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expired": self._expired,
+                "invalidations": self._invalidations,
+            }
@@ -1,13 +1,58 @@
 # db_operations.py
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from .models import User, conf  # 导入 User 模型和数据库引擎
-
-# 创建 Session 类
-Session = sessionmaker(bind=create_engine(conf.URL))
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from core.metrics import DB_SECONDS, timed
+from .cache import UserCache, UserRow
+from .engine import Database
+from .leaderboard import PointsRanking
+from .message_history import MessageHistory
+from .models import User  # 导入 User 模型
+from .point_ledger import PointLedger
+
+# 以下对象由 init() 创建，导入本模块不连接数据库
+conf = None
+database = None
+Session = None
+user_cache = None
+ranking = None
+history = None
+ledger = None
+_init_lock = threading.Lock()
+
+
+def init(config=None):
+    """
+    连接数据库、建表，创建缓存、排行榜、消息记录和积分账本；重复调用直接返回
+    :param config: Config 对象，不传时读取 config.yaml
+    """
+    global conf, database, Session, user_cache, ranking, history, ledger
+    with _init_lock:
+        if database is not None:
+            return
+        if config is None:
+            from configuration import Config
+            config = Config()
+        conf = config
+        # 连接数据库并建表，SQLite 使用 WAL 模式
+        db = Database(conf.URL, conf.SQLITE)
+        db.bootstrap()
+        # 创建 Session 类，提交后不过期属性，关闭 session 后返回的对象仍可读取
+        Session = db.Session
+        # 活跃用户的进程内缓存，读积分不必每次访问数据库
+        user_cache = UserCache(max_size=conf.USER_CACHE.get("max_size", 10000), ttl=conf.USER_CACHE.get("ttl", 300))
+        # 积分排行榜，积分变化时增量更新
+        ranking = PointsRanking(Session, reload_seconds=conf.LEADERBOARD.get("reload_minutes", 10) * 60)
+        # 消息记录：后台批量写入
+        history = MessageHistory(Session, **{k: v for k, v in conf.HISTORY.items() if k != "enable"})
+        # 积分账本：原子扣减、批量写入加积分
+        ledger = PointLedger(Session, flush_ms=conf.LEDGER.get("flush_ms", 200), listeners=(user_cache, ranking))
+        database = db  # 最后赋值，其他线程看到 database 时其余对象都已就绪
 
 
 # 示例：添加用户
+@timed(DB_SECONDS, "add_user")
 def add_user(wechat_id, points=10, is_blacklisted=False, is_super_admin=False):
     """
     添加一个新用户
@@ -36,10 +81,13 @@ def add_user(wechat_id, points=10, is_blacklisted=False, is_super_admin=False):
     session.add(new_user)  # 将新用户添加到会话
     session.commit()  # 提交事务
     session.close()  # 关闭 session
+    user_cache.put(UserRow.of(new_user))
+    ranking.set(wechat_id, points)
     return new_user  # 返回新创建的用户
 
 
 # 示例：查询用户，如果没有则创建新用户
+@timed(DB_SECONDS, "get_or_create_user_by_wechat_id")
 def get_or_create_user_by_wechat_id(wechat_id, points=0, is_blacklisted=False, is_super_admin=False):
     """
     根据微信 ID 查询用户，如果不存在则创建一个新用户
@@ -47,56 +95,80 @@ def get_or_create_user_by_wechat_id(wechat_id, points=0, is_blacklisted=False, i
     :param points: 初始积分，默认为0
     :param is_blacklisted: 是否被拉黑，默认为 False
     :param is_super_admin: 是否为超级管理员，默认为 False
-    :return: 用户对象（查询到的或新创建的）
+    :return: 用户的只读快照 UserRow（查询到的或新创建的），优先从缓存读取
     """
-    session = Session()  # 创建 session
+    row = user_cache.get(wechat_id)
+    if row:
+        return row
+    # 提交后才放入缓存；查询期间积分有变化时不缓存读到的旧值
+    return user_cache.load(wechat_id, lambda: _load_or_create_user(wechat_id, points, is_blacklisted,
+                                                                   is_super_admin))
 
-    # 查询用户是否存在
-    user = session.query(User).filter(User.wechat_id == wechat_id).first()
 
-    if user:
-        session.close()
-        return user  # 用户已存在，返回该用户
-
-    # 用户不存在，创建新用户
-    new_user = User(
-        wechat_id=wechat_id,
-        points=points,
-        is_blacklisted=is_blacklisted,
-        is_super_admin=is_super_admin
-    )
-    session.add(new_user)  # 添加到会话
-    session.commit()  # 提交事务
-    session.close()  # 关闭 session
-    return new_user  # 返回新创建的用户
+def _load_or_create_user(wechat_id, points, is_blacklisted, is_super_admin):
+    session = Session()  # 创建 session
+    try:
+        # 查询用户是否存在
+        user = session.query(User).filter(User.wechat_id == wechat_id).first()
+        if user:
+            return UserRow.of(user)  # 用户已存在，返回该用户
+
+        # 用户不存在，创建新用户
+        new_user = User(
+            wechat_id=wechat_id,
+            points=points,
+            is_blacklisted=is_blacklisted,
+            is_super_admin=is_super_admin
+        )
+        session.add(new_user)  # 添加到会话
+        try:
+            session.commit()  # 提交事务
+        except IntegrityError:
+            # 同一新用户的几条消息在不同通道（或账号进程）同时处理，都没查到，另一方先插入了，重新查询
+            session.rollback()
+            return UserRow.of(session.query(User).filter(User.wechat_id == wechat_id).one())
+        ranking.set(wechat_id, points)
+        return UserRow.of(new_user)  # 返回新创建的用户
+    finally:
+        session.close()  # 关闭 session
 
 
 # 示例：更新用户积分
+@timed(DB_SECONDS, "update_user_points")
 def update_user_points(wechat_id, change_points):
     """
-    根据微信ID更新用户积分
+    根据微信ID更新用户积分，立即写入；不需要返回值的场景用 ledger.add 批量写入
     :param wechat_id: 用户的微信ID
     :param change_points: 要更改的积分，正数表示加积分，负数表示减积分
     :return: 返回更新后的用户对象，或者 None（如果用户不存在）
     """
     session = Session()  # 创建 session
 
-    # 查询用户是否存在
-    user = session.query(User).filter(User.wechat_id == wechat_id).first()
-
-    if user:
-        # 用户存在，更新积分
-        user.points += change_points  # 根据传入的积分值加或减
-        session.commit()  # 提交事务
-        session.close()  # 关闭 session
-        return user  # 返回更新后的用户对象
-    else:
-        # 用户不存在，返回 None
-        session.close()  # 关闭 session
+    # 在数据库里原子地加减，并发处理同一用户时不会丢失更新
+    n = session.query(User).filter(User.wechat_id == wechat_id) \
+        .update({User.points: User.points + change_points}, synchronize_session=False)
+    session.commit()  # 提交事务
+    user = session.query(User).filter(User.wechat_id == wechat_id).first() if n else None
+    session.close()  # 关闭 session
+    if user is None:
+        user_cache.invalidate(wechat_id)
         return None
+    user_cache.put(UserRow.of(user))  # 写穿缓存
+    ranking.set(wechat_id, user.points)
+    return user  # 返回更新后的用户对象，用户不存在时为 None
 
 
+@timed(DB_SECONDS, "get_points")
 def get_points(wechat_id):
+    """查询积分，包含账本中尚未写入数据库的变化"""
     user = get_or_create_user_by_wechat_id(wechat_id)
     if user:
-        return user.points
+        return user.points + ledger.pending(wechat_id)
+
+
+def invalidate_user(wechat_id=None):
+    """
+    使用户缓存失效，直接修改数据库（例如手动拉黑、改积分）后调用
+    :param wechat_id: 用户的微信ID，不传则清空全部缓存
+    """
+    user_cache.invalidate(wechat_id)
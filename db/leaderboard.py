@@ -0,0 +1,232 @@
+# leaderboard.py
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .models import User
+
+_MAX_LEVEL = 32
+
+
+class _Node(object):
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int) -> None:
+        self.key = key
+        self.next: List["_Node"] = [None] * level
+        self.width: List[int] = [1] * level  # 每层到下一个节点跨过的元素数
+
+
+class _SkipList(object):
+    """可按名次查找的跳表：插入、删除、求名次都是 O(log n)"""
+
+    def __init__(self) -> None:
+        self.size = 0
+        self.nil = _Node(None, 0)
+        self.head = _Node(None, _MAX_LEVEL)
+        self.head.next = [self.nil] * _MAX_LEVEL
+
+    def _path(self, key) -> Tuple[List[_Node], List[int]]:
+        """每层最后一个小于 key 的节点，以及在该层前进的元素数"""
+        chain = [None] * _MAX_LEVEL
+        steps = [0] * _MAX_LEVEL
+        node = self.head
+        for i in reversed(range(_MAX_LEVEL)):
+            while node.next[i] is not self.nil and node.next[i].key < key:
+                steps[i] += node.width[i]
+                node = node.next[i]
+            chain[i] = node
+        return chain, steps
+
+    def insert(self, key) -> None:
+        level = 1
+        while level < _MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        chain, steps = self._path(key)
+        node = _Node(key, level)
+        passed = 0
+        for i in range(level):
+            prev = chain[i]
+            node.next[i] = prev.next[i]
+            prev.next[i] = node
+            node.width[i] = prev.width[i] - passed
+            prev.width[i] = passed + 1
+            passed += steps[i]
+        for i in range(level, _MAX_LEVEL):
+            chain[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key) -> bool:
+        chain, _ = self._path(key)
+        node = chain[0].next[0]
+        if node is self.nil or node.key != key:
+            return False
+        for i in range(len(node.next)):
+            chain[i].width[i] += node.width[i] - 1
+            chain[i].next[i] = node.next[i]
+        for i in range(len(node.next), _MAX_LEVEL):
+            chain[i].width[i] -= 1
+        self.size -= 1
+        return True
+
+    def count_less(self, key) -> int:
+        """小于 key 的元素个数"""
+        pos = 0
+        node = self.head
+        for i in reversed(range(_MAX_LEVEL)):
+            while node.next[i] is not self.nil and node.next[i].key < key:
+                pos += node.width[i]
+                node = node.next[i]
+        return pos
+
+    def head_keys(self, n: int) -> List:
+        res = []
+        node = self.head.next[0]
+        while node is not self.nil and len(res) < n:
+            res.append(node.key)
+            node = node.next[0]
+        return res
+
+
+class Leaderboard(object):
+    """积分排名：按 (-积分, wxid) 排序的跳表，积分相同的名次相同"""
+
+    def __init__(self, rows: Iterable[Tuple[str, int]] = ()) -> None:
+        self._scores: Dict[str, int] = {}
+        self._list = _SkipList()
+        for wechat_id, points in rows:
+            self.set(wechat_id, points)
+
+    def set(self, wechat_id: str, points: int) -> None:
+        old = self._scores.get(wechat_id)
+        if old == points:
+            return
+        if old is not None:
+            self._list.remove((-old, wechat_id))
+        self._list.insert((-points, wechat_id))
+        self._scores[wechat_id] = points
+
+    def get(self, wechat_id: str) -> Optional[int]:
+        return self._scores.get(wechat_id)
+
+    def rank(self, wechat_id: str) -> Optional[int]:
+        """名次，从 1 开始；不在榜上返回 None"""
+        points = self._scores.get(wechat_id)
+        if points is None:
+            return None
+        return self._list.count_less((-points, "")) + 1
+
+    def top(self, n: int) -> List[Tuple[int, str, int]]:
+        """前 n 名 [(名次, wxid, 积分)]"""
+        res = []
+        for i, (neg, wechat_id) in enumerate(self._list.head_keys(n)):
+            rank = res[-1][0] if res and res[-1][2] == -neg else i + 1
+            res.append((rank, wechat_id, -neg))
+        return res
+
+    def __len__(self) -> int:
+        return self._list.size
+
+
+class PointsRanking(object):
+    """积分排行榜：全局和按群
+
+    首次查询时从数据库（users.points 上有索引）加载全部用户的积分，之后积分每次变化都增量更新内存中的排名，
+    前 N 名和“我的名次”不再扫表。群排行榜按群成员名单懒加载，成员名单变化时重建。
+    多账号模式下其他进程的积分变化由定时全量重载对齐。
+    """
+
+    def __init__(self, session_factory: Callable, reload_seconds: float = 600) -> None:
+        """
+        :param session_factory: 数据库 Session 工厂
+        :param reload_seconds: 每隔多少秒从数据库重新加载一次，0 表示只加载一次
+        """
+        self.LOG = logging.getLogger("PointsRanking")
+        self.Session = session_factory
+        self.reload_seconds = reload_seconds
+        self.board = Leaderboard()
+        self._groups: Dict[str, Tuple[object, Leaderboard]] = {}  # roomid: (成员名单, 排名)
+        self._member_of: Dict[str, Set[str]] = {}  # wxid: {roomid}
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+
+    def load(self) -> None:
+        session = self.Session()
+        try:
+            rows = session.query(User.wechat_id, User.points).order_by(User.points.desc()).all()
+        finally:
+            session.close()
+        board = Leaderboard((wechat_id, points or 0) for wechat_id, points in rows)
+        with self._lock:
+            self.board = board
+            self._groups.clear()
+            self._member_of.clear()
+            self._loaded_at = time.time()
+        self.LOG.info(f"已加载 {len(board)} 个用户的积分排名")
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded_at or (self.reload_seconds and time.time() - self._loaded_at > self.reload_seconds):
+            self.load()
+
+    def set(self, wechat_id: str, points: int) -> None:
+        """用户积分变为 points（新用户或查询到的最新值）"""
+        with self._lock:
+            if not self._loaded_at:
+                return
+            self.board.set(wechat_id, points)
+            for roomid in self._member_of.get(wechat_id, ()):
+                self._groups[roomid][1].set(wechat_id, points)
+
+    def update_points(self, wechat_id: str, delta: int, created: bool = False) -> None:
+        """数据库中的积分已变化 delta，created 表示这一行是新插入的"""
+        with self._lock:
+            points = self.board.get(wechat_id)
+            if points is not None:
+                self.set(wechat_id, points + delta)
+            elif created:
+                self.set(wechat_id, delta)
+
+    def _group(self, roomid: str, members: Dict[str, str]) -> Leaderboard:
+        """调用方持有 self._lock"""
+        cached = self._groups.get(roomid)
+        if cached and cached[0] is members:
+            return cached[1]
+        if cached:
+            for wxid in cached[0]:
+                self._member_of.get(wxid, set()).discard(roomid)
+        board = Leaderboard((wxid, self.board.get(wxid)) for wxid in members if self.board.get(wxid) is not None)
+        for wxid in members:
+            self._member_of.setdefault(wxid, set()).add(roomid)
+        self._groups[roomid] = (members, board)
+        return board
+
+    def top(self, n: int, roomid: Optional[str] = None,
+            members: Optional[Dict[str, str]] = None) -> List[Tuple[int, str, int]]:
+        """
+        前 n 名
+        :param roomid: 群 id，不传为全局排行
+        :param members: 群成员 {wxid: 群昵称}，同一份名单对象会复用已建好的群排名
+        :return: [(名次, wxid, 积分)]
+        """
+        self._ensure_loaded()
+        with self._lock:
+            board = self._group(roomid, members) if roomid else self.board
+            return board.top(n)
+
+    def rank(self, wechat_id: str, roomid: Optional[str] = None,
+             members: Optional[Dict[str, str]] = None) -> Optional[Tuple[int, int, int]]:
+        """
+        某个用户的名次
+        :return: (名次, 积分, 上榜人数)，不在榜上返回 None
+        """
+        self._ensure_loaded()
+        with self._lock:
+            board = self._group(roomid, members) if roomid else self.board
+            rank = board.rank(wechat_id)
+            return (rank, board.get(wechat_id), len(board)) if rank else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"users": len(self.board), "groups": len(self._groups)}
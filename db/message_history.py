@@ -0,0 +1,219 @@
+# message_history.py
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import func, insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.metrics import DB_SECONDS, timed
+from .models import Message
+
+
+class MessageRow(NamedTuple):
+    """一条消息记录的只读快照"""
+    ts: float
+    roomid: str
+    sender: str
+    type: int
+    content: str
+    outgoing: bool
+
+
+class MessageHistory(object):
+    """消息记录
+
+    收发消息时只把一行放进内存队列，立即返回，不阻塞消息处理；后台线程每攒够 batch_size 行
+    或每隔 flush_ms 毫秒批量插入一次。队列满时丢弃新记录并计数，不拖慢机器人。
+    超过 retention_days 天的记录按 id 从旧到新分段删除，每段一个小事务，SQLite 下不会长时间占住写锁。
+    """
+
+    def __init__(self, session_factory: Callable, batch_size: int = 200, flush_ms: int = 1000,
+                 max_queue: int = 10000, retention_days: float = 30, prune_minutes: float = 60,
+                 prune_chunk: int = 5000) -> None:
+        """
+        :param session_factory: 数据库 Session 工厂
+        :param batch_size: 每批插入的最多行数
+        :param flush_ms: 最长攒批时间，毫秒
+        :param max_queue: 内存队列长度
+        :param retention_days: 保留天数，0 表示不清理
+        :param prune_minutes: 每隔多少分钟清理一次过期记录
+        :param prune_chunk: 清理时每个事务删除的 id 范围
+        """
+        self.LOG = logging.getLogger("MessageHistory")
+        self.Session = session_factory
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.retention_days = retention_days
+        self.prune_seconds = prune_minutes * 60
+        self.prune_chunk = prune_chunk
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()  # 后台线程攒批、写入时持有，flush 等它写完
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._pruned = 0
+        self._batches = 0
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="MessageHistory", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def append(self, roomid: str, sender: str, content: str, msg_type: int = 0x01, msg_id: Any = None,
+               outgoing: bool = False, ts: Optional[float] = None) -> bool:
+        """
+        记录一条消息，立即返回
+        :return: 是否已放入队列，队列满时为 False
+        """
+        row = {"ts": ts or time.time(), "msg_id": None if msg_id is None else str(msg_id), "type": msg_type,
+               "roomid": roomid, "sender": sender, "content": content, "outgoing": outgoing}
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+        self._ensure_thread()
+        return True
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    @timed(DB_SECONDS, "history_insert")
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        session = self.Session()
+        try:
+            session.execute(insert(Message), rows)  # executemany 批量插入
+            session.commit()
+            with self._lock:
+                self._written += len(rows)
+                self._batches += 1
+        except SQLAlchemyError as e:
+            session.rollback()
+            self.LOG.error(f"写入消息记录失败，丢弃 {len(rows)} 条：{e}")
+            with self._lock:
+                self._failed += len(rows)
+        finally:
+            session.close()
+
+    def flush(self) -> None:
+        """把队列中的记录全部写入，退出时调用"""
+        with self._busy:
+            while True:
+                rows = self._drain()
+                if not rows:
+                    return
+                self._write(rows)
+
+    @timed(DB_SECONDS, "history_prune")
+    def prune(self) -> int:
+        """删除过期记录，返回删除的行数"""
+        if self.retention_days <= 0:
+            return 0
+        cutoff = time.time() - self.retention_days * 86400
+        session = self.Session()
+        deleted = 0
+        try:
+            # ts 上没有索引：id 随写入时间递增，从最小的 id 起按主键分段删除，
+            # 某一段删完后还有留下的（较新的）记录，说明已经删到保留期内，停止
+            lo = session.query(func.min(Message.id)).scalar()
+            while lo is not None:
+                end = lo + self.prune_chunk
+                deleted += session.query(Message).filter(Message.id < end, Message.ts < cutoff) \
+                    .delete(synchronize_session=False)
+                session.commit()
+                if session.query(Message.id).filter(Message.id < end).first() is not None:
+                    break
+                lo = session.query(func.min(Message.id)).filter(Message.id >= end).scalar()
+        except SQLAlchemyError as e:
+            session.rollback()
+            self.LOG.error(f"清理消息记录失败：{e}")
+        finally:
+            session.close()
+        with self._lock:
+            self._pruned += deleted
+        if deleted:
+            self.LOG.info(f"清理了 {deleted} 条 {self.retention_days} 天前的消息记录")
+        return deleted
+
+    def _run(self) -> None:
+        next_prune = time.time() + 60  # 启动一分钟后做第一次清理
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_ms / 1000)
+            except queue.Empty:
+                first = None
+            if first:
+                with self._busy:
+                    # 攒批：凑满 batch_size，或从第一条起最多再等 flush_ms
+                    deadline = time.time() + self.flush_ms / 1000
+                    rows = [first]
+                    while len(rows) < self.batch_size:
+                        try:
+                            rows.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                        except queue.Empty:
+                            break
+                    try:
+                        self._write(rows)
+                    except Exception as e:
+                        self.LOG.error(f"消息记录线程出错：{e}")
+            if self.prune_seconds and time.time() >= next_prune:
+                next_prune = time.time() + self.prune_seconds
+                try:
+                    self.prune()
+                except Exception as e:
+                    self.LOG.error(f"消息记录线程出错：{e}")
+
+    @timed(DB_SECONDS, "history_last_turns")
+    def last_turns(self, roomid: str, n: int = 10, since: float = 0) -> List[MessageRow]:
+        """
+        某个会话最近的 n 条消息（含机器人的回复），按时间从早到晚排列，走 (roomid, ts) 索引
+        :param roomid: 会话：群聊为 roomid，私聊为对方 wxid
+        :param since: 只要这个时间戳之后的消息
+        """
+        session = self.Session()
+        try:
+            rows = session.query(Message.ts, Message.roomid, Message.sender, Message.type, Message.content,
+                                 Message.outgoing).filter(Message.roomid == roomid, Message.ts >= since) \
+                .order_by(Message.ts.desc()).limit(n).all()
+        finally:
+            session.close()
+        return [MessageRow(*r) for r in reversed(rows)]
+
+    @timed(DB_SECONDS, "history_by_sender")
+    def by_sender(self, sender: str, n: int = 50, since: float = 0) -> List[MessageRow]:
+        """某个人最近发的 n 条消息（所有会话），按时间从早到晚排列，走 (sender, ts) 索引"""
+        session = self.Session()
+        try:
+            rows = session.query(Message.ts, Message.roomid, Message.sender, Message.type, Message.content,
+                                 Message.outgoing).filter(Message.sender == sender, Message.ts >= since) \
+                .order_by(Message.ts.desc()).limit(n).all()
+        finally:
+            session.close()
+        return [MessageRow(*r) for r in reversed(rows)]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self._written,
+                "batches": self._batches,
+                "dropped": self._dropped,
+                "failed": self._failed,
+                "pruned": self._pruned,
+            }
@@ -0,0 +1,61 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# migrate.py
+import logging
+from argparse import ArgumentParser
+
+from sqlalchemy import func, select
+
+from .engine import Database
+from .models import Base
+
+
+def migrate(src_url: str, dst_url: str, batch: int = 1000, replace: bool = False) -> dict:
+    """
+    把 src 数据库中的所有表复制到 dst，例如从 MySQL 迁移到 SQLite
+    :param src_url: 源数据库连接串
+    :param dst_url: 目标数据库连接串，表不存在时自动创建
+    :param batch: 每批复制的行数
+    :param replace: 目标表已有数据时是否先清空，否则跳过该表
+    :return: {表名: 复制的行数}
+    """
+    LOG = logging.getLogger("migrate")
+    src = Database(src_url)
+    dst = Database(dst_url)
+    dst.bootstrap()
+
+    copied = {}
+    for table in Base.metadata.sorted_tables:
+        with dst.writer.begin() as conn:
+            if conn.execute(select(func.count()).select_from(table)).scalar():
+                if not replace:
+                    LOG.warning(f"目标表 {table.name} 已有数据，跳过（--replace 先清空再复制）")
+                    continue
+                conn.execute(table.delete())
+
+        n = 0
+        with src.reader.connect() as s:
+            rows = s.execution_options(stream_results=True).execute(select(table).order_by(*table.primary_key))
+            while True:
+                chunk = [dict(r._mapping) for r in rows.fetchmany(batch)]
+                if not chunk:
+                    break
+                with dst.writer.begin() as conn:  # 每批一个事务
+                    conn.execute(table.insert(), chunk)
+                n += len(chunk)
+        copied[table.name] = n
+        LOG.info(f"{table.name}：复制 {n} 行")
+    return copied
+
+
+if __name__ == "__main__":
+    from configuration import Config
+
+    conf = Config()  # 同时按配置初始化日志
+    parser = ArgumentParser(description="在数据库之间复制机器人数据，例如 MySQL 迁移到 SQLite")
+    parser.add_argument("src", help="源数据库，例如 mysql+pymysql://用户名:密码@主机:3306/库名")
+    parser.add_argument("dst", nargs="?", default=conf.URL, help=f"目标数据库，默认为配置中的 {conf.URL}")
+    parser.add_argument("--batch", type=int, default=1000, help="每批复制的行数")
+    parser.add_argument("--replace", action="store_true", help="目标表已有数据时先清空")
+    args = parser.parse_args()
+    print(migrate(args.src, args.dst, args.batch, args.replace))
@@ -1,9 +1,7 @@
 # models.py
-from sqlalchemy import create_engine, Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, String, Boolean, Float, Index, Text
 from sqlalchemy.ext.declarative import declarative_base
-from configuration import Config
 
-conf = Config()
 # 创建一个基础类
 Base = declarative_base()
 
@@ -14,16 +12,27 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)  # id, 主键，自增
     wechat_id = Column(String(255), unique=True, nullable=False)  # 微信ID, 唯一，不可为空
-    points = Column(Integer, default=0)  # 积分，默认为0
+    points = Column(Integer, default=0, index=True)  # 积分，默认为0；排行榜按积分排序
     is_blacklisted = Column(Boolean, default=False)  # 是否被拉黑，默认为否（False）
     is_super_admin = Column(Boolean, default=False)  # 是否为超级管理员，默认为否（False）
 
 
-# # 数据库连接配置
-# DATABASE_URL = conf.URL
-#
-# # 创建数据库引擎
-# engine = create_engine(DATABASE_URL, echo=True)
-#
-# # 创建所有表
-# Base.metadata.create_all(engine)
+# 消息记录：收到的每条消息和发出的每条回复，用于审计和重启后恢复上下文
+class Message(Base):
+    __tablename__ = 'messages'
+    __table_args__ = (
+        Index("ix_messages_roomid_ts", "roomid", "ts"),
+        Index("ix_messages_sender_ts", "sender", "ts"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # 自增，按时间递增，清理时按 id 分段删除
+    ts = Column(Float, nullable=False)  # 时间戳，秒
+    msg_id = Column(String(32))  # 微信消息 id，发出的消息为空
+    type = Column(Integer, default=0x01)  # 消息类型，发出的消息为文本
+    roomid = Column(String(255), nullable=False)  # 会话：群聊为 roomid，私聊为对方 wxid
+    sender = Column(String(255), nullable=False)  # 发送者 wxid，发出的消息为机器人自己
+    content = Column(Text)  # 消息内容
+    outgoing = Column(Boolean, default=False)  # 是否为机器人发出的消息
+
+
+# 数据库连接和建表见 engine.py
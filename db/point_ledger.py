@@ -0,0 +1,157 @@
+# point_ledger.py
+import atexit
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.metrics import DB_SECONDS, timed
+from .models import User
+
+
+class Reservation(object):
+    """预扣的积分：调用大模型等操作成功后 commit()，失败则 refund() 退回"""
+
+    __slots__ = ("ledger", "wechat_id", "amount", "settled")
+
+    def __init__(self, ledger, wechat_id: str, amount: int) -> None:
+        self.ledger = ledger
+        self.wechat_id = wechat_id
+        self.amount = amount
+        self.settled = False
+
+    def commit(self) -> None:
+        # 积分在预扣时已经扣除，这里只标记完成
+        self.settled = True
+
+    def refund(self) -> None:
+        if not self.settled:
+            self.settled = True
+            self.ledger.add(self.wechat_id, self.amount)
+
+
+class PointLedger(object):
+    """积分账本
+
+    扣积分用一条带条件的 UPDATE points = points - :n WHERE points >= :n 原子完成，
+    多个线程、多个进程同时处理同一个用户也不会扣成负数或丢失更新；
+    加积分和退款先记在内存里，每隔 flush_ms 毫秒合并成一个事务写入数据库。
+    """
+
+    def __init__(self, session_factory: Callable, flush_ms: int = 200, listeners: Iterable = ()) -> None:
+        """
+        :param session_factory: 数据库 Session 工厂
+        :param flush_ms: 写入间隔，毫秒，0 表示每次加积分立即写入
+        :param listeners: 写入数据库后调用 update_points(wechat_id, delta, created) 同步的对象，例如用户缓存、排行榜
+        """
+        self.LOG = logging.getLogger("PointLedger")
+        self.Session = session_factory
+        self.flush_ms = flush_ms
+        self.listeners = list(listeners)
+        self._pending: Dict[str, int] = {}  # 未写入数据库的积分变化
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._flushes = 0
+        self._flushed_rows = 0
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="PointLedger", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def add(self, wechat_id: str, delta: int) -> None:
+        """加（或减）积分，不检查余额，稍后批量写入"""
+        if not delta:
+            return
+        with self._lock:
+            self._pending[wechat_id] = self._pending.get(wechat_id, 0) + delta
+        if self.flush_ms <= 0:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def pending(self, wechat_id: str) -> int:
+        """尚未写入数据库的积分变化"""
+        with self._lock:
+            return self._pending.get(wechat_id, 0)
+
+    @timed(DB_SECONDS, "ledger_reserve")
+    def reserve(self, wechat_id: str, amount: int) -> Optional[Reservation]:
+        """
+        预扣积分，余额（含未写入的变化）不足时返回 None
+        :return: 预扣句柄，操作完成后 commit() 或 refund()
+        """
+        with self._lock:
+            delta = self._pending.pop(wechat_id, 0)
+        n = 0
+        session = self.Session()
+        try:
+            n = session.query(User).filter(User.wechat_id == wechat_id, User.points + delta >= amount) \
+                .update({User.points: User.points + delta - amount}, synchronize_session=False)
+            session.commit()
+            if n:
+                for listener in self.listeners:
+                    listener.update_points(wechat_id, delta - amount)
+        except SQLAlchemyError:
+            session.rollback()
+            n = 0
+            raise
+        finally:
+            session.close()
+            if not n and delta:  # 未扣成功，未写入的变化放回去
+                with self._lock:
+                    self._pending[wechat_id] = self._pending.get(wechat_id, 0) + delta
+        return Reservation(self, wechat_id, amount) if n else None
+
+    @timed(DB_SECONDS, "ledger_flush")
+    def flush(self) -> None:
+        """把内存中的积分变化写入数据库，失败的留到下次"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+
+        created = set()
+        session = self.Session()
+        try:
+            for wechat_id, delta in batch.items():
+                n = session.query(User).filter(User.wechat_id == wechat_id) \
+                    .update({User.points: User.points + delta}, synchronize_session=False)
+                if not n:
+                    session.add(User(wechat_id=wechat_id, points=delta))
+                    created.add(wechat_id)
+            session.commit()
+            for wechat_id, delta in batch.items():
+                for listener in self.listeners:
+                    listener.update_points(wechat_id, delta, wechat_id in created)
+            self._flushes += 1
+            self._flushed_rows += len(batch)
+        except SQLAlchemyError as e:
+            session.rollback()
+            self.LOG.error(f"写入积分失败，稍后重试：{e}")
+            with self._lock:
+                for wechat_id, delta in batch.items():
+                    self._pending[wechat_id] = self._pending.get(wechat_id, 0) + delta
+        finally:
+            session.close()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_ms / 1000)
+            try:
+                self.flush()
+            except Exception as e:
+                self.LOG.error(f"积分写入线程出错：{e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pending_users": len(self._pending),
+                "flushes": self._flushes,
+                "flushed_rows": self._flushed_rows,
+            }
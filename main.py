@@ -1,6 +1,8 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from core.startup import STARTUP  # 最先导入，作为启动计时的起点
+
 import signal
 from argparse import ArgumentParser
 
@@ -8,11 +10,22 @@ from base.func_report_reminder import ReportReminder
 from configuration import Config
 from constants import ChatType
 from robot import Robot, __version__
+from robot_async import AsyncRobot
 from wcferry import Wcf
 
-def main(chat_type: int):
-    config = Config()
-    wcf = Wcf(debug=True)
+def main(chat_type: int, use_async: bool = False, account: dict = None, setup=None):
+    """
+    :param account: 多账号模式下的账号配置，见 config.yaml 的 accounts，单账号运行时为 None
+    :param setup: 机器人创建后、开始收消息前的回调 setup(robot)，供 supervisor 挂接协调和心跳
+    """
+    STARTUP.mark("导入模块")
+    with STARTUP.stage("读取配置"):
+        config = Config()
+    account = account or {}
+    if account.get("metrics_port"):
+        config.METRICS = {**config.METRICS, "port": account["metrics_port"]}
+    with STARTUP.stage("连接 wcferry"):
+        wcf = Wcf(host=account.get("host"), port=account.get("port", 10086), debug=True)
 
     def handler(sig, frame):
         wcf.cleanup()  # 退出前清理环境
@@ -20,8 +33,15 @@ def main(chat_type: int):
 
     signal.signal(signal.SIGINT, handler)
 
-    robot = Robot(config, wcf, chat_type)
-    robot.LOG.info(f"WeChatRobot【{__version__}】成功启动···")
+    with STARTUP.stage("创建机器人（合计）"):
+        if use_async:
+            robot = AsyncRobot(config, wcf, chat_type)
+        else:
+            robot = Robot(config, wcf, chat_type)
+    if setup:
+        setup(robot)
+    robot.LOG.info(f"WeChatRobot【{__version__}】成功启动···{'（asyncio 模式）' if use_async else ''}")
+    robot.LOG.info(STARTUP.report())
 
     # 机器人启动发送测试消息
     robot.sendTextMsg("机器人启动成功！", "filehelper")
@@ -31,20 +51,25 @@ def main(chat_type: int):
     robot.enableReceivingMsg()  # 加队列
 
     # 每天 7 点发送天气预报
-    # robot.onEveryTime("07:00", robot.weatherReport)
+    # robot.onEveryTime("07:00", robot.runOnce, "weatherReport", robot.weatherReport, period="%Y%m%d")
 
     # 每天 7:30 发送新闻
-    robot.onEveryTime("07:00", robot.newsReport)
+    # 多账号时只由一个账号发送
+    robot.onEveryTime("07:00", robot.runOnce, "newsReport", robot.newsReport, period="%Y%m%d")
 
     # 每天 16:30 提醒发日报周报月报
-    # robot.onEveryTime("16:30", ReportReminder.remind, robot=robot)
+    # robot.onEveryTime("16:30", robot.runOnce, "reportRemind", ReportReminder.remind, robot=robot, period="%Y%m%d")
 
     # 让机器人一直跑
-    robot.keepRunningAndBlockProcess()
+    if use_async:
+        robot.runForever()  # 在事件循环中收消息、执行定时任务
+    else:
+        robot.keepRunningAndBlockProcess()
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument('-c', type=int, default=0, help=f'选择模型参数序号: {ChatType.help_hint()}')
-    args = parser.parse_args().c
-    main(args)
+    parser.add_argument('--async', dest='use_async', action='store_true', help='使用 asyncio 模式运行')
+    args = parser.parse_args()
+    main(args.c, args.use_async)
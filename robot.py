@@ -1,30 +1,44 @@
 # -*- coding: utf-8 -*-
+import atexit
 import json
 import logging
+import os
 import re
 import time
 import xml.etree.ElementTree as ET
-from functools import wraps
 from queue import Empty
 from threading import Thread
-from base.func_zhipu import ZhiPu
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Optional, Set, Tuple
 
 from wcferry import Wcf, WxMsg
 
-from base.func_bard import BardAssistant
-from base.func_chatglm import ChatGLM
-from base.func_ollama import Ollama
-from base.func_chatgpt import ChatGPT
 from base.func_chengyu import cy, CONTEXT_FILE
-from base.func_weather import Weather
-from base.func_news import News
-from base.func_tigerbot import TigerBot
-from base.func_xinghuo_web import XinghuoWeb
+from base import providers
+from base.providers import create_chat
 from configuration import Config
-from constants import ChatType
+from core.chatroom_cache import ChatroomMemberCache
+from core.chunker import SentenceChunker
+from core.coalescer import ReplyCoalescer
+from core.config_watcher import ConfigWatcher
+from core.conversation_store import CONVERSATIONS
+from core.command_router import CommandRouter, command, command_fallback, on_msg_type
+from core.contact_directory import ContactDirectory
+from core.debounce import MsgDebouncer
+from core.dedup import MsgDeduplicator
+from core.metrics import ERRORS, LLM_FIRST_SECONDS, LLM_SECONDS, MESSAGES, REGISTRY, SEND_SECONDS, STAGE_SECONDS
+from core.metrics import start_http_server
+from core.profiler import SamplingProfiler, format_summary
+from core.rate_limiter import RateLimiter
+from core.response_cache import ResponseCache
+from core.send_queue import SendQueue, SendTicket
+from core.startup import STARTUP
+from core.msg_lanes import LANE_ADMIN, LANE_CHAT, LANE_CHENGYU, LANE_COMMAND, MsgLanes
 from job_mgmt import Job
 import db
 
+if TYPE_CHECKING:  # 只用于类型标注，不在导入时加载数据库模块
+    from db.point_ledger import Reservation
+
 __version__ = "39.2.4.0"
 
 
@@ -32,151 +46,238 @@ class Robot(Job):
     """个性化自己的机器人
     """
 
+    # 每次使用时都从 config 读取的配置项，更新后无需额外处理
+    LIVE_SECTIONS = frozenset({"logging", "groups", "roots", "forward", "news", "weather", "report_reminder",
+                               "stream"})
+
     def __init__(self, config: Config, wcf: Wcf, chat_type: int) -> None:
         self.wcf = wcf
         self.config = config
         self.LOG = logging.getLogger("Robot")
+        # 连接数据库、建表，使用机器人的配置，不再另外读取一次
+        with STARTUP.stage("数据库"):
+            db.init(self.config)
         self.wxid = self.wcf.get_self_wxid()
-        self.allContacts = self.getAllContacts()
-        self._msg_timestamps = []
-        self.BOT_FUNC = {
-            '#菜单': self.botMenu,
-            '#转发': self.botForward,
-            '#新闻': self.newsReport,
-            "#成语": "",
-            "？成语": "",
-            "#当前成语": "",
-            "#重置成语": "",
-
-        }
-
-        if ChatType.is_in_chat_types(chat_type):
-            if chat_type == ChatType.TIGER_BOT.value and TigerBot.value_check(self.config.TIGERBOT):
-                self.chat = TigerBot(self.config.TIGERBOT)
-            elif chat_type == ChatType.CHATGPT.value and ChatGPT.value_check(self.config.CHATGPT):
-                self.chat = ChatGPT(self.config.CHATGPT)
-            elif chat_type == ChatType.XINGHUO_WEB.value and XinghuoWeb.value_check(self.config.XINGHUO_WEB):
-                self.chat = XinghuoWeb(self.config.XINGHUO_WEB)
-            elif chat_type == ChatType.CHATGLM.value and ChatGLM.value_check(self.config.CHATGLM):
-                self.chat = ChatGLM(self.config.CHATGLM)
-            elif chat_type == ChatType.BardAssistant.value and BardAssistant.value_check(self.config.BardAssistant):
-                self.chat = BardAssistant(self.config.BardAssistant)
-            elif chat_type == ChatType.ZhiPu.value and ZhiPu.value_check(self.config.ZhiPu):
-                self.chat = ZhiPu(self.config.ZhiPu)
-            elif chat_type == ChatType.OLLAMA.value and Ollama.value_check(self.config.OLLAMA):
-                self.chat = Ollama(self.config.OLLAMA)
-            else:
-                self.LOG.warning("未配置模型")
-                self.chat = None
-        else:
-            if TigerBot.value_check(self.config.TIGERBOT):
-                self.chat = TigerBot(self.config.TIGERBOT)
-            elif ChatGPT.value_check(self.config.CHATGPT):
-                self.chat = ChatGPT(self.config.CHATGPT)
-            elif Ollama.value_check(self.config.OLLAMA):
-                self.chat = Ollama(self.config.OLLAMA)
-            elif XinghuoWeb.value_check(self.config.XINGHUO_WEB):
-                self.chat = XinghuoWeb(self.config.XINGHUO_WEB)
-            elif ChatGLM.value_check(self.config.CHATGLM):
-                self.chat = ChatGLM(self.config.CHATGLM)
-            elif BardAssistant.value_check(self.config.BardAssistant):
-                self.chat = BardAssistant(self.config.BardAssistant)
-            elif ZhiPu.value_check(self.config.ZhiPu):
-                self.chat = ZhiPu(self.config.ZhiPu)
-            else:
-                self.LOG.warning("未配置模型")
-                self.chat = None
+        # 联系人在后台加载，不阻塞启动
+        self.contacts = ContactDirectory(self.wcf,
+                                         page_size=self.config.CONTACTS.get("page_size", 5000),
+                                         full_every=self.config.CONTACTS.get("full_every", 12))
+        self.contacts.start()
+        self.onEveryMinutes(self.config.CONTACTS.get("refresh_minutes", 5), self.contacts.refresh_async)
+        self.dedup = MsgDeduplicator(capacity=self.config.DEDUP.get("capacity", 10000),
+                                     window=self.config.DEDUP.get("window", 600))
+        # 消息记录，写入在后台批量进行
+        self.history = db.history if self.config.HISTORY.get("enable", True) else None
+        self.msgLanes = MsgLanes(self.onMsg, self.classifyMsg, self.conversationKey,
+                                 conf=self.config.WORKER_POOL.get("lanes"), on_shed=self.onMsgShed)
+        self.debouncer = MsgDebouncer(self.onDebounced, quiet=self.config.DEBOUNCE.get("quiet", 1.0),
+                                      max_wait=self.config.DEBOUNCE.get("max_wait", 5),
+                                      max_parts=self.config.DEBOUNCE.get("max_parts", 5))
+        self.debouncer.start()
+        self.memberCache = ChatroomMemberCache(self.wcf, ttl=self.config.CHATROOM_CACHE.get("ttl", 600))
+        # 定时清理过期的群成员缓存
+        self.onEveryMinutes(self.config.CHATROOM_CACHE.get("expire_minutes", 30), self.memberCache.expire)
+        self.rateLimiter = RateLimiter(global_limit=self.config.SEND_RATE_LIMIT,
+                                       receiver_limit=self.config.RATE_LIMIT.get("receiver", 0),
+                                       receiver_limits=self.config.RATE_LIMIT.get("groups"),
+                                       burst=self.config.RATE_LIMIT.get("burst", 0))
+        self.sendQueue = SendQueue(self._sendTextNow,
+                                   queue_size=self.config.SEND_QUEUE.get("queue_size", 0),
+                                   delay_min=self.config.SEND_QUEUE.get("delay_min", 0.3),
+                                   delay_max=self.config.SEND_QUEUE.get("delay_max", 1.3),
+                                   limiter=self.rateLimiter,
+                                   max_defer=self.config.RATE_LIMIT.get("max_defer", 300),
+                                   max_deferred=self.config.RATE_LIMIT.get("max_deferred", 1000))
+        self.sendQueue.start()
+        conf = self.config.REPLY_COALESCE
+        self.coalescer = ReplyCoalescer(self.sendQueue, window=conf.get("window", 0.5), max_wait=conf.get("max_wait", 2),
+                                        max_length=conf.get("max_length", 2000))
+        self.coalescer.start()
+        # 常见问题的回答缓存，命中时不调用大模型
+        conf = self.config.RESPONSE_CACHE
+        self.responseCache = None
+        # 群聊的对话按群共用，每个群里已经和大模型聊过的人，见 isFirstTurn
+        self.roomAskers: Dict[str, Set[str]] = {}
+        if conf.get("enable", True):
+            self.responseCache = ResponseCache(max_size=conf.get("max_size", 1000), ttl=conf.get("ttl", 3600),
+                                               path=conf.get("path") or None)
+            if self.responseCache.path:
+                self.onEveryMinutes(conf.get("save_minutes", 5), self.responseCache.save)
+                atexit.register(self.responseCache.save)
+
+        self.router = CommandRouter.from_object(self)
+        self.enableMetrics()
+        self.coordinator = None  # 多账号模式下由 supervisor 设置，见 runOnce
+        self.profiler = SamplingProfiler(interval=self.config.PROFILER.get("interval", 0.005),
+                                         out_dir=self.config.PROFILER.get("out_dir", "profile"))
+
+        # 各模型共用的对话记录，闲置的对话定时移出内存
+        self.configureConversations()
+        self.onEveryMinutes(1, CONVERSATIONS.expire)
+        atexit.register(CONVERSATIONS.spill_all)
+
+        # 只导入选中的模型，其他模型的依赖不加载
+        self.chatType = chat_type
+        self.chat = create_chat(chat_type, self.config, wcf=self.wcf, sender=self.sendTextMsg)
 
         self.LOG.info(f"已选择: {self.chat}")
 
+        # 监视 config.yaml，修改后自动应用，不必再发“^更新$”
+        self.configWatcher = None
+        if self.config.CONFIG_WATCH.get("enable", True):
+            self.configWatcher = ConfigWatcher(self.config, self.onConfigChanged,
+                                               interval=self.config.CONFIG_WATCH.get("interval", 2))
+            self.configWatcher.start()
+
+    def configureConversations(self) -> None:
+        """按配置设置对话记录的上限；写出目录按账号区分，多账号模式下互不影响"""
+        conf = self.config.CONVERSATION
+        spill_dir = conf.get("spill_dir", "conversations")
+        if spill_dir:
+            spill_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), spill_dir, self.wxid)
+        CONVERSATIONS.configure(max_conversations=conf.get("max_conversations", 1000),
+                                max_turns=conf.get("max_turns", 20),
+                                max_tokens=conf.get("max_tokens", 4000),
+                                idle_seconds=conf.get("idle_minutes", 30) * 60,
+                                spill_dir=spill_dir,
+                                spill_days=conf.get("spill_days", 7))
+
+    def onConfigChanged(self, changed: Set[str]) -> None:
+        """
+        把有变化的配置应用到运行中的组件，只处理变化的部分
+        :param changed: 有变化的顶层配置项，见 Config.apply
+        """
+        pending = set(changed) - self.LIVE_SECTIONS
+        if pending & {"send_rate_limit", "rate_limit"}:
+            conf = self.config.RATE_LIMIT
+            self.rateLimiter.configure(global_limit=self.config.SEND_RATE_LIMIT,
+                                       receiver_limit=conf.get("receiver", 0),
+                                       receiver_limits=conf.get("groups"),
+                                       burst=conf.get("burst", 0))
+            self.sendQueue.max_defer = conf.get("max_defer", 300)
+            self.sendQueue.max_deferred = conf.get("max_deferred", 1000)
+            pending -= {"send_rate_limit", "rate_limit"}
+        if "send_queue" in pending:
+            # 队列长度在创建时确定，只更新发送间隔
+            conf = self.config.SEND_QUEUE
+            self.sendQueue.delay_min = conf.get("delay_min", 0.3)
+            self.sendQueue.delay_max = max(self.sendQueue.delay_min, conf.get("delay_max", 1.3))
+            pending.discard("send_queue")
+        if "reply_coalesce" in pending:
+            conf = self.config.REPLY_COALESCE
+            self.coalescer.window = conf.get("window", 0.5)
+            self.coalescer.max_wait = max(self.coalescer.window, conf.get("max_wait", 2))
+            self.coalescer.max_length = conf.get("max_length", 2000)
+            self.coalescer.start()  # 原来关闭（window 为 0）时启动
+            pending.discard("reply_coalesce")
+        if "debounce" in pending:
+            conf = self.config.DEBOUNCE
+            self.debouncer.quiet = conf.get("quiet", 1.0)
+            self.debouncer.max_wait = max(self.debouncer.quiet, conf.get("max_wait", 5))
+            self.debouncer.max_parts = max(1, conf.get("max_parts", 5))
+            self.debouncer.start()
+            pending.discard("debounce")
+        if "chatroom_cache" in pending:
+            self.memberCache.ttl = self.config.CHATROOM_CACHE.get("ttl", 600)
+            pending.discard("chatroom_cache")
+        if "response_cache" in pending and self.responseCache:
+            # 不参与缓存的群每次使用时读取，这里只更新容量和有效期
+            self.responseCache.max_size = self.config.RESPONSE_CACHE.get("max_size", 1000)
+            self.responseCache.ttl = self.config.RESPONSE_CACHE.get("ttl", 3600)
+            pending.discard("response_cache")
+        if "conversation" in pending:
+            self.configureConversations()
+            pending.discard("conversation")
+        if "config_watch" in pending:
+            if self.configWatcher:
+                self.configWatcher.interval = self.config.CONFIG_WATCH.get("interval", 2)
+            pending.discard("config_watch")
+
+        # 只有可能被选中的模型的配置变了才重建，新模型创建好后再替换，处理中的消息继续用旧模型
+        models = providers.sections(self.chatType)
+        if pending & models:
+            chat = create_chat(self.chatType, self.config, wcf=self.wcf, sender=self.sendTextMsg)
+            if chat is not None:
+                self.chat = chat
+                self.LOG.info(f"已重新选择: {self.chat}")
+        pending -= {p.section for p in providers.PROVIDERS}
+
+        if pending:
+            self.LOG.warning(f"以下配置需要重启后生效：{', '.join(sorted(pending))}")
+
     @staticmethod
     def value_check(args: dict) -> bool:
         if args:
             return all(value is not None for key, value in args.items() if key != 'proxy')
         return False
 
-    # 机器人指令识别
-    def is_bot_command(func):
-        """装饰器判断消息是否为机器人指令，执行相应的操作"""
-
-        @wraps(func)
-        def wrapper(self, msg):
-            texts = re.findall(r"^([#?？!！%])([\s\S]*)$", msg.content)
-            # print(f"texts:{texts}")
-            if texts:
-                flag, text = texts[0]  # 拆分符号和文本内容
-                matches = re.findall(r"^(转发)([\s\S]*)$", text)
-                commends, content = matches[0] if matches else (None, None)
-
-                if flag == "#":
-                    if text == "菜单":
-                        # print("菜单函数")
-                        self.botMenu(msg)
-                    elif text == "新闻":
-                        # print("新闻函数")
-                        self.newsReport(msg)
-                        db.update_user_points(msg.sender, -1)
-                    elif commends == "转发" and content:
-                        # print("转发函数")
-                        self.botForward(msg)
-                    elif text == "积分":
-                        self.get_wx_points(msg)
-
-                    elif text == "类型":
-                        self.get_all_type_msg()
-                    elif text == "friendList":
-                        self.get_friend_info()
-                    return  # 直接跳过，不执行原函数
-
-            # 如果没有命中指令，执行原函数
-            return func(self, msg)
-
-        return wrapper
-
-    def is_chengyu_command(func):
-        """装饰器判断消息是否为成语相关指令，执行相应的操作"""
-
-        @wraps(func)
-        def wrapper(self, msg):
-            # 匹配以#开头的成语指令
-            texts = re.findall(r"^([#?？])(.*)$", msg.content)
-            if texts:
-                flag, text = texts[0]  # 拆分符号和文本内容  # 获取用户的微信ID
-                # 处理不同的成语相关指令
-                if flag == "#":
-                    if cy.isChengyu(text):
-                        status, res = cy.getNext(msg.sender, text)
-                        if status:
-                            res += "\n积分+2"
-                            self.sendTextMsg(res, msg.roomid, msg.sender)
-                            db.update_user_points(msg.sender, 2)
-                            return
-                        else:
-                            self.sendTextMsg(res, msg.roomid, msg.sender)
-                            return
-                    elif flag in ["?", "？"]:  # 查词
-                        if cy.isChengyu(text):
-                            rsp = cy.getMeaning(text)
-                            if rsp:
-                                self.sendTextMsg(rsp, msg.roomid, msg.sender)
-                                return
-                    elif text == "当前成语":
-                        # 查询当前成语
-                        self.sendTextMsg(cy.query_current_chengyu(msg.sender), msg.roomid, msg.sender)
-                        return
-                    elif text == "重置成语":
-                        # 重置成语
-                        self.sendTextMsg(cy.reset_current_chengyu(msg.sender), msg.roomid, msg.sender)
-                        return
-                elif flag in ["?", "？"]:
-                    # 查询成语的意义
-                    self.sendTextMsg(cy.getMeaning(text), msg.roomid, msg.sender)
-                    return
-            return func(self, msg)  # 如果不是成语指令，执行原函数
+    # 机器人指令：用 @command 注册，启动时由 CommandRouter 统一建表，菜单和权限检查都来自这张表
+    @command_fallback("#", desc="成语接龙：#成语", lane=LANE_CHENGYU, accept=lambda text: cy.isChengyu(text))
+    def chengyuNext(self, msg: WxMsg, text: str) -> bool:
+        """成语接龙"""
+        status, res = cy.getNext(msg.sender, text)
+        if status:
+            res += "\n积分+2"
+            self.sendTextMsg(res, msg.roomid, msg.sender)
+            db.ledger.add(msg.sender, 2)
+        else:
+            self.sendTextMsg(res, msg.roomid, msg.sender)
+        return True
 
-        return wrapper
+    @command_fallback("?", "？", desc="成语答疑：？成语", lane=LANE_CHENGYU)
+    def chengyuMeaning(self, msg: WxMsg, text: str) -> bool:
+        """查询成语的意义，不是成语时不处理"""
+        rsp = cy.getMeaning(text)
+        if not rsp:
+            return False
+        self.sendTextMsg(rsp, msg.roomid, msg.sender)
+        return True
+
+    @command("#当前成语", desc="查询当前接龙成语：#当前成语", lane=LANE_CHENGYU)
+    def chengyuCurrent(self, msg: WxMsg, text: str) -> None:
+        self.sendTextMsg(cy.query_current_chengyu(msg.sender), msg.roomid, msg.sender)
+
+    @command("#重置成语", desc="成语重置：#重置成语", lane=LANE_CHENGYU)
+    def chengyuReset(self, msg: WxMsg, text: str) -> None:
+        self.sendTextMsg(cy.reset_current_chengyu(msg.sender), msg.roomid, msg.sender)
+
+    def runCommand(self, msg: WxMsg) -> bool:
+        """
+        执行机器人指令
+        :return: 是否已作为指令处理，`False` 时按普通消息继续处理
+        """
+        matched = self.router.match(msg.content)
+        if not matched:
+            return False
 
-    def get_wx_points(self, msg: WxMsg):
+        cmd, text = matched
+        if cmd.admin_only and msg.sender not in self.config.ROOTIDS:
+            return not cmd.fallback  # 非管理员的具体指令直接忽略
+
+        # 先预扣积分，指令没有处理或出错时退回
+        reservation = None
+        if cmd.cost > 0:
+            reservation = db.ledger.reserve(msg.sender, cmd.cost)
+            if not reservation:
+                self.replyMsg(msg, "积分不足！")
+                return True
+
+        try:
+            handled = cmd.handler(msg, text) is not False
+        except Exception:
+            if reservation:
+                reservation.refund()
+            raise
+
+        if reservation:
+            if handled:
+                reservation.commit()
+            else:
+                reservation.refund()
+        return handled
+
+    @command("#积分", desc="查询积分：#积分")
+    def get_wx_points(self, msg: WxMsg, text: str = ""):
         points = db.get_points(msg.sender)
         if msg.from_group():
             res = f"你当前的积分为：{points}"
@@ -186,13 +287,42 @@ class Robot(Job):
             self.sendTextMsg(res, msg.sender)
         return True
 
-    def botForward(self, msg: WxMsg) -> None:
+    @command("#排行榜", desc="积分排行榜：#排行榜")
+    def pointsRanking(self, msg: WxMsg, text: str = "") -> bool:
+        """群里看本群成员的排行，私聊看全局排行"""
+        n = self.config.LEADERBOARD.get("top", 10)
+        if msg.from_group():
+            members = self.memberCache.members(msg.roomid)
+            rows = db.ranking.top(n, msg.roomid, members)
+            mine = db.ranking.rank(msg.sender, msg.roomid, members)
+            title = "本群积分排行榜"
+
+            def name(wxid: str) -> str:
+                return members.get(wxid) or wxid
+        else:
+            rows = db.ranking.top(n)
+            mine = db.ranking.rank(msg.sender)
+            title = "积分排行榜"
+
+            def name(wxid: str) -> str:
+                return self.contacts.get(wxid) or wxid
+
+        lines = [title] + [f"{rank}. {name(wxid)}：{points}" for rank, wxid, points in rows]
+        if mine:
+            lines.append(f"你排第 {mine[0]} 名（{mine[1]} 积分，共 {mine[2]} 人）")
+        else:
+            lines.append("你还没有积分")
+        self.replyMsg(msg, "\n".join(lines))
+        return True
+
+    @command("#转发", desc="转发消息：#转发内容", admin_only=True, prefix=True)
+    def botForward(self, msg: WxMsg, text: str = "") -> None:
         """
         转发消息
         @param msg:
         @return: None
         """
-        if msg.sender not in self.config.ROOTIDS:
+        if not text:
             return
         try:
             for i in self.config.BOT_TEXT_FORWARD:
@@ -201,11 +331,13 @@ class Robot(Job):
             self.LOG.error(f"转发函数内部：{e}")
             return
 
-    def botMenu(self, msg: WxMsg) -> bool:
+    @command("#菜单", desc="菜单：#菜单")
+    def botMenu(self, msg: WxMsg, text: str = "") -> bool:
         """
         return: 返回机器人菜单
         """
-        menu = "\n".join(self.BOT_FUNC.keys())
+        cmds = self.router.commands(include_admin=msg.sender in self.config.ROOTIDS)
+        menu = "\n".join(f"{c.desc}（{c.cost}积分）" if c.cost else c.desc for c in cmds)
         if menu:
             if msg.from_group():
                 self.sendTextMsg(menu, msg.roomid)
@@ -225,36 +357,190 @@ class Robot(Job):
     def toChitchat(self, msg: WxMsg) -> bool:
         """闲聊，接入 ChatGPT
         """
+        with STAGE_SECONDS.time("chitchat"):
+            return self._toChitchat(msg)
+
+    def _toChitchat(self, msg: WxMsg) -> bool:
         if not self.chat:  # 没接 ChatGPT，固定回复
-            rsp = "你@我干嘛？"
-
-        else:  # 接了 ChatGPT，智能回复
-            points = db.get_points(msg.sender)
-            if points < 1:
-                rsp = "积分不足！"
-                if msg.from_group():
-
-                    self.sendTextMsg(rsp, msg.roomid, msg.sender)
-                    return False
-                else:
-                    self.sendTextMsg(rsp, msg.sender)
-                    return False
-            q = re.sub(r"@.*?[\u2005|\s]", "", msg.content).replace(" ", "")
-            rsp = self.chat.get_answer(q, (msg.roomid if msg.from_group() else msg.sender))
+            self.replyMsg(msg, "你@我干嘛？")
+            return True
 
+        # 接了 ChatGPT，智能回复：先预扣积分，拿不到答案时退回
+        reservation = self.reserveChitchat(msg)
+        if not reservation:
+            return False
+        try:
+            rsp = self.answerChitchat(msg)
+        except Exception:
+            reservation.refund()
+            raise
+        return self.settleChitchat(reservation, rsp)
+
+    def reserveChitchat(self, msg: WxMsg) -> Optional["Reservation"]:
+        """闲聊预扣 1 积分，积分不足时回复提示并返回 None"""
+        reservation = db.ledger.reserve(msg.sender, 1)
+        if not reservation:
+            self.replyMsg(msg, "积分不足！")
+        return reservation
+
+    def settleChitchat(self, reservation: "Reservation", rsp: str) -> bool:
+        """拿到回答时确认扣分，否则退回；返回是否成功"""
         if rsp:
-            if msg.from_group():
-                self.sendTextMsg(rsp, msg.roomid, msg.sender)
-            else:
-                self.sendTextMsg(rsp, msg.sender)
-            db.update_user_points(msg.sender, -1)
+            reservation.commit()
             return True
+        reservation.refund()
+        self.LOG.error(f"无法从 ChatGPT 获得答案")
+        return False
+
+    def answerChitchat(self, msg: WxMsg) -> str:
+        """
+        问大模型并回复，先查回答缓存
+        :return: 回答，拿不到答案时为空
+        """
+        question = self.chitchatQuestion(msg)
+        cacheKey, rsp = self.cachedAnswer(msg, question)
+        if rsp:
+            return rsp
+
+        start = time.perf_counter()
+        if self.canStream():
+            rsp = self.streamChitchat(msg)
         else:
-            self.LOG.error(f"无法从 ChatGPT 获得答案")
+            with LLM_SECONDS.time(type(self.chat).__name__):
+                rsp = self.chat.get_answer(question, self.conversationKey(msg))
+            if rsp:
+                self.replyMsg(msg, rsp)
+        self.storeAnswer(cacheKey, rsp, start)
+        return rsp
+
+    def cachedAnswer(self, msg: WxMsg, question: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        查回答缓存，命中时直接回复
+        :return: (缓存键, 命中的回答)，不能使用缓存时缓存键为 None
+        """
+        cacheKey = self.responseCacheKey(msg, question)
+        rsp = self.responseCache.get(cacheKey) if cacheKey else None
+        if rsp:
+            remember = getattr(self.chat, "remember", None)
+            if remember:  # 模型没有被调用，补记这一轮对话
+                remember(question, rsp, self.conversationKey(msg))
+            self.replyMsg(msg, rsp)
+        return cacheKey, rsp
+
+    def storeAnswer(self, cacheKey: Optional[str], rsp: str, start: float) -> None:
+        """把大模型的回答放入缓存，start 为开始调用大模型的时间（perf_counter）"""
+        if cacheKey and rsp:
+            self.responseCache.put(cacheKey, rsp, time.perf_counter() - start)
+
+    def responseCacheKey(self, msg: WxMsg, question: str) -> Optional[str]:
+        """
+        可以使用回答缓存时返回缓存键
+        只缓存会话的第一轮（群聊为发送者在群里的第一轮，或不保存历史的模型），有上下文的追问答案取决于之前的对话，不缓存。
+        保存历史的模型需要提供 remember(question, answer, wxid)，命中缓存时把这一轮记入对话；
+        没有的（例如 Ollama 保存的是 token 上下文，无法补记文本）不使用缓存，否则追问时模型不知道上一轮说了什么
+        """
+        if not self.responseCache or not question:
+            return None
+        if msg.from_group() and msg.roomid in (self.config.RESPONSE_CACHE.get("exclude_groups") or ()):
+            return None
+        provider = providers.provider_of(self.chat)
+        if provider is None or not provider.cacheable:
+            return None
+        if getattr(self.chat, "conversation_list", None) is not None and not hasattr(self.chat, "remember"):
+            return None
+        if not self.isFirstTurn(msg):
+            return None
+        conf = getattr(self.config, provider.conf) or {}
+        return ResponseCache.make_key(provider.cls, conf.get("model") or conf.get("model_name"), conf.get("prompt"),
+                                      question)
+
+    def isFirstTurn(self, msg: WxMsg) -> bool:
+        """
+        这条消息是不是发送者在当前对话中的第一轮，并记下发送者
+        群聊的对话按群共用，只要有人聊过就有历史；群里按发送者判断，这个人还没问过时，
+        他的问题（“你是谁”之类的常见问题）不是在追问，可以使用回答缓存
+        """
+        key = self.conversationKey(msg)
+        fresh = providers.is_first_turn(self.chat, key)
+        if not msg.from_group():
+            return fresh
+        if fresh:  # 群对话刚开始（或已被清理），之前记下的发送者作废
+            self.roomAskers.pop(key, None)
+        askers = self.roomAskers.setdefault(key, set())
+        if msg.sender in askers:
             return False
+        askers.add(msg.sender)  # dict.setdefault、set.add 在 GIL 下是原子的，多个通道线程同时调用也安全
+        return True
+
+    def canStream(self) -> bool:
+        """当前模型支持流式输出（有 stream_answer）且配置开启"""
+        return bool(self.config.STREAM.get("enable", True)) and hasattr(self.chat, "stream_answer")
+
+    def streamChitchat(self, msg: WxMsg) -> str:
+        """流式问大模型，边生成边回复，返回完整的回答"""
+        with LLM_SECONDS.time(type(self.chat).__name__):
+            return self.replyStream(msg, self.chat.stream_answer(self.chitchatQuestion(msg), self.conversationKey(msg)))
+
+    def replyStream(self, msg: WxMsg, tokens: Iterable[str]) -> str:
+        """
+        流式回复：大模型边生成，边把完整的句子或段落作为单独的消息发出，缩短等到第一条回复的时间
+        上一条还没发出（发送延迟或被限流推迟）时，新的句子先攒着，下一条一起发，
+        所以一个回答同时最多只有一条在发送队列中，不会因为拆分而多占限流令牌。
+        :return: 完整的回答，没有输出时为空
+        """
+        feed, finish = self.streamReplier(msg)
+        for token in tokens:
+            feed(token)
+        return finish()
+
+    def streamReplier(self, msg: WxMsg) -> Tuple[Callable[[str], None], Callable[[], str]]:
+        """
+        replyStream 的分段发送逻辑，同步和异步的 token 流共用
+        :return: (feed(token) 每收到一段输出调用一次，finish() 输出结束时调用并返回完整的回答)
+        """
+        conf = self.config.STREAM
+        chunker = SentenceChunker(conf.get("min_chars", 50), conf.get("max_chars", 1000))
+        max_messages = max(1, conf.get("max_messages", 5))
+        receiver, at_list = (msg.roomid, msg.sender) if msg.from_group() else (msg.sender, "")
+        # 不经过合并器，避免刚拆开的句子又被合并；先发出合并器里已有的消息，保证顺序
+        self.coalescer.flush(receiver)
+        start = time.perf_counter()
+        held, sent, last = [], [], None
+
+        def feed(token: str) -> None:
+            nonlocal held, last
+            held += chunker.feed(token)
+            # 留一条给结尾，超过条数上限后剩下的全部在最后一条发出
+            if held and (last is None or last.ok is not None) and len(sent) < max_messages - 1:
+                text = "".join(held).strip()
+                held = []
+                if not text:
+                    return
+                if last is None:
+                    LLM_FIRST_SECONDS.observe(time.perf_counter() - start, type(self.chat).__name__)
+                last = self.sendQueue.put(text, receiver, at_list if last is None else "")
+                sent.append(text)
+
+        def finish() -> str:
+            text = ("".join(held) + chunker.flush()).strip()
+            if text:
+                self.sendQueue.put(text, receiver, at_list if last is None else "")
+                sent.append(text)
+            return "\n".join(sent)
+
+        return feed, finish
+
+    @staticmethod
+    def chitchatQuestion(msg: WxMsg) -> str:
+        """去掉 @ 部分，得到要问大模型的问题"""
+        return re.sub(r"@.*?[\u2005|\s]", "", msg.content).replace(" ", "")
+
+    def replyMsg(self, msg: WxMsg, rsp: str) -> SendTicket:
+        """回复消息：群聊中 @ 发送者，私聊直接回复"""
+        if msg.from_group():
+            return self.sendTextMsg(rsp, msg.roomid, msg.sender)
+        return self.sendTextMsg(rsp, msg.sender)
 
-    @is_chengyu_command
-    @is_bot_command
     def processMsg(self, msg: WxMsg) -> None:
         """当接收到消息的时候，会调用本方法。如果不实现本方法，则打印原始消息。
         此处可进行自定义发送的内容,如通过 msg.content 关键字自动获取当前天气信息，并发送到对应的群组@发送者
@@ -264,8 +550,18 @@ class Robot(Job):
         self.sendTextMsg(content, receivers, msg.sender)
         """
 
+        # 机器人指令
+        if msg.type == 0x01:
+            with STAGE_SECONDS.time("command"):
+                if self.runCommand(msg):
+                    return
+
         # 群聊消息
         if msg.from_group():
+            if msg.type == 10000:  # 系统消息，如有人进群、退群，群成员缓存失效
+                self.memberCache.invalidate(msg.roomid)
+                return
+
             # 如果在群里被 @
             if msg.roomid not in self.config.GROUPS:  # 不在配置的响应的群列表里，忽略
                 return
@@ -276,37 +572,162 @@ class Robot(Job):
             return  # 处理完群聊信息，后面就不需要处理了
 
         # 非群聊信息，按消息类型进行处理
-        if msg.type == 37:  # 好友请求
-            self.autoAcceptFriendRequest(msg)
-
-        elif msg.type == 10000:
-            code = self.wcf.send_pat_msg(msg.roomid, msg.sender)
-            # 系统信息
-            self.sayHiToNewFriend(msg)
-        elif msg.type == 922746929:
-            self.LOG.info("执行拍一拍类型")
-            code = self.wcf.send_pat_msg(msg.roomid, msg.sender)
-            self.LOG.info(code)
-        elif msg.type == 0x01:  # 文本消息
-            # 让配置加载更灵活，自己可以更新配置。也可以利用定时任务更新。
-            if msg.from_self():
-                if msg.content == "^更新$":
-                    self.config.reload()
-                    self.LOG.info("已更新")
-            else:
-                self.toChitchat(msg)  # 闲聊
+        handler = self.router.type_handler(msg.type)
+        if handler:
+            handler(msg)
+
+    @on_msg_type(10000)
+    def onSystemMsg(self, msg: WxMsg) -> None:
+        """系统信息"""
+        self.wcf.send_pat_msg(msg.roomid, msg.sender)
+        self.sayHiToNewFriend(msg)
+
+    @on_msg_type(922746929)
+    def onPatMsg(self, msg: WxMsg) -> None:
+        self.LOG.info("执行拍一拍类型")
+        code = self.wcf.send_pat_msg(msg.roomid, msg.sender)
+        self.LOG.info(code)
+
+    @on_msg_type(0x01)
+    def onTextMsg(self, msg: WxMsg) -> None:
+        """文本消息"""
+        # 让配置加载更灵活，自己可以更新配置。也可以利用定时任务更新。
+        if msg.from_self():
+            if msg.content == "^更新$":
+                self.onConfigChanged(self.config.reload())
+                self.LOG.info("已更新")
+        else:
+            self.toChitchat(msg)  # 闲聊
 
     def onMsg(self, msg: WxMsg) -> int:
         try:
             # print(msg.type)
-            self.processMsg(msg)
+            with STAGE_SECONDS.time("process"):
+                self.processMsg(msg)
         except Exception as e:
+            ERRORS.inc(1, "process")
             self.LOG.error(e)
 
         return 0
 
+    def enableMetrics(self) -> None:
+        """注册队列长度、缓存命中等瞬时指标；按配置启动本机指标接口和定时摘要日志"""
+        REGISTRY.gauge("wcfrobot_lane_backlog", "各通道积压的消息数",
+                       lambda: {lane: sum(pool.backlog()) for lane, pool in self.msgLanes.pools.items()}, ("lane",))
+        REGISTRY.gauge("wcfrobot_send_queue_length", "发送队列长度", self.sendQueue.qsize)
+        REGISTRY.gauge("wcfrobot_send_deferred", "因限流推迟发送的消息数",
+                       lambda: self.sendQueue.stats()["deferred_now"])
+        REGISTRY.gauge("wcfrobot_member_cache", "群成员缓存统计",
+                       lambda: {k: self.memberCache.stats()[k] for k in ("rooms", "hits", "misses")}, ("kind",))
+        REGISTRY.gauge("wcfrobot_chat_merged", "防抖合并节省的闲聊处理次数", lambda: self.debouncer.stats()["saved"])
+        REGISTRY.gauge("wcfrobot_sends_saved", "合并消息节省的发送次数", lambda: self.coalescer.stats()["saved"])
+        REGISTRY.gauge("wcfrobot_user_cache", "用户缓存统计",
+                       lambda: {k: db.user_cache.stats()[k] for k in ("size", "hits", "misses", "evictions")},
+                       ("kind",))
+        REGISTRY.gauge("wcfrobot_history", "消息记录写入统计",
+                       lambda: {k: db.history.stats()[k] for k in ("queued", "written", "dropped", "failed")},
+                       ("kind",))
+        if self.responseCache:
+            REGISTRY.gauge("wcfrobot_response_cache", "大模型回答缓存统计",
+                           lambda: {k: self.responseCache.stats()[k]
+                                    for k in ("size", "hits", "misses", "hit_rate", "saved_seconds")},
+                           ("kind",))
+        REGISTRY.gauge("wcfrobot_conversations", "对话记录统计",
+                       lambda: {k: CONVERSATIONS.stats()[k] for k in ("size", "spilled", "loaded", "dropped")},
+                       ("kind",))
+        REGISTRY.gauge("wcfrobot_dedup_duplicates", "重复消息数", lambda: self.dedup.stats()["duplicates"])
+        REGISTRY.gauge("wcfrobot_contacts", "联系人数", lambda: len(self.contacts))
+
+        conf = self.config.METRICS
+        if not conf.get("enable", False):
+            return
+        start_http_server(conf.get("port", 9108), conf.get("host", "127.0.0.1"))
+        self.onEveryMinutes(conf.get("summary_minutes", 5), self.logMetrics)
+
+    def logMetrics(self) -> None:
+        """打印一行各阶段耗时摘要"""
+        summary = REGISTRY.summary()
+        if summary:
+            self.LOG.info(f"指标摘要：{summary}")
+
     def enableRecvMsg(self) -> None:
-        self.wcf.enable_recv_msg(self.onMsg)
+        self.msgLanes.start()
+        self.wcf.enable_recv_msg(self.intakeMsg)
+
+    @staticmethod
+    def conversationKey(msg: WxMsg) -> str:
+        """会话标识：群聊为 roomid，私聊为 sender"""
+        return msg.roomid if msg.from_group() else msg.sender
+
+    def classifyMsg(self, msg: WxMsg) -> Optional[str]:
+        """
+        消息分道：管理员、普通指令、成语接龙、大模型闲聊
+        :return: 通道名，None 表示不需要处理的消息（例如群里没有 @ 机器人的聊天）
+        """
+        if msg.sender in self.config.ROOTIDS:
+            return LANE_ADMIN
+        if msg.type != 0x01:
+            return LANE_COMMAND
+
+        matched = self.router.match(msg.content)
+        if matched:
+            return matched[0].lane or LANE_COMMAND
+
+        if msg.from_group():
+            if msg.roomid not in self.config.GROUPS or not msg.is_at(self.wxid):
+                return None
+            return LANE_CHAT
+
+        return LANE_COMMAND if msg.from_self() else LANE_CHAT
+
+    def onMsgShed(self, msg: WxMsg, lane: str, reason: str) -> None:
+        """消息因排队过多被丢弃时，按通道配置回复“稍后再试”"""
+        self.LOG.warning(f"{lane} 通道繁忙，丢弃 {self.conversationKey(msg)} 的消息（{reason}）")
+        lanes = self.config.WORKER_POOL.get("busy_reply_lanes", [LANE_CHENGYU, LANE_CHAT])
+        if lane not in lanes or msg.from_self():
+            return
+
+        self.replyMsg(msg, self.config.WORKER_POOL.get("busy_reply", "消息太多啦，请稍后再试"))
+
+    def holdChitchat(self, msg: WxMsg, lane: Optional[str]) -> bool:
+        """
+        闲聊防抖：需要调用大模型的闲聊先缓存，同一个人紧接着发的文本（群里通常不再 @）追加进去，
+        安静一段时间后合并成一条处理。指令等其他通道的消息不经过防抖。
+        :return: 是否已被缓存
+        """
+        if msg.type != 0x01 or msg.from_self():
+            return False
+        if lane == LANE_CHAT:
+            return self.debouncer.hold(msg, start=True)
+        if lane is None:
+            return self.debouncer.hold(msg, start=False)
+        return False
+
+    def onDebounced(self, msg: WxMsg) -> None:
+        """防抖合并后的闲聊进入闲聊通道"""
+        self.msgLanes.submit(msg, LANE_CHAT)
+
+    def dispatchMsg(self, msg: WxMsg) -> None:
+        """按通道把消息交给线程池，同一会话内保持顺序，不同会话并行处理"""
+        lane = self.classifyMsg(msg)
+        if self.holdChitchat(msg, lane):
+            return
+        if lane is None:
+            self.msgLanes.ignore()
+            return
+        self.msgLanes.submit(msg, lane)
+
+    def intakeMsg(self, msg: WxMsg) -> int:
+        """收到消息的入口：重连或两种收消息方式同时开启时可能收到重复消息，按消息 id 去重后再分发"""
+        if self.dedup.seen(msg.id):
+            self.LOG.debug(f"忽略重复消息：{msg.id}")
+            MESSAGES.inc(1, "duplicate")
+            return 0
+        if self.history:
+            self.history.append(self.conversationKey(msg), msg.sender, msg.content, msg.type, msg.id,
+                                ts=msg.ts or None)
+        self.dispatchMsg(msg)
+        return 0
 
     def enableReceivingMsg(self) -> None:
         def innerProcessMsg(wcf: Wcf):
@@ -315,32 +736,30 @@ class Robot(Job):
                     msg = wcf.get_msg()
                     # 信息打印
                     # self.LOG.info(msg)
-                    self.processMsg(msg)
+                    self.intakeMsg(msg)
                 except Empty:
                     continue  # Empty message
                 except Exception as e:
                     self.LOG.error(f"Receiving message error: {e}")
 
+        self.msgLanes.start()
         self.wcf.enable_receiving_msg()
         Thread(target=innerProcessMsg, name="GetMessage", args=(self.wcf,), daemon=True).start()
 
-    def sendTextMsg(self, msg: str, receiver: str, at_list: str = "") -> None:
-        """ 发送消息
+    def sendTextMsg(self, msg: str, receiver: str, at_list: str = "") -> SendTicket:
+        """ 发送消息，入队后立即返回，由发送线程负责延迟、限流和发送
+        超过发送速率限制的消息会推迟发送，而不是直接丢弃；短时间内发给同一接收人的消息会合并成一条
         :param msg: 消息字符串
         :param receiver: 接收人wxid或者群id
         :param at_list: 要@的wxid, @所有人的wxid为：notify@all
+        :return: 发送句柄，需要确认送达时调用 wait()
         """
-        # 随机延迟0.3-1.3秒，并且一分钟内发送限制
-        time.sleep(float(str(time.time()).split('.')[-1][-2:]) / 100.0 + 0.3)
-        now = time.time()
-        if self.config.SEND_RATE_LIMIT > 0:
-            # 清除超过1分钟的记录
-            self._msg_timestamps = [t for t in self._msg_timestamps if now - t < 60]
-            if len(self._msg_timestamps) >= self.config.SEND_RATE_LIMIT:
-                self.LOG.warning("发送消息过快，已达到每分钟" + self.config.SEND_RATE_LIMIT + "条上限。")
-                return
-            self._msg_timestamps.append(now)
+        return self.coalescer.put(msg, receiver, at_list)
 
+    def _sendTextNow(self, msg: str, receiver: str, at_list: str = "") -> bool:
+        """ 在发送线程中调用，真正发送消息，限流已由发送队列处理
+        :return: 是否已发送
+        """
         # msg 中需要有 @ 名单中一样数量的 @
         ats = ""
         if at_list:
@@ -348,25 +767,54 @@ class Robot(Job):
                 ats = " @所有人"
             else:
                 wxids = at_list.split(",")
-                for wxid in wxids:
-                    # 根据 wxid 查找群昵称
-                    ats += f" @{self.wcf.get_alias_in_chatroom(wxid, receiver)}"
+                with SEND_SECONDS.time("alias"):
+                    for wxid in wxids:
+                        # 根据 wxid 查找群昵称
+                        ats += f" @{self.memberCache.get_alias(wxid, receiver)}"
 
         # {msg}{ats} 表示要发送的消息内容后面紧跟@，例如 北京天气情况为：xxx @张三
-        if ats == "":
-            # self.LOG.info(f"To {receiver}: {msg}")
-            self.wcf.send_text(f"{msg}", receiver, at_list)
-        else:
-            # self.LOG.info(f"To {receiver}: {ats}\r{msg}")
-            self.wcf.send_text(f"{ats}\n\n{msg}", receiver, at_list)
+        with SEND_SECONDS.time("wcf"):
+            if ats == "":
+                # self.LOG.info(f"To {receiver}: {msg}")
+                ret = self.wcf.send_text(f"{msg}", receiver, at_list)
+            else:
+                # self.LOG.info(f"To {receiver}: {ats}\r{msg}")
+                ret = self.wcf.send_text(f"{ats}\n\n{msg}", receiver, at_list)
+        if ret == 0 and self.history:
+            self.history.append(receiver, self.wxid, msg, outgoing=True)
+        return ret == 0
 
     def getAllContacts(self) -> dict:
         """
         获取联系人（包括好友、公众号、服务号、群成员……）
         格式: {"wxid": "NickName"}
+        联系人由 self.contacts 在后台维护，这里返回当前快照的副本
+        """
+        return self.contacts.to_dict()
+
+    def runOnce(self, name: str, task: Callable[..., Any], *args, period: str = "%Y%m%d%H%M", **kwargs) -> Any:
+        """
+        定时广播等任务的包装：多账号模式下同一时段只由一个账号执行
+        :param period: 时段格式，见 Coordinator.claim；每天执行的任务用 "%Y%m%d"，
+                       避免各账号时钟相差超过一分钟时重复发送
         """
-        contacts = self.wcf.query_sql("MicroMsg.db", "SELECT UserName, NickName FROM Contact;")
-        return {contact["UserName"]: contact["NickName"] for contact in contacts}
+        if self.coordinator and not self.coordinator.claim(name, period):
+            return None
+        return task(*args, **kwargs)
+
+    def healthStats(self) -> dict:
+        """汇总处理量、积压和发送情况，多账号模式下作为心跳上报"""
+        pools = [s for lane, s in self.msgLanes.stats().items() if lane != "ignored"]
+        send = self.sendQueue.stats()
+        return {
+            "processed": sum(sum(s["processed"]) for s in pools),
+            "dropped": sum(sum(s["dropped"]) for s in pools),
+            "backlog": sum(sum(s["backlog"]) for s in pools),
+            "sent": send["sent"],
+            "failed": send["failed"],
+            "send_queue": send["queue_length"],
+            "sends_saved": self.coalescer.stats()["saved"],
+        }
 
     def keepRunningAndBlockProcess(self) -> None:
         """
@@ -376,6 +824,7 @@ class Robot(Job):
             self.runPendingJobs()
             time.sleep(1)
 
+    @on_msg_type(37)  # 好友请求
     def autoAcceptFriendRequest(self, msg: WxMsg) -> None:
         self.LOG.debug("开始处理好友申请")
         try:
@@ -392,22 +841,29 @@ class Robot(Job):
         nickName = re.findall(r"你已添加了(.*)，现在可以开始聊天了。", msg.content)
         if nickName:
             # 添加了好友，更新好友列表
-            self.allContacts[msg.sender] = nickName[0]
+            self.contacts.add(msg.sender, nickName[0])
             self.sendTextMsg(f"Hi {nickName[0]}，我自动通过了你的好友请求。", msg.sender)
 
-    def newsReport(self, msg: WxMsg) -> None:
-        # receivers = self.config.NEWS
-        # if not receivers:
-        #     return
+    @command("#新闻", desc="隔夜新闻：#新闻", cost=1)
+    def newsReport(self, msg: WxMsg = None, text: str = "") -> None:
+        """指令触发时回复给发送者；定时任务调用时（msg 为空）发给配置的新闻接收人"""
+        if msg is None:
+            receivers = self.config.NEWS
+            if not receivers:
+                return
+        elif msg.from_group():
+            receivers = [msg.roomid]
+        else:
+            receivers = [msg.sender]
+
+        from base.func_news import News
 
         news = News().get_important_news()
-        # for r in receivers:
-        if msg.from_group():
-            self.sendTextMsg(news, msg.roomid)
-        else:
-            self.sendTextMsg(news, msg.sender)
+        for r in receivers:
+            self.sendTextMsg(news, r)
 
-    def get_all_type_msg(self) -> dict:
+    @command("#类型", desc="导出消息类型：#类型", admin_only=True)
+    def get_all_type_msg(self, msg: WxMsg = None, text: str = "") -> dict:
         """
         获取所有消息类型并将其保存到outtype.json中
         """
@@ -427,11 +883,14 @@ class Robot(Job):
             self.LOG.warning("未配置天气城市代码或接收人")
             return
 
+        from base.func_weather import Weather
+
         report = Weather(self.config.CITY_CODE).get_weather()
         for r in receivers:
             self.sendTextMsg(report, r)
 
-    def get_friend_info(self):
+    @command("#friendList", desc="导出联系人：#friendList", admin_only=True)
+    def get_friend_info(self, msg: WxMsg = None, text: str = ""):
         """
         获取联系人并保存为json文件
         @return:
@@ -439,3 +898,31 @@ class Robot(Job):
         res = self.wcf.get_contacts()
         with open("friendsInfo.json", 'w', encoding='utf-8') as f:
             json.dump(res, f, ensure_ascii=False, indent=4)
+
+    @command("#性能", desc="性能分析：#性能 秒数 [内存]", admin_only=True, prefix=True)
+    def botProfile(self, msg: WxMsg, text: str = "") -> None:
+        """
+        对所有线程采样分析若干秒，结果写成折叠栈文件，并把热点函数回复给管理员
+        例如：#性能 30 内存
+        """
+        if self.profiler.busy():
+            self.replyMsg(msg, "已有性能分析在进行")
+            return
+
+        args = text.split()
+        max_seconds = self.config.PROFILER.get("max_seconds", 120)
+        seconds = next((int(a) for a in args if a.isdigit()), self.config.PROFILER.get("seconds", 10))
+        seconds = max(1, min(seconds, max_seconds))
+        trace_memory = any(a in ("内存", "mem") for a in args)
+
+        def _run():
+            try:
+                res = self.profiler.run(seconds, trace_memory, top=self.config.PROFILER.get("top", 8))
+                self.replyMsg(msg, format_summary(res))
+            except Exception as e:
+                self.LOG.error(f"性能分析出错：{e}")
+                self.replyMsg(msg, f"性能分析出错：{e}")
+
+        # 在后台线程中采样，不占用管理员通道
+        Thread(target=_run, name="Profiler", daemon=True).start()
+        self.replyMsg(msg, f"开始性能分析，{seconds} 秒后回复结果")
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from queue import Empty
+from typing import Any, Callable, Dict, Optional
+
+from wcferry import Wcf, WxMsg
+
+import db
+from configuration import Config
+from core.metrics import ERRORS, LLM_SECONDS, MESSAGES, STAGE_SECONDS
+from core.msg_lanes import DEFAULT_LANES, LANE_CHAT, LANES
+from core.worker_pool import SHED_FULL, SHED_STALE
+from robot import Robot
+
+
+class AsyncRobot(Robot):
+    """asyncio 模式的机器人
+
+    收消息、大模型闲聊、定时任务都跑在一个事件循环上：闲聊按会话排队，每个会话一个协程，
+    大模型调用优先用各模型的 get_answer_async / stream_answer_async，同时进行中的调用数由 max_inflight 限制；
+    wcf、数据库等阻塞调用放到有界线程池中执行。指令、成语接龙等很快的消息仍走原来的通道线程池。
+    """
+
+    def __init__(self, config: Config, wcf: Wcf, chat_type: int) -> None:
+        super().__init__(config, wcf, chat_type)
+        conf = self.config.ASYNC_MODE
+        self.executor = ThreadPoolExecutor(max_workers=conf.get("executor_workers", 8),
+                                           thread_name_prefix="AsyncExecutor")
+        self.maxInflight = conf.get("max_inflight", 200)
+        self.convQueueSize = conf.get("conversation_queue", 20)
+        chat_conf = {**DEFAULT_LANES[LANE_CHAT], **((self.config.WORKER_POOL.get("lanes") or {}).get(LANE_CHAT) or {})}
+        self.chatMaxAge = chat_conf.get("max_age", 0)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Optional[asyncio.Semaphore] = None
+        self._inflightCount = 0  # 只在事件循环中修改
+        self._convQueues: Dict[str, asyncio.Queue] = {}
+        self._chatShed = 0
+        self._chatDone = 0
+
+    async def runBlocking(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在有界线程池中执行阻塞调用"""
+        return await self.loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def askAsync(self, question: str, key: str) -> str:
+        """调用大模型，支持 asyncio 的模型直接 await，其余放到线程池"""
+        ask = getattr(self.chat, "get_answer_async", None)
+        start = time.perf_counter()
+        try:
+            if ask:
+                return await ask(question, key)
+            return await self.runBlocking(self.chat.get_answer, question, key)
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - start, type(self.chat).__name__)
+
+    async def answerChitchatAsync(self, msg: WxMsg) -> str:
+        """answerChitchat 的 asyncio 版本"""
+        question = self.chitchatQuestion(msg)
+        cacheKey, rsp = self.cachedAnswer(msg, question)
+        if rsp:
+            return rsp
+
+        start = time.perf_counter()
+        if self.canStream() and hasattr(self.chat, "stream_answer_async"):
+            rsp = await self.streamChitchatAsync(msg)
+        else:
+            # 没有异步流式接口的模型不流式输出：同步的生成器会整段占住线程池，线程池还要处理积分等数据库调用
+            rsp = await self.askAsync(question, self.conversationKey(msg))
+            if rsp:
+                self.replyMsg(msg, rsp)
+        self.storeAnswer(cacheKey, rsp, start)
+        return rsp
+
+    async def streamChitchatAsync(self, msg: WxMsg) -> str:
+        """streamChitchat 的 asyncio 版本，用模型的 stream_answer_async，不占用线程"""
+        feed, finish = self.streamReplier(msg)
+        tokens = self.chat.stream_answer_async(self.chitchatQuestion(msg), self.conversationKey(msg))
+        with LLM_SECONDS.time(type(self.chat).__name__):
+            async for token in tokens:
+                feed(token)
+        return finish()
+
+    async def toChitchatAsync(self, msg: WxMsg) -> bool:
+        """toAt / toChitchat 的 asyncio 版本"""
+        if msg.from_group():
+            await self.runBlocking(db.get_or_create_user_by_wechat_id, msg.sender)
+
+        if not self.chat:  # 没接 ChatGPT，固定回复
+            self.replyMsg(msg, "你@我干嘛？")
+            return True
+
+        reservation = await self.runBlocking(self.reserveChitchat, msg)
+        if not reservation:
+            return False
+        try:
+            async with self._inflight:
+                self._inflightCount += 1
+                try:
+                    rsp = await self.answerChitchatAsync(msg)
+                finally:
+                    self._inflightCount -= 1
+        except BaseException:  # 包括被取消
+            reservation.refund()
+            raise
+        return self.settleChitchat(reservation, rsp)
+
+    def dispatchMsg(self, msg: WxMsg) -> None:
+        """闲聊进入按会话排队的协程，其余消息仍交给通道线程池"""
+        lane = self.classifyMsg(msg)
+        if self.holdChitchat(msg, lane):
+            return
+        if lane is None:
+            self.msgLanes.ignore()
+            return
+        if lane != LANE_CHAT:
+            self.msgLanes.submit(msg, lane)
+            return
+        self._enqueueChat(msg)
+
+    def onDebounced(self, msg: WxMsg) -> None:
+        # 在防抖线程中回调，交回事件循环
+        self.loop.call_soon_threadsafe(self._enqueueChat, msg)
+
+    def _enqueueChat(self, msg: WxMsg) -> None:
+        MESSAGES.inc(1, LANE_CHAT)
+        key = self.conversationKey(msg)
+        q = self._convQueues.get(key)
+        if q is None:
+            q = self._convQueues[key] = asyncio.Queue(maxsize=self.convQueueSize)
+            self.loop.create_task(self._conversation(key, q))
+        try:
+            q.put_nowait((time.time(), msg))
+        except asyncio.QueueFull:
+            self._chatShed += 1
+            self.onMsgShed(msg, LANE_CHAT, SHED_FULL)
+
+    async def _conversation(self, key: str, q: asyncio.Queue) -> None:
+        """按顺序处理一个会话的闲聊，队列空了就退出"""
+        while True:
+            try:
+                enqueued_at, msg = q.get_nowait()
+            except asyncio.QueueEmpty:
+                del self._convQueues[key]
+                return
+
+            if self.chatMaxAge and time.time() - enqueued_at > self.chatMaxAge:
+                self._chatShed += 1
+                self.onMsgShed(msg, LANE_CHAT, SHED_STALE)
+                continue
+
+            start = time.perf_counter()
+            try:
+                await self.toChitchatAsync(msg)
+            except Exception as e:
+                ERRORS.inc(1, "chitchat")
+                self.LOG.error(f"处理 {key} 的消息出错：{e}")
+            finally:
+                self._chatDone += 1
+                STAGE_SECONDS.observe(time.perf_counter() - start, "chitchat")
+
+    def _getMsg(self) -> Optional[WxMsg]:
+        try:
+            return self.wcf.get_msg()
+        except Empty:
+            return None
+
+    async def _intake(self) -> None:
+        # 单独一个线程阻塞读取消息队列，不占用有界线程池
+        reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="GetMessage")
+        self.wcf.enable_receiving_msg()
+        while self.wcf.is_receiving_msg():
+            msg = await self.loop.run_in_executor(reader, self._getMsg)
+            if msg is None:
+                continue
+            try:
+                self.intakeMsg(msg)
+            except Exception as e:
+                self.LOG.error(f"Receiving message error: {e}")
+
+    async def _jobs(self) -> None:
+        while True:
+            await self.runBlocking(self.runPendingJobs)
+            await asyncio.sleep(1)
+
+    async def _main(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._inflight = asyncio.Semaphore(self.maxInflight)
+        self.msgLanes.start(lanes=[lane for lane in LANES if lane != LANE_CHAT])
+        await asyncio.gather(self._intake(), self._jobs())
+
+    def enableReceivingMsg(self) -> None:
+        """asyncio 模式下由 runForever 负责收消息"""
+        pass
+
+    def runForever(self) -> None:
+        """启动事件循环，收消息并执行定时任务，阻塞直到进程退出"""
+        asyncio.run(self._main())
+
+    def asyncStats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self._convQueues),
+            "inflight": self._inflightCount,
+            "max_inflight": self.maxInflight,
+            "chat_shed": self._chatShed,
+        }
+
+    def healthStats(self) -> Dict[str, Any]:
+        stats = super().healthStats()
+        stats["processed"] += self._chatDone
+        stats["dropped"] += self._chatShed
+        stats["backlog"] += sum(q.qsize() for q in list(self._convQueues.values()))
+        return stats
@@ -0,0 +1,208 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing as mp
+import os
+import time
+from argparse import ArgumentParser
+from queue import Empty
+from threading import Thread
+from typing import Any, Dict
+
+from configuration import Config
+from constants import ChatType
+from core.metrics import REGISTRY, start_http_server
+
+PWD = os.path.dirname(os.path.abspath(__file__))
+
+
+def _worker(account: dict, chat_type: int, use_async: bool, shared_dir: str, workdir: str,
+            heartbeats: mp.Queue, heartbeat_seconds: int) -> None:
+    """worker 进程入口：在账号自己的工作目录中运行一个完整的机器人"""
+    # 日志、成语接龙进度、导出的 json 等相对路径文件按账号分开
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    from core.coordinator import Coordinator
+    from main import main
+
+    name = account["name"]
+
+    def setup(robot) -> None:
+        robot.coordinator = Coordinator(shared_dir, name)
+
+        def beat() -> None:
+            heartbeats.put((name, os.getpid(), time.time(), robot.healthStats()))
+
+        beat()
+        robot.onEverySeconds(heartbeat_seconds, beat)
+
+    main(chat_type, use_async, account, setup)
+
+
+class Supervisor(object):
+    """多账号模式：每个微信账号一个 worker 进程
+
+    成语索引等只读数据生成一次，各进程内存映射同一份文件；
+    定时广播通过 Coordinator 认领，同一时段只由一个账号发送；
+    worker 定时上报心跳，supervisor 汇总各账号的健康状况和吞吐，进程退出后按退避时间重启。
+    """
+
+    def __init__(self, config: Config, chat_type: int, use_async: bool = False) -> None:
+        self.LOG = logging.getLogger("Supervisor")
+        self.config = config
+        self.chatType = chat_type
+        self.useAsync = use_async
+        conf = config.SUPERVISOR
+        self.sharedDir = os.path.join(PWD, conf.get("shared_dir", "shared"))
+        self.workdir = os.path.join(PWD, conf.get("workdir", "accounts"))
+        self.heartbeatSeconds = conf.get("heartbeat_seconds", 30)
+        self.staleSeconds = conf.get("stale_seconds", 120)
+        self.reportMinutes = conf.get("report_minutes", 5)
+        self.restartMaxDelay = conf.get("restart_max_delay", 60)
+
+        names = [a.get("name") for a in config.ACCOUNTS]
+        if not names or not all(names) or len(set(names)) != len(names):
+            raise ValueError("accounts 未配置，或账号 name 为空、重复")
+
+        metrics_port = config.METRICS.get("port", 9108)
+        self.accounts: Dict[str, dict] = {}
+        for i, account in enumerate(config.ACCOUNTS):
+            account = dict(account)
+            if config.METRICS.get("enable", False):
+                account.setdefault("metrics_port", metrics_port + 1 + i)  # supervisor 占用配置的端口
+            self.accounts[account["name"]] = account
+
+        # Windows 只支持 spawn，其他平台也用 spawn，行为保持一致
+        self.ctx = mp.get_context("spawn")
+        self.heartbeats = self.ctx.Queue()
+        self.processes: Dict[str, Any] = {}
+        self.restarts = {name: 0 for name in self.accounts}
+        self.startedAt = {name: 0.0 for name in self.accounts}
+        self.nextStart = {name: 0.0 for name in self.accounts}
+        self.health: Dict[str, Dict[str, Any]] = {name: {} for name in self.accounts}
+        self._running = False
+
+    def prepareSharedData(self) -> None:
+        """生成各 worker 共享的只读数据，worker 通过环境变量找到它们"""
+        from base.func_chengyu import SHARED_DIR_ENV
+
+        os.makedirs(self.sharedDir, exist_ok=True)
+        os.environ[SHARED_DIR_ENV] = self.sharedDir  # 子进程继承
+        # 在 worker 启动前生成好，worker 首次使用成语词典时直接映射
+        from base.func_chengyu import build_chengyu_index
+        build_chengyu_index(self.sharedDir)
+        # 城市代码表 base/main_city.json 只供填写 weather.city_code 时查阅，程序不加载，worker 中没有它的副本，无需共享
+
+    def _spawn(self, name: str) -> None:
+        account = self.accounts[name]
+        p = self.ctx.Process(target=_worker, name=f"Worker-{name}",
+                             args=(account, self.chatType, self.useAsync, self.sharedDir,
+                                   os.path.join(self.workdir, name), self.heartbeats, self.heartbeatSeconds))
+        p.start()
+        self.processes[name] = p
+        self.startedAt[name] = time.time()
+        self.LOG.info(f"账号 {name} 已启动，pid {p.pid}")
+
+    def _collect(self) -> None:
+        """接收 worker 心跳"""
+        while self._running:
+            try:
+                name, pid, ts, stats = self.heartbeats.get(timeout=1)
+            except Empty:
+                continue
+            last = self.health.get(name) or {}
+            rate = 0.0
+            if last.get("pid") == pid and ts > last["ts"]:
+                rate = (stats["processed"] - last["stats"]["processed"]) * 60 / (ts - last["ts"])
+            self.health[name] = {"pid": pid, "ts": ts, "stats": stats, "rate": rate}
+
+    def _check(self) -> None:
+        """重启退出的 worker，连续崩溃时退避"""
+        now = time.time()
+        for name in self.accounts:
+            p = self.processes.get(name)
+            if p is not None and p.is_alive():
+                continue
+            if p is not None:
+                self.processes[name] = None
+                # 运行超过一分钟才退出的视为偶发，退避从头开始
+                self.restarts[name] = 0 if now - self.startedAt[name] > 60 else self.restarts[name] + 1
+                delay = min(self.restartMaxDelay, 2 ** self.restarts[name])
+                self.nextStart[name] = now + delay
+                self.LOG.error(f"账号 {name} 退出（exitcode {p.exitcode}），{delay} 秒后重启")
+            if now >= self.nextStart[name]:
+                self._spawn(name)
+
+    def isUp(self, name: str) -> bool:
+        p = self.processes.get(name)
+        h = self.health.get(name) or {}
+        return bool(p and p.is_alive() and h.get("pid") == p.pid and time.time() - h["ts"] <= self.staleSeconds)
+
+    def healthReport(self) -> Dict[str, Dict[str, Any]]:
+        res = {}
+        for name in self.accounts:
+            h = self.health.get(name) or {}
+            res[name] = {"up": self.isUp(name), "pid": h.get("pid"), "restarts": self.restarts[name],
+                         "rate_per_minute": round(h.get("rate", 0.0), 1), **(h.get("stats") or {})}
+        return res
+
+    def logReport(self) -> None:
+        lines = []
+        for name, h in self.healthReport().items():
+            if not h["up"]:
+                lines.append(f"{name}：离线（重启 {h['restarts']} 次）")
+                continue
+            lines.append(f"{name}：pid {h['pid']}，处理 {h['processed']} 条（{h['rate_per_minute']} 条/分），"
+                         f"发送 {h['sent']}，失败 {h['failed']}，积压 {h['backlog']}，丢弃 {h['dropped']}")
+        self.LOG.info("账号状态：" + "；".join(lines))
+
+    def registerMetrics(self) -> None:
+        REGISTRY.gauge("wcfrobot_account_up", "账号 worker 是否在线", lambda: {
+            (name,): int(self.isUp(name)) for name in self.accounts}, ("account",))
+        REGISTRY.gauge("wcfrobot_account_restarts", "账号 worker 连续重启次数", lambda: {
+            (name,): n for name, n in self.restarts.items()}, ("account",))
+        REGISTRY.gauge("wcfrobot_account_stat", "账号 worker 心跳上报的统计", lambda: {
+            (name, k): v for name, h in self.health.items() for k, v in (h.get("stats") or {}).items()},
+                       ("account", "stat"))
+
+    def run(self) -> None:
+        self.prepareSharedData()
+        self._running = True
+        Thread(target=self._collect, name="Heartbeats", daemon=True).start()
+        self.registerMetrics()
+        if self.config.METRICS.get("enable", False):
+            start_http_server(self.config.METRICS.get("port", 9108), self.config.METRICS.get("host", "127.0.0.1"))
+
+        next_report = time.time() + self.reportMinutes * 60
+        try:
+            while True:
+                self._check()
+                if time.time() >= next_report:
+                    self.logReport()
+                    next_report = time.time() + self.reportMinutes * 60
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.LOG.info("正在停止所有账号···")
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 10) -> None:
+        # Ctrl+C 同时发给了 worker，由它们自己清理 wcf 后退出
+        self._running = False
+        for name, p in self.processes.items():
+            if p is None:
+                continue
+            p.join(timeout)
+            if p.is_alive():
+                self.LOG.warning(f"账号 {name} 未按时退出，强制结束")
+                p.terminate()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="多账号模式：按 config.yaml 的 accounts 为每个账号启动一个进程")
+    parser.add_argument('-c', type=int, default=0, help=f'选择模型参数序号: {ChatType.help_hint()}')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='worker 使用 asyncio 模式运行')
+    args = parser.parse_args()
+    Supervisor(Config(), args.c, args.use_async).run()
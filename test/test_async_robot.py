@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from robot import Robot
+from robot_async import AsyncRobot
+
+
+class FakeChat(object):
+    def __init__(self) -> None:
+        self.asked = []
+
+    def stream_answer(self, question, wxid):
+        raise AssertionError("asyncio 模式不应调用同步的流式接口")
+
+    async def stream_answer_async(self, question, wxid):
+        self.asked.append((question, wxid))
+        for token in ("第一句。", "第二句。"):
+            await asyncio.sleep(0)
+            yield token
+
+
+class FakeSendQueue(object):
+    def __init__(self) -> None:
+        self.sent = []
+
+    def put(self, msg, receiver, at_list=""):
+        self.sent.append((msg, receiver, at_list))
+        return SimpleNamespace(ok=True)
+
+
+class StreamChitchatAsyncTest(unittest.TestCase):
+    def make(self, chat):
+        robot = AsyncRobot.__new__(AsyncRobot)
+        robot.chat = chat
+        robot.config = SimpleNamespace(STREAM={"min_chars": 1}, RESPONSE_CACHE={})
+        robot.responseCache = None
+        robot.sendQueue = FakeSendQueue()
+        robot.coalescer = SimpleNamespace(flush=lambda receiver: None)
+
+        async def no_blocking(*args, **kwargs):
+            raise AssertionError("流式回复不应占用线程池")
+
+        robot.runBlocking = no_blocking
+        return robot
+
+    def test_streams_without_thread_pool(self):
+        chat = FakeChat()
+        robot = self.make(chat)
+        msg = SimpleNamespace(content="你好", sender="u", roomid="", from_group=lambda: False)
+        rsp = asyncio.run(robot.answerChitchatAsync(msg))
+        self.assertEqual(rsp, "第一句。\n第二句。")
+        self.assertEqual(robot.sendQueue.sent, [("第一句。", "u", ""), ("第二句。", "u", "")])
+        self.assertEqual(chat.asked, [("你好", Robot.conversationKey(msg))])
+
+
+if __name__ == "__main__":
+    unittest.main()
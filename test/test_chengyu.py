@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from base import func_chengyu
+from base.func_chengyu import SHARED_DIR_ENV, Chengyu
+
+CSV = """chengyu\tpingyin\tjieshi\tchuchu\tlizi
+一马当先\tyī mǎ dāng xiān\t作战时策马冲锋在前。\t明·施耐庵《水浒全传》\t无
+先见之明\txiān jiàn zhī míng\t事先看清问题的能力。\t无\t
+"""
+
+
+class GetMeaningTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        csv_file = os.path.join(self.dir, "chengyu.csv")
+        with open(csv_file, "w", encoding="utf-8") as fp:
+            fp.write(CSV)
+        self.patch = mock.patch.object(func_chengyu, "CSV_FILE", csv_file)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def check(self, cy):
+        self.assertEqual(cy.getMeaning("一马当先"),
+                         "一马当先\nyī mǎ dāng xiān\n作战时策马冲锋在前。\n出处：明·施耐庵《水浒全传》")
+        self.assertEqual(cy.getMeaning("先见之明"), "先见之明\nxiān jiàn zhī míng\n事先看清问题的能力。")
+        self.assertIsNone(cy.getMeaning("不是成语"))
+
+    def test_shared_index(self):
+        shared = os.path.join(self.dir, "shared")
+        with mock.patch.dict(os.environ, {SHARED_DIR_ENV: shared}):
+            self.check(Chengyu())
+
+    def test_dataframe(self):
+        with mock.patch.dict(os.environ, {SHARED_DIR_ENV: ""}):
+            self.check(Chengyu())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+
+from core.chunker import SentenceChunker, chunk_stream
+
+
+def split_tokens(text, rnd):
+    """把文本随机切成 1~4 个字符的 token，模拟流式输出"""
+    tokens, i = [], 0
+    while i < len(text):
+        n = rnd.randint(1, 4)
+        tokens.append(text[i:i + n])
+        i += n
+    return tokens
+
+
+class SentenceChunkerTest(unittest.TestCase):
+    def test_round_trip_and_max_chars(self):
+        rnd = random.Random(3)
+        alphabet = "你好abc 。！？!?；…\n”’」）.\"'"
+        for _ in range(300):
+            text = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 80)))
+            min_chars, max_chars = rnd.randint(1, 6), rnd.randint(1, 12)
+            chunks = list(chunk_stream(split_tokens(text, rnd), min_chars, max_chars))
+            self.assertEqual("".join(chunks), text)
+            bound = max(min_chars, max_chars)
+            for chunk in chunks:
+                self.assertLessEqual(len(chunk), bound, (text, min_chars, max_chars, chunks))
+
+    def test_closers_stay_with_sentence(self):
+        chunks = list(chunk_stream(["他说：“好的。", "”然后", "走了。"], min_chars=1))
+        self.assertEqual(chunks, ["他说：“好的。”", "然后走了。"])
+
+    def test_closers_do_not_exceed_max_chars(self):
+        chunker = SentenceChunker(min_chars=1, max_chars=5)
+        self.assertEqual(chunker.feed("一二三四。”」）后"), ["一二三四。"])
+        self.assertEqual(chunker.flush(), "”」）后")
+
+    def test_min_chars_merges_short_sentences(self):
+        chunks = list(chunk_stream(["好。", "是的。", "这句话比较长。", "完"], min_chars=6))
+        self.assertEqual(chunks, ["好。是的。这句话比较长。", "完"])
+
+    def test_period_needs_following_space(self):
+        chunks = list(chunk_stream(["Pi is 3.14 roughly. ", "Done"], min_chars=1))
+        self.assertEqual(chunks, ["Pi is 3.14 roughly.", " Done"])
+
+    def test_forced_cut_without_punctuation(self):
+        chunker = SentenceChunker(min_chars=2, max_chars=4)
+        self.assertEqual(chunker.feed("abcdefghij"), ["abcd", "efgh"])
+        self.assertEqual(chunker.flush(), "ij")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import random
+import tracemalloc
+import unittest
+
+from core.contact_directory import ContactDirectory, _Snapshot
+
+
+def random_contacts(n, seed=11):
+    rnd = random.Random(seed)
+    chars = "abcXYZ张三李四😀"
+    return {f"wxid_{rnd.randrange(10 ** 9):09d}": "".join(rnd.choice(chars) for _ in range(rnd.randint(0, 6)))
+            for _ in range(n)}
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_matches_dict(self):
+        contacts = random_contacts(500)
+        snapshot = _Snapshot(contacts)
+        self.assertEqual(len(snapshot), len(contacts))
+        self.assertEqual(snapshot.to_dict(), contacts)
+        for wxid, name in contacts.items():
+            self.assertEqual(snapshot.get(wxid), name)
+        self.assertIsNone(snapshot.get("wxid_missing"))
+        self.assertNotIn("", snapshot)
+
+        for prefix in ("", "a", "A", "张", "😀", "xyz", "q"):
+            expected = sorted(((w, n) for w, n in contacts.items() if n.lower().startswith(prefix.lower())),
+                              key=lambda p: p[1].lower())
+            found = snapshot.search(prefix, 1000)
+            self.assertEqual(sorted(found), sorted(expected))
+            self.assertEqual([n.lower() for _, n in found], [n.lower() for _, n in expected])
+            self.assertEqual(len(snapshot.search(prefix, 3)), min(3, len(expected)))
+
+    def test_smaller_than_dict(self):
+        contacts = random_contacts(20000)
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            snapshot = _Snapshot(contacts)
+            compact = tracemalloc.get_traced_memory()[0] - base
+            base = tracemalloc.get_traced_memory()[0]
+            copied = snapshot.to_dict()
+            plain = tracemalloc.get_traced_memory()[0] - base
+        finally:
+            tracemalloc.stop()
+        self.assertLess(compact * 2, plain)
+
+
+class ContactDirectoryTest(unittest.TestCase):
+    def test_len_counts_updated_contacts_once(self):
+        directory = ContactDirectory(wcf=None)
+        directory._snapshot = _Snapshot({"a": "A", "b": "B"})
+        directory.add("b", "B2")  # 已在快照中，改昵称
+        directory.add("c", "C")
+        self.assertEqual(len(directory), 3)
+        self.assertEqual(directory.get("b"), "B2")
+        self.assertEqual(directory.to_dict(), {"a": "A", "b": "B2", "c": "C"})
+
+
+if __name__ == "__main__":
+    unittest.main()
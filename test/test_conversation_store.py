@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest import mock
+
+from core.conversation_store import ConversationStore
+
+
+def msg(role, content="", **kwargs):
+    return {"role": role, "content": content, **kwargs}
+
+
+class TrimTest(unittest.TestCase):
+    def test_keeps_tool_calls_with_their_results(self):
+        store = ConversationStore(max_turns=1, max_tokens=0)
+        view = store.namespace("ChatGLM")
+        history = [
+            msg("system", "prompt"),
+            msg("user", "几点了"),
+            msg("assistant", tool_calls=[{"id": "1"}]),
+            msg("tool", "10:00", tool_call_id="1"),
+            msg("assistant", "十点"),
+            msg("user", "天气"),
+            msg("assistant", tool_calls=[{"id": "2"}]),
+            msg("tool", "晴", tool_call_id="2"),
+        ]
+        view["u"] = history
+        self.assertEqual([m["role"] for m in view["u"]], ["system", "user", "assistant", "tool"])
+        self.assertEqual(view["u"][1]["content"], "天气")
+
+    def test_token_limit_drops_whole_turns(self):
+        store = ConversationStore(max_turns=0, max_tokens=10)
+        view = store.namespace("ChatGPT")
+        view["u"] = [msg("system", "p"), msg("user", "一二三四五"), msg("assistant", "六七八九十"),
+                     msg("user", "甲乙"), msg("assistant", tool_calls=[]), msg("tool", "丙丁")]
+        self.assertEqual([m["content"] for m in view["u"]], ["p", "甲乙", "", "丙丁"])
+        self.assertEqual(store.stats()["trimmed"], 2)
+
+    def test_newest_turn_is_kept(self):
+        store = ConversationStore(max_turns=0, max_tokens=1)
+        view = store.namespace("ChatGPT")
+        view["u"] = [msg("user", "很长的问题"), msg("assistant", "很长的回答")]
+        self.assertEqual(len(view["u"]), 2)
+
+    def test_trims_after_append_only(self):
+        store = ConversationStore(max_turns=2, max_tokens=0)
+        view = store.namespace("ZhiPu")
+        view["u"] = [msg("user", "1"), msg("assistant", "1")]
+        with mock.patch.object(store, "_trim", wraps=store._trim) as trim:
+            for _ in range(5):
+                view["u"]
+            self.assertEqual(trim.call_count, 0)  # 没有变化，读取时不重新裁剪
+            for i in range(2, 5):
+                view["u"].append(msg("user", str(i)))
+                view["u"].append(msg("assistant", str(i)))
+            view["u"]
+        self.assertEqual([m["content"] for m in view["u"]], ["3", "3", "4", "4"])
+
+    def test_ollama_context_resets(self):
+        store = ConversationStore(max_tokens=3)
+        view = store.namespace("Ollama")
+        view["u"] = [1, 2]
+        view["u"] = [1, 2, 3, 4]  # Ollama 每次回答后整个替换 token 上下文
+        self.assertNotIn("u", view)
+        self.assertEqual(store.stats()["resets"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
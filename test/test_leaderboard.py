@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+
+from db.engine import Database
+from db.leaderboard import Leaderboard, PointsRanking, _SkipList
+from db.models import User
+
+
+class SkipListTest(unittest.TestCase):
+    def test_matches_sorted_list(self):
+        rnd = random.Random(7)
+        skip, keys = _SkipList(), []
+        for _ in range(2000):
+            key = rnd.randint(0, 300)
+            if key in keys and rnd.random() < 0.5:
+                self.assertTrue(skip.remove(key))
+                keys.remove(key)
+            elif key not in keys:
+                skip.insert(key)
+                keys.append(key)
+            keys.sort()
+            probe = rnd.randint(-1, 301)
+            self.assertEqual(skip.count_less(probe), sum(1 for k in keys if k < probe))
+        self.assertEqual(skip.size, len(keys))
+        self.assertEqual(skip.head_keys(10), keys[:10])
+        self.assertFalse(skip.remove(1000))
+
+
+class LeaderboardTest(unittest.TestCase):
+    def test_competition_ranking(self):
+        board = Leaderboard([("a", 10), ("b", 30), ("c", 10), ("d", 5)])
+        self.assertEqual(board.top(10), [(1, "b", 30), (2, "a", 10), (2, "c", 10), (4, "d", 5)])
+        self.assertEqual(board.rank("c"), 2)
+        board.set("d", 40)
+        self.assertEqual(board.rank("d"), 1)
+        self.assertEqual(board.rank("b"), 2)
+        self.assertIsNone(board.rank("x"))
+        self.assertEqual(len(board), 4)
+
+
+class PointsRankingTest(unittest.TestCase):
+    def setUp(self):
+        database = Database("sqlite://")
+        database.bootstrap()
+        session = database.Session()
+        session.add_all([User(wechat_id=w, points=p) for w, p in (("a", 10), ("b", 20), ("c", 30))])
+        session.commit()
+        session.close()
+        self.ranking = PointsRanking(database.Session, reload_seconds=0)
+
+    def test_incremental_updates(self):
+        self.assertEqual(self.ranking.rank("a"), (3, 10, 3))
+        self.ranking.update_points("a", 25)
+        self.assertEqual(self.ranking.rank("a"), (1, 35, 3))
+        self.ranking.update_points("new", 5, created=True)
+        self.assertEqual(self.ranking.rank("new"), (4, 5, 4))
+        self.ranking.update_points("ghost", 5)  # 不在榜上也不是新用户，忽略
+        self.assertIsNone(self.ranking.rank("ghost"))
+
+    def test_group_board_follows_member_snapshot(self):
+        members = {"a": "A", "b": "B"}
+        self.assertEqual([w for _, w, _ in self.ranking.top(10, "room", members)], ["b", "a"])
+        self.ranking.update_points("a", 100)  # 增量更新同步到群排名
+        self.assertEqual(self.ranking.rank("a", "room", members), (1, 110, 2))
+        # 名单换成新对象（群成员缓存写时复制）后重建群排名
+        members = {**members, "c": "C"}
+        self.assertEqual(self.ranking.rank("c", "room", members), (2, 30, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
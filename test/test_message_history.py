@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from db.engine import Database
+from db.message_history import MessageHistory
+from db.models import Message
+
+
+class PruneTest(unittest.TestCase):
+    def setUp(self):
+        database = Database("sqlite://")
+        database.bootstrap()
+        self.Session = database.Session
+        self.history = MessageHistory(self.Session, retention_days=1, prune_minutes=0, prune_chunk=10)
+
+    def insert(self, ids, ts):
+        session = self.Session()
+        session.add_all([Message(id=i, ts=ts, roomid="room", sender="a", type=1, content="x", outgoing=False)
+                         for i in ids])
+        session.commit()
+        session.close()
+
+    def remaining(self):
+        session = self.Session()
+        ids = [i for i, in session.query(Message.id).order_by(Message.id)]
+        session.close()
+        return ids
+
+    def test_deletes_old_chunks_and_stops_at_new(self):
+        old, new = time.time() - 3 * 86400, time.time()
+        # 旧记录跨多段且 id 有空洞，新记录跟在后面
+        self.insert(list(range(1, 26)) + list(range(100, 105)), old)
+        self.insert(range(105, 140), new)
+        self.assertEqual(self.history.prune(), 30)
+        self.assertEqual(self.remaining(), list(range(105, 140)))
+        self.assertEqual(self.history.prune(), 0)
+        self.assertEqual(self.history.stats()["pruned"], 30)
+
+    def test_empty_table(self):
+        self.assertEqual(self.history.prune(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from db import db_operations
+from db.cache import UserCache, UserRow
+from db.engine import Database
+from db.leaderboard import PointsRanking
+from db.models import User
+from db.point_ledger import PointLedger
+
+
+class Recorder(object):
+    """记录 update_points 的调用"""
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def update_points(self, wechat_id, delta, created=False):
+        self.calls.append((wechat_id, delta, created))
+
+
+class PointLedgerTest(unittest.TestCase):
+    def setUp(self):
+        # 用临时文件而不是内存数据库：内存数据库只有一个连接，测不出多线程同时扣分
+        self.dir = tempfile.mkdtemp()
+        self.database = Database("sqlite:///" + os.path.join(self.dir, "ledger.db"))
+        self.database.bootstrap()
+        self.setPoints("a", 10)
+        self.recorder = Recorder()
+        # flush_ms 设得很大，后台线程不会在测试中途写入，由测试自己调用 flush
+        self.ledger = PointLedger(self.database.Session, flush_ms=3600 * 1000, listeners=[self.recorder])
+
+    def tearDown(self):
+        self.ledger.flush()  # 否则退出时 atexit 写入已删除的临时目录
+        self.database.writer.dispose()
+        self.database.reader.dispose()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def setPoints(self, wechat_id, points):
+        session = self.database.Session()
+        if not session.query(User).filter(User.wechat_id == wechat_id).update({User.points: points}):
+            session.add(User(wechat_id=wechat_id, points=points))
+        session.commit()
+        session.close()
+
+    def points(self, wechat_id):
+        session = self.database.Session()
+        user = session.query(User).filter(User.wechat_id == wechat_id).first()
+        session.close()
+        return user.points if user else None
+
+    def test_concurrent_reserve_cannot_overdraw(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            for _ in range(5):
+                results.append(self.ledger.reserve("a", 1))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sum(1 for r in results if r), 10)
+        self.assertEqual(self.points("a"), 0)
+
+    def test_reserve_uses_pending_and_refund(self):
+        self.setPoints("a", 0)
+        self.assertIsNone(self.ledger.reserve("a", 1))
+        self.ledger.add("a", 2)  # 未写入数据库的积分也可以用
+        reservation = self.ledger.reserve("a", 1)
+        self.assertIsNotNone(reservation)
+        self.assertEqual(self.points("a"), 1)
+        self.assertEqual(self.ledger.pending("a"), 0)
+
+        reservation.refund()  # 失败退回，重复退回无效
+        reservation.refund()
+        self.assertEqual(self.ledger.pending("a"), 1)
+        self.ledger.flush()
+        self.assertEqual(self.points("a"), 2)
+
+        committed = self.ledger.reserve("a", 2)
+        committed.commit()
+        committed.refund()  # 已确认的不再退回
+        self.ledger.flush()
+        self.assertEqual(self.points("a"), 0)
+
+    def test_failed_reserve_keeps_pending(self):
+        self.setPoints("a", 0)
+        self.ledger.add("a", 1)
+        self.assertIsNone(self.ledger.reserve("a", 5))
+        self.assertEqual(self.ledger.pending("a"), 1)
+
+    def test_failed_flush_is_requeued(self):
+        self.ledger.add("a", 3)
+        with mock.patch("sqlalchemy.orm.Session.commit", side_effect=OperationalError("commit", {}, None)):
+            self.ledger.flush()
+        self.assertEqual(self.ledger.pending("a"), 3)
+        self.assertEqual(self.points("a"), 10)
+        self.assertEqual(self.recorder.calls, [])
+
+        self.ledger.add("a", 2)  # 下次写入时合并
+        self.ledger.flush()
+        self.assertEqual(self.ledger.pending("a"), 0)
+        self.assertEqual(self.points("a"), 15)
+        self.assertEqual(self.recorder.calls, [("a", 5, False)])
+
+    def test_listeners_receive_created(self):
+        self.ledger.add("a", 1)
+        self.ledger.add("new", 4)
+        self.ledger.flush()
+        self.assertEqual(sorted(self.recorder.calls), [("a", 1, False), ("new", 4, True)])
+        self.assertEqual(self.points("new"), 4)
+
+    def test_get_points_includes_pending(self):
+        user_cache = UserCache()
+        ranking = PointsRanking(self.database.Session, reload_seconds=0)
+        # 和 db.init 一样，账本写入后同步用户缓存和排行榜
+        self.ledger.listeners = [user_cache, ranking]
+        with mock.patch.multiple(db_operations, Session=self.database.Session, user_cache=user_cache,
+                                 ranking=ranking, ledger=self.ledger):
+            self.assertEqual(db_operations.get_points("a"), 10)
+            self.ledger.add("a", 5)
+            self.assertEqual(db_operations.get_points("a"), 15)  # 缓存中的 10 加上未写入的 5
+            self.ledger.flush()
+            self.assertEqual(db_operations.get_points("a"), 15)  # 写入后缓存已同步，不重复计算
+            self.assertEqual(ranking.rank("a")[1], 15)
+
+
+class GetOrCreateUserTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.database = Database("sqlite:///" + os.path.join(self.dir, "users.db"))
+        self.database.bootstrap()
+        self.user_cache = UserCache()
+        self.ranking = PointsRanking(self.database.Session, reload_seconds=0)
+        self.patch = mock.patch.multiple(db_operations, Session=self.database.Session, user_cache=self.user_cache,
+                                         ranking=self.ranking)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.database.writer.dispose()
+        self.database.reader.dispose()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_insert_conflict_requeries(self):
+        other = {"done": False}
+
+        def insert_first(session, flush_context, instances):
+            # 模拟另一个通道在本次查询之后、提交之前插入了同一个用户
+            if not other["done"]:
+                other["done"] = True
+                s = self.database.Session()
+                s.add(User(wechat_id="new", points=7))
+                s.commit()
+                s.close()
+
+        event.listen(self.database.Session, "before_flush", insert_first)
+        try:
+            row = db_operations.get_or_create_user_by_wechat_id("new")
+        finally:
+            event.remove(self.database.Session, "before_flush", insert_first)
+        self.assertEqual(row.points, 7)
+        self.assertEqual(self.user_cache.get("new").points, 7)
+
+    def test_concurrent_first_messages(self):
+        barrier = threading.Barrier(6)
+        rows, errors = [], []
+
+        def worker():
+            barrier.wait()
+            try:
+                rows.append(db_operations.get_or_create_user_by_wechat_id("new"))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(rows), 6)
+        session = self.database.Session()
+        self.assertEqual(session.query(User).filter(User.wechat_id == "new").count(), 1)
+        session.close()
+
+
+class UserCacheLoadTest(unittest.TestCase):
+    def test_change_during_load_is_not_cached(self):
+        cache = UserCache()
+
+        def loader():
+            cache.update_points("a", 5)  # 读数据库期间账本写入了积分，读到的是旧值
+            return UserRow("a", 10, False, False)
+
+        self.assertEqual(cache.load("a", loader).points, 10)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.load("a", lambda: UserRow("a", 15, False, False)).points, 15)
+        self.assertEqual(cache.get("a").points, 15)
+
+    def test_invalidate_all_during_load(self):
+        cache = UserCache()
+
+        def loader():
+            cache.invalidate()
+            return UserRow("a", 1, False, False)
+
+        cache.load("a", loader)
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from types import SimpleNamespace
+
+from core.response_cache import ResponseCache
+from robot import Robot
+
+
+class ZhiPu(object):
+    """和内置的 ZhiPu 同名，按类名找到对应的 Provider"""
+
+    def __init__(self) -> None:
+        self.conversation_list = {}
+        self.remembered = []
+
+    def remember(self, question, answer, wxid):
+        self.remembered.append((question, answer, wxid))
+        self.conversation_list.setdefault(wxid, []).extend([question, answer])
+
+
+def group_msg(sender, content="你是谁"):
+    return SimpleNamespace(content=content, sender=sender, roomid="room", from_group=lambda: True)
+
+
+class GroupCacheTest(unittest.TestCase):
+    def setUp(self):
+        robot = Robot.__new__(Robot)
+        robot.chat = ZhiPu()
+        robot.config = SimpleNamespace(RESPONSE_CACHE={}, ZhiPu={"model": "glm-4"})
+        robot.responseCache = ResponseCache(max_size=10, ttl=60)
+        robot.roomAskers = {}
+        robot.replies = []
+        robot.replyMsg = lambda msg, rsp: robot.replies.append((msg.sender, rsp))
+        self.robot = robot
+
+    def test_hit_in_group_with_history(self):
+        robot = self.robot
+        key, rsp = robot.cachedAnswer(group_msg("a"), "你是谁")
+        self.assertIsNotNone(key)
+        self.assertIsNone(rsp)
+        robot.storeAnswer(key, "我是机器人", 0)
+        robot.chat.conversation_list["room"] = ["你是谁", "我是机器人"]  # a 的这一轮已在群对话中
+
+        # 群里已有历史，b 第一次问同样的问题仍然命中
+        key, rsp = robot.cachedAnswer(group_msg("b"), "你是谁呀")
+        self.assertEqual(rsp, "我是机器人")
+        self.assertEqual(robot.replies, [("b", "我是机器人")])
+        self.assertEqual(robot.chat.remembered, [("你是谁呀", "我是机器人", "room")])
+        self.assertEqual(robot.responseCache.stats()["hits"], 1)
+
+        # a 接着问是追问，不使用缓存
+        self.assertEqual(robot.cachedAnswer(group_msg("a"), "你是谁"), (None, None))
+
+    def test_new_group_conversation_resets_askers(self):
+        robot = self.robot
+        self.assertTrue(robot.isFirstTurn(group_msg("a")))
+        robot.chat.conversation_list["room"] = ["q", "a"]
+        self.assertFalse(robot.isFirstTurn(group_msg("a")))
+        del robot.chat.conversation_list["room"]  # 群对话被清理后重新开始
+        self.assertTrue(robot.isFirstTurn(group_msg("a")))
+
+    def test_private_chat_uses_conversation_history(self):
+        robot = self.robot
+        msg = SimpleNamespace(content="你是谁", sender="a", roomid="", from_group=lambda: False)
+        self.assertTrue(robot.isFirstTurn(msg))
+        self.assertTrue(robot.isFirstTurn(msg))
+        robot.chat.conversation_list["a"] = ["q", "a"]
+        self.assertFalse(robot.isFirstTurn(msg))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+from queue import Empty
+
+from core.rate_limiter import RateLimiter, TokenBucket
+from core.send_queue import SendQueue
+
+
+class FakeClock(object):
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(60, 2, now=0)  # 每秒一个，最多攒两个
+        for _ in range(2):
+            self.assertEqual(bucket.wait_time(0), 0)
+            bucket.consume()
+        self.assertAlmostEqual(bucket.wait_time(0), 1.0)
+        self.assertAlmostEqual(bucket.wait_time(0.5), 0.5)
+        self.assertEqual(bucket.wait_time(1), 0)
+        self.assertTrue(bucket.is_idle(10))
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_receiver_limit(self):
+        limiter = RateLimiter(receiver_limit=60, burst=1, clock=self.clock)
+        self.assertEqual(limiter.acquire("a"), 0)
+        self.assertAlmostEqual(limiter.acquire("a"), 1.0)
+        self.assertEqual(limiter.acquire("b"), 0)  # 其他接收人不受影响
+        self.clock.advance(1)
+        self.assertEqual(limiter.acquire("a"), 0)
+
+    def test_global_limit_does_not_consume_when_waiting(self):
+        limiter = RateLimiter(global_limit=60, receiver_limit=60, burst=1, clock=self.clock)
+        self.assertEqual(limiter.acquire("a"), 0)
+        self.assertGreater(limiter.acquire("b"), 0)  # 全局桶空了
+        self.clock.advance(1)
+        self.assertEqual(limiter.acquire("b"), 0)  # b 的桶没有被上次失败的尝试扣掉
+
+    def test_group_override_and_configure(self):
+        limiter = RateLimiter(receiver_limit=60, receiver_limits={"room": 0}, burst=1, clock=self.clock)
+        for _ in range(5):
+            self.assertEqual(limiter.acquire("room"), 0)  # 0 表示不限制
+        limiter.configure(receiver_limit=0)
+        for _ in range(5):
+            self.assertEqual(limiter.acquire("a"), 0)
+
+
+class SendQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sent = []
+
+    def make_queue(self, limiter=None, **kwargs) -> SendQueue:
+        def sender(msg, receiver, at_list):
+            self.sent.append((receiver, msg))
+            return True
+
+        return SendQueue(sender, delay_min=0, delay_max=0, limiter=limiter, clock=self.clock, **kwargs)
+
+    @staticmethod
+    def pump(queue: SendQueue) -> None:
+        """不启动发送线程，按假时钟处理所有已到期的消息"""
+        while queue.qsize() or (queue._schedule and queue._schedule[0][0] <= queue._clock()):
+            try:
+                ticket, retry = queue._next()
+            except Empty:
+                return
+            queue._process(ticket, retry)
+
+    def test_stop_does_not_block_on_full_queue(self):
+        release = threading.Event()
+
+        def sender(msg, receiver, at_list):
+            release.wait(5)
+            self.sent.append((receiver, msg))
+            return True
+
+        queue = SendQueue(sender, queue_size=1, delay_min=0, delay_max=0)
+        queue.start()
+        thread = queue._thread
+        first = queue.put("0", "a")
+        while queue.qsize():  # 等发送线程取走第一条，卡在发送中
+            time.sleep(0.01)
+        queue.put("1", "a")  # 队列已满
+        start = time.time()
+        queue.stop(timeout=0.1)
+        self.assertLess(time.time() - start, 1)
+
+        release.set()  # 发送线程发完队列中的消息后自行退出
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(first.ok)
+        self.assertEqual(self.sent, [("a", "0"), ("a", "1")])
+
+    def test_sends_in_order_without_limiter(self):
+        queue = self.make_queue()
+        tickets = [queue.put(str(i), "a") for i in range(3)]
+        self.pump(queue)
+        self.assertEqual(self.sent, [("a", "0"), ("a", "1"), ("a", "2")])
+        self.assertTrue(all(t.ok for t in tickets))
+
+    def test_deferred_keeps_per_receiver_order(self):
+        limiter = RateLimiter(receiver_limit=60, burst=1, clock=self.clock)
+        queue = self.make_queue(limiter)
+        for i in range(3):
+            queue.put(f"a{i}", "a")
+        queue.put("b0", "b")
+        self.pump(queue)
+        # a 只有一个令牌，后两条推迟；b 不受 a 的限流影响
+        self.assertEqual(self.sent, [("a", "a0"), ("b", "b0")])
+        self.assertEqual(queue.stats()["deferred_now"], 2)
+
+        queue.put("a3", "a")  # 新消息排在已推迟的后面
+        self.pump(queue)
+        self.assertEqual(len(self.sent), 2)
+
+        for _ in range(3):
+            self.clock.advance(1)
+            self.pump(queue)
+        self.assertEqual([m for r, m in self.sent if r == "a"], ["a0", "a1", "a2", "a3"])
+        self.assertEqual(queue.stats()["deferred_now"], 0)
+        self.assertFalse(queue._deferred)
+
+    def test_max_defer_drops_stale(self):
+        limiter = RateLimiter(receiver_limit=1, burst=1, clock=self.clock)  # 每分钟一条
+        queue = self.make_queue(limiter, max_defer=10)
+        queue.put("first", "a")
+        late = queue.put("late", "a")
+        self.pump(queue)
+        self.assertEqual(self.sent, [("a", "first")])
+        self.assertFalse(late.ok)  # 需要等 60 秒，超过 max_defer
+        self.assertEqual(queue.stats()["dropped"], 1)
+        self.assertEqual(queue.stats()["deferred_now"], 0)
+
+    def test_max_deferred_drops_new(self):
+        limiter = RateLimiter(receiver_limit=60, burst=1, clock=self.clock)
+        queue = self.make_queue(limiter, max_defer=0, max_deferred=2)
+        tickets = [queue.put(str(i), "a") for i in range(4)]
+        self.pump(queue)
+        self.assertTrue(tickets[0].ok)
+        self.assertIsNone(tickets[1].ok)
+        self.assertIsNone(tickets[2].ok)
+        self.assertFalse(tickets[3].ok)  # 推迟队列已满
+        self.assertEqual(queue.stats()["dropped"], 1)
+
+        for _ in range(2):
+            self.clock.advance(1)
+            self.pump(queue)
+        self.assertEqual([m for _, m in self.sent], ["0", "1", "2"])
+
+    def test_queue_full_rejects(self):
+        queue = self.make_queue(queue_size=1)
+        self.assertIsNone(queue.put("1", "a").ok)
+        self.assertFalse(queue.put("2", "a").ok)
+        self.assertEqual(queue.stats()["rejected"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
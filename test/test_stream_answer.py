@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import random
+import unittest
+from types import SimpleNamespace
+
+from base.func_chatgpt import ChatGPT, clean_stream
+from base.func_zhipu import ZhiPu
+
+
+def take_answer(rsp):
+    """ChatGPT._take_answer 对完整回答做的清理"""
+    rsp = rsp[2:] if rsp.startswith("\n\n") else rsp
+    return rsp.replace("\n\n", "\n")
+
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class CleanStreamTest(unittest.TestCase):
+    def test_same_as_take_answer(self):
+        rnd = random.Random(5)
+        for _ in range(500):
+            text = "".join(rnd.choice("ab\n\n\n") for _ in range(rnd.randint(0, 20)))
+            deltas, i = [], 0
+            while i < len(text):
+                n = rnd.randint(1, 3)
+                deltas.append(text[i:i + n])
+                i += n
+            self.assertEqual("".join(clean_stream(deltas)), take_answer(text), repr(text))
+
+    def test_leading_newlines_split_across_chunks(self):
+        self.assertEqual(list(clean_stream(["\n", "\n你好", "\n", "\n世界"])), ["你好", "\n世界"])
+
+
+class ChatGPTAsyncStreamTest(unittest.TestCase):
+    def test_stream_answer_async(self):
+        async def create(**kwargs):
+            async def gen():
+                for c in ("\n", "\n你好", "\n\n", "世界"):
+                    yield chunk(c)
+            return gen()
+
+        chat = ChatGPT.__new__(ChatGPT)
+        chat.model = "gpt"
+        chat.conversation_list = {}
+        chat.system_content_msg = {"role": "system", "content": "prompt"}
+        chat._aclient = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+        async def collect():
+            return [t async for t in chat.stream_answer_async("hi", "u")]
+
+        self.assertEqual("".join(asyncio.run(collect())), "你好\n世界")
+        self.assertEqual(chat.conversation_list["u"][-1], {"role": "assistant", "content": "你好\n世界"})
+
+
+class ZhiPuStreamTest(unittest.TestCase):
+    def make(self, create):
+        zhipu = ZhiPu.__new__(ZhiPu)
+        zhipu.model = "glm-4"
+        zhipu.LOG = SimpleNamespace(error=lambda *_: None)
+        zhipu.conversation_list = {}
+        zhipu.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        return zhipu
+
+    def test_error_mid_stream(self):
+        def create(**kwargs):
+            yield chunk("你好")
+            raise ConnectionError("断开")
+
+        zhipu = self.make(create)
+        self.assertEqual(list(zhipu.stream_answer("hi", "u")), ["你好", "\n发生未知错误：断开"])
+        # 不完整的回答不记入对话
+        self.assertEqual(zhipu.conversation_list["u"], [{"role": "user", "content": "hi"}])
+
+    def test_stream_records_answer(self):
+        zhipu = self.make(lambda **kwargs: iter([chunk("你"), chunk(None), chunk("好")]))
+        self.assertEqual("".join(zhipu.stream_answer("hi", "u")), "你好")
+        self.assertEqual(zhipu.conversation_list["u"][-1], {"role": "assistant", "content": "你好"})
+
+
+if __name__ == "__main__":
+    unittest.main()